@@ -4,24 +4,28 @@ Instagram投稿文生成アプリ
 """
 
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl import load_workbook
-import pdfplumber
-import json
-import os
-import io
-import re
 import time
-import base64
 from datetime import datetime, timedelta, date as date_type
 from pathlib import Path
 
-# Google Generative AI
-import google.generativeai as genai
+from igcaption.fetch import fetch_product_page
+from igcaption.extract import extract_text_from_file
+from igcaption.storage import LocalClientStore, get_github_store
+from igcaption.llm import GenerationRequest, configure_provider, get_provider
+from igcaption.models import DEFAULT_MODEL, model_settings
+from igcaption.ratelimit import (
+    call_with_backoff, estimate_tokens, DEFAULT_RPM, DEFAULT_TPM, DEFAULT_CONCURRENCY,
+)
+from igcaption.prompt_budget import DEFAULT_PROMPT_BUDGET
+from igcaption.jobs import get_job_store, get_job_runner, JOB_DONE, JOB_FAILED
+from igcaption.schedule import (
+    WEEKDAY_NAMES, POST_TYPES, ALL_EVENTS, get_suggested_events,
+    generate_schedule_weekday, build_assignments,
+)
+from igcaption.pipeline import run_generation_job, job_results, regenerate_post
+from igcaption.xlsx import create_xlsx_schedule
+from igcaption.export import iter_csv, iter_jsonl, clipboard_tsv
+from igcaption.telemetry import STAGE_LABELS
 
 # ── 設定 ──────────────────────────────────────────
 CLIENTS_DIR = Path(__file__).parent / "clients"
@@ -34,209 +38,71 @@ GITHUB_BRANCH = st.secrets.get("GITHUB_BRANCH", "main")
 GITHUB_CLIENTS_DIR = "clients"
 USE_GITHUB_STORAGE = bool(GITHUB_TOKEN)
 
+# Gemini API レート制御設定
+GEMINI_RPM = int(st.secrets.get("GEMINI_RPM", DEFAULT_RPM))
+GEMINI_TPM = int(st.secrets.get("GEMINI_TPM", DEFAULT_TPM))
+GENERATION_CONCURRENCY = int(st.secrets.get("GENERATION_CONCURRENCY", DEFAULT_CONCURRENCY))
+# 1投稿あたりのプロンプトのトークン上限（超えた分はサンプル投稿文・商品情報の末尾から削る）
+PROMPT_TOKEN_BUDGET = int(st.secrets.get("PROMPT_TOKEN_BUDGET", DEFAULT_PROMPT_BUDGET))
+# 生成プロバイダー（gemini / offline / record / replay）とカセットの保存先。未設定なら環境変数か既定値
+LLM_PROVIDER = st.secrets.get("LLM_PROVIDER", "")
+LLM_CASSETTE = st.secrets.get("LLM_CASSETTE", "")
+
+# 一括生成ジョブの進捗を確認する間隔（秒）と、開き直したときに直近のジョブへ接続する期間（時間）
+JOB_POLL_SECONDS = 1.0
+JOB_ATTACH_HOURS = 12
+
 st.set_page_config(
     page_title="Instagram投稿文ジェネレーター",
     page_icon="📸",
     layout="wide",
 )
 
-WEEKDAY_NAMES = ["月", "火", "水", "木", "金", "土", "日"]
-
-# 投稿タイプ定義
-POST_TYPES = {
-    "single": "📷 単品紹介",
-    "collection": "📸 集合カット（複数商品）",
-    "brand": "💎 ブランドコンセプト",
-}
-
-# ── 季節イベント定義 ──────────────────────────────────
-SEASONAL_EVENTS_BY_MONTH = {
-    1: ["元旦・新年", "成人の日"],
-    2: ["バレンタインデー", "節分"],
-    3: ["ホワイトデー", "ひな祭り", "春分の日", "卒業・新生活準備"],
-    4: ["イースター", "新生活シーズン", "花粉・ゆらぎ肌対策"],
-    5: ["母の日", "ゴールデンウィーク", "紫外線対策"],
-    6: ["父の日", "梅雨・湿気対策"],
-    7: ["七夕", "夏本番・UV対策"],
-    8: ["お盆", "夏バテ対策", "残暑ケア"],
-    9: ["敬老の日", "秋分の日", "秋のスキンケア"],
-    10: ["ハロウィン", "乾燥対策シーズン"],
-    11: ["ブラックフライデー", "いい肌の日(11/8)"],
-    12: ["クリスマス", "年末・冬の保湿ケア"],
-}
-
-ALL_EVENTS = []
-for month, events in sorted(SEASONAL_EVENTS_BY_MONTH.items()):
-    for ev in events:
-        if ev not in ALL_EVENTS:
-            ALL_EVENTS.append(ev)
-
-
-def get_suggested_events(post_date):
-    month = post_date.month
-    events = list(SEASONAL_EVENTS_BY_MONTH.get(month, []))
-    prev_month = 12 if month == 1 else month - 1
-    next_month = 1 if month == 12 else month + 1
-    for ev in SEASONAL_EVENTS_BY_MONTH.get(prev_month, []):
-        if ev not in events:
-            events.append(ev)
-    for ev in SEASONAL_EVENTS_BY_MONTH.get(next_month, []):
-        if ev not in events:
-            events.append(ev)
-    return events
-
-
-# ── GitHub API ヘルパー ──────────────────────────────
-def _gh_headers():
-    return {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-
-
-def _gh_get_file(filepath):
-    """GitHub上のファイルを取得。(content_dict, error) を返す"""
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{filepath}?ref={GITHUB_BRANCH}"
-    resp = requests.get(url, headers=_gh_headers(), timeout=10)
-    if resp.status_code == 200:
-        return resp.json(), None
-    elif resp.status_code == 404:
-        return None, None
-    else:
-        return None, f"GitHub API error {resp.status_code}"
-
 
-def _gh_put_file(filepath, content_bytes, message, sha=None):
-    """GitHub上にファイルを作成/更新"""
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{filepath}"
-    body = {
-        "message": message,
-        "content": base64.b64encode(content_bytes).decode("ascii"),
-        "branch": GITHUB_BRANCH,
-    }
-    if sha:
-        body["sha"] = sha
-    resp = requests.put(url, headers=_gh_headers(), json=body, timeout=10)
-    return resp.status_code in (200, 201)
-
-
-def _gh_delete_file(filepath, sha, message):
-    """GitHub上のファイルを削除"""
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{filepath}"
-    body = {
-        "message": message,
-        "sha": sha,
-        "branch": GITHUB_BRANCH,
-    }
-    resp = requests.delete(url, headers=_gh_headers(), json=body, timeout=10)
-    return resp.status_code == 200
-
-
-def _gh_list_dir(dirpath):
-    """GitHub上のディレクトリ内ファイル一覧を取得"""
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{dirpath}?ref={GITHUB_BRANCH}"
-    resp = requests.get(url, headers=_gh_headers(), timeout=10)
-    if resp.status_code == 200:
-        return resp.json(), None
-    elif resp.status_code == 404:
-        return [], None
-    else:
-        return [], f"GitHub API error {resp.status_code}"
+# ── クライアントプロフィール管理 ──────────────────────
+def get_client_store():
+    if USE_GITHUB_STORAGE:
+        return get_github_store(GITHUB_TOKEN, GITHUB_REPO, GITHUB_BRANCH, GITHUB_CLIENTS_DIR)
+    return LocalClientStore(CLIENTS_DIR)
 
 
-# ── クライアントプロフィール管理 ──────────────────────
 def load_client_list():
-    if USE_GITHUB_STORAGE:
-        files, err = _gh_list_dir(GITHUB_CLIENTS_DIR)
-        if err:
-            st.warning(f"クライアント一覧取得エラー: {err}")
-            return {}
-        clients = {}
-        for f in files:
-            if f["name"].endswith(".json"):
-                cid = f["name"].replace(".json", "")
-                # ファイル内容を取得して名前を読む
-                file_data, _ = _gh_get_file(f"{GITHUB_CLIENTS_DIR}/{f['name']}")
-                if file_data and "content" in file_data:
-                    try:
-                        raw = base64.b64decode(file_data["content"]).decode("utf-8")
-                        data = json.loads(raw)
-                        clients[cid] = data.get("name", cid)
-                    except Exception:
-                        clients[cid] = cid
-                else:
-                    clients[cid] = cid
-        return clients
-    else:
-        clients = {}
-        for f in CLIENTS_DIR.glob("*.json"):
-            with open(f, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                clients[f.stem] = data.get("name", f.stem)
-        return clients
+    clients, err = get_client_store().list_clients()
+    if err:
+        st.warning(f"クライアント一覧取得エラー: {err}")
+        return {}
+    return clients
 
 
 def load_client(client_id):
-    if USE_GITHUB_STORAGE:
-        filepath = f"{GITHUB_CLIENTS_DIR}/{client_id}.json"
-        file_data, err = _gh_get_file(filepath)
-        if err:
-            st.warning(f"クライアント読込エラー: {err}")
-            return None
-        if file_data and "content" in file_data:
-            try:
-                raw = base64.b64decode(file_data["content"]).decode("utf-8")
-                return json.loads(raw)
-            except Exception:
-                return None
-        return None
-    else:
-        path = CLIENTS_DIR / f"{client_id}.json"
-        if path.exists():
-            with open(path, "r", encoding="utf-8") as fp:
-                return json.load(fp)
+    profile, err = get_client_store().load(client_id)
+    if err:
+        st.warning(f"クライアント読込エラー: {err}")
         return None
+    return profile
 
 
 def save_client(client_id, profile):
-    if USE_GITHUB_STORAGE:
-        filepath = f"{GITHUB_CLIENTS_DIR}/{client_id}.json"
-        content = json.dumps(profile, ensure_ascii=False, indent=2).encode("utf-8")
-        # 既存ファイルのSHAを取得（更新時に必要）
-        existing, _ = _gh_get_file(filepath)
-        sha = existing["sha"] if existing else None
-        ok = _gh_put_file(filepath, content, f"Save client: {client_id}", sha)
-        if not ok:
-            st.error("クライアント保存に失敗しました。GitHub Token の権限を確認してください。")
-    else:
-        path = CLIENTS_DIR / f"{client_id}.json"
-        with open(path, "w", encoding="utf-8") as fp:
-            json.dump(profile, fp, ensure_ascii=False, indent=2)
+    err = get_client_store().save(client_id, profile)
+    if err:
+        st.error(err)
 
 
 def delete_client(client_id):
-    if USE_GITHUB_STORAGE:
-        filepath = f"{GITHUB_CLIENTS_DIR}/{client_id}.json"
-        existing, _ = _gh_get_file(filepath)
-        if existing:
-            _gh_delete_file(filepath, existing["sha"], f"Delete client: {client_id}")
-    else:
-        path = CLIENTS_DIR / f"{client_id}.json"
-        if path.exists():
-            path.unlink()
+    get_client_store().delete(client_id)
 
 
-def fetch_brand_concept(url, api_key):
-    """ブランドサイトURLからページを取得し、Gemini APIでブランドコンセプトを要約する"""
-    text, err = fetch_product_page(url)
+def fetch_brand_concept(url, api_key, profile=None):
+    """ブランドサイトURLからページを取得し、生成プロバイダー（既定は Gemini API）でブランドコンセプトを要約する"""
+    # 商品情報（og:description など）だけで済ませず、コンセプトの書かれた本文を読む
+    text, err = fetch_product_page(url, record_only=False)
     if err:
         return None, f"ページ取得エラー: {err}"
     if not text or len(text.strip()) < 50:
         return None, "ページから十分なテキストを取得できませんでした。"
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        provider = get_provider()
         prompt = f"""以下はブランドの公式Webサイトのテキストです。
 このブランドのコンセプト・理念・ストーリー・こだわりを300〜500文字程度で要約してください。
 要約文のみを出力してください。前置きや説明は不要です。
@@ -244,16 +110,13 @@ def fetch_brand_concept(url, api_key):
 【Webサイトのテキスト】
 {text}
 """
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content(prompt)
-                return response.text, None
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    time.sleep(15 * (attempt + 1))
-                else:
-                    return None, f"AI要約エラー: {e}"
+        request = GenerationRequest(prompt, *model_settings(profile), api_key=api_key)
+        try:
+            text = call_with_backoff(lambda: provider.generate(request),
+                                     tokens=estimate_tokens(prompt), max_retries=3)
+            return text, None
+        except Exception as e:
+            return None, f"AI要約エラー: {e}"
     except Exception as e:
         return None, f"API設定エラー: {e}"
 
@@ -289,423 +152,213 @@ def new_profile():
             "・効果効能を断定する表現は避けること\n"
             "・商品ページのテキスト情報をベースに、表現を簡潔にまとめること"
         ),
+        "model_name": DEFAULT_MODEL,
+        "temperature": 1.0,
+        "top_p": 0.95,
+        "max_output_tokens": 0,
     }
 
 
-# ── 商品ページ取得 ──────────────────────────────────
-def fetch_product_page(url):
-    try:
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            )
-        }
-        resp = requests.get(url, headers=headers, timeout=15)
-        resp.raise_for_status()
-        resp.encoding = resp.apparent_encoding
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for tag in soup(["script", "style", "nav", "footer", "header", "aside"]):
-            tag.decompose()
-        main = soup.find("main") or soup.find("body")
-        text = main.get_text(separator="\n", strip=True) if main else ""
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        if len(text) > 8000:
-            text = text[:8000] + "\n\n（以下省略）"
-        return text, None
-    except Exception as e:
-        return None, str(e)
-
+# ══════════════════════════════════════════════════
+#  メインUI
+# ══════════════════════════════════════════════════
+def result_label(i, item, sched):
+    """生成結果エクスパンダーの見出し"""
+    if i < len(sched):
+        d = sched[i]
+        date_label = f"{d.month}/{d.day}({WEEKDAY_NAMES[d.weekday()]})"
+    else:
+        date_label = ""
 
-# ── リリース資料テキスト抽出（PDF / Excel）──────────
-def extract_text_from_pdf(uploaded_file):
-    """アップロードされたPDFファイルからテキストを抽出する"""
-    try:
-        pdf_bytes = uploaded_file.read()
-        uploaded_file.seek(0)
-        text_parts = []
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-                # テーブルがあれば抽出
-                tables = page.extract_tables()
-                for table in tables:
-                    for row in table:
-                        cells = [str(c) if c else "" for c in row]
-                        text_parts.append(" | ".join(cells))
-        text = "\n\n".join(text_parts)
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        if len(text) > 8000:
-            text = text[:8000] + "\n\n（以下省略）"
-        return text, None
-    except Exception as e:
-        return None, f"PDF読み取りエラー: {e}"
+    event_label = f" 🎉{item.get('seasonal_event', '')}" if item.get("seasonal_event") else ""
+    type_label = f" {item.get('post_type_label', '')}" if item.get("post_type_label") else ""
+    return f"**#{i+1} {date_label}**{type_label} — {item['product_name']}{event_label}"
 
 
-def extract_text_from_excel(uploaded_file):
-    """アップロードされたExcelファイルからテキストを抽出する"""
-    try:
-        excel_bytes = uploaded_file.read()
-        uploaded_file.seek(0)
-        wb = load_workbook(io.BytesIO(excel_bytes), data_only=True)
-        text_parts = []
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            text_parts.append(f"【シート: {sheet_name}】")
-            for row in ws.iter_rows(values_only=True):
-                cells = [str(c) if c is not None else "" for c in row]
-                line = " | ".join(cells).strip()
-                if line and line != " | " * (len(cells) - 1):
-                    text_parts.append(line)
-        text = "\n".join(text_parts)
-        text = re.sub(r"\n{3,}", "\n\n", text)
-        if len(text) > 8000:
-            text = text[:8000] + "\n\n（以下省略）"
-        return text, None
-    except Exception as e:
-        return None, f"Excel読み取りエラー: {e}"
+def render_caption_editor(i, results):
+    """キャプション編集欄（編集内容は results に反映する）"""
+    edited = st.text_area(
+        "キャプション", value=results[i]["caption"], height=400,
+        key=f"caption_{i}", label_visibility="collapsed")
+    results[i]["caption"] = edited
 
 
-def extract_text_from_file(uploaded_file):
-    """ファイル種別に応じてテキスト抽出を振り分ける"""
-    name = uploaded_file.name.lower()
-    if name.endswith(".pdf"):
-        return extract_text_from_pdf(uploaded_file)
-    elif name.endswith((".xlsx", ".xls")):
-        return extract_text_from_excel(uploaded_file)
-    else:
-        return None, f"未対応のファイル形式です: {name}"
+def generation_ready(api_key):
+    """生成を始められるか（API キーを使わないプロバイダーならキーがなくてもよい）"""
+    return bool(api_key) or not get_provider().requires_api_key
 
 
-# ── 投稿スケジュール生成（曜日ベース）────────────────
-def generate_schedule_weekday(total_posts, start_date, post_weekdays):
-    dates = []
-    current = start_date
-    while current.weekday() not in post_weekdays:
-        current += timedelta(days=1)
-    while len(dates) < total_posts:
-        if current.weekday() in post_weekdays:
-            dates.append(current)
-        current += timedelta(days=1)
-    return dates
-
-
-# ── 投稿割り当て生成 ──────────────────────────────
-def build_assignments(product_entries):
-    """
-    product_entries: list of dict
-      - type: "single" | "collection" | "brand"
-      - url: str (single用)
-      - urls: str (collection用、改行区切り)
-      - description: str (collection/brand用の補足)
-      - count: int
-    各エントリをcount回分、ラウンドロビンで投稿枠に割り当てる。
-    返り値: list of dict (各投稿枠の情報)
-    """
-    remaining = []
-    for entry in product_entries:
-        remaining.append({"entry": entry, "left": entry["count"]})
-
-    assignments = []
-    total = sum(e["count"] for e in product_entries)
-    while len(assignments) < total:
-        for item in remaining:
-            if item["left"] > 0:
-                assignments.append(item["entry"])
-                item["left"] -= 1
-                if len(assignments) >= total:
-                    break
-    return assignments
-
-
-# ── キャプション生成（Gemini API）──────────────────
-def generate_caption(entry, product_texts, profile, api_key,
-                     post_number=None, total_posts=None,
-                     seasonal_event=None, post_date=None,
-                     same_product_variation=None):
+def render_regenerate_button(i, results, job_id, spec, api_key):
+    """1投稿だけを生成し直すボタン（入力が前回と同じでもキャッシュを使わずに生成する）"""
+    if not st.button("🔄 この投稿だけ再生成", key=f"regen_{i}",
+                     disabled=not generation_ready(api_key)):
+        return
+    with st.spinner(f"#{i+1} を再生成中..."):
+        caption, err = regenerate_post(spec, i, api_key)
+    if err:
+        st.error(f"❌ 再生成に失敗しました: {err}")
+        return
+    get_job_store().save_post(job_id, i, caption=caption)
+    results[i]["caption"] = caption
+    # 編集欄より先に呼ばれるため、ウィジェットの値を差し替えられる
+    st.session_state[f"caption_{i}"] = caption
+
+
+def save_caption_edits(job_id):
+    """編集欄で直した完成済みの投稿をジョブに保存し、完成済みの投稿番号の集合を返す"""
+    store = get_job_store()
+    finished = set()
+    for index, (caption, err) in store.posts(job_id).items():
+        if err is not None:
+            continue
+        finished.add(index)
+        edited = st.session_state.get(f"caption_{index}")
+        if edited is not None and edited != caption:
+            store.save_post(job_id, index, caption=edited)
+    return finished
+
+
+def start_job(job_id, api_key, resume=False):
     """
-    entry: 投稿エントリ情報 (type, url, urls, description, count)
-    product_texts: dict of {url: text} 取得済みページテキスト
+    ジョブを開始・再開する
+    新しいジョブなら前回の編集欄の状態をすべて破棄する。再開・エラー分の再生成では
+    完成済みの投稿の編集内容を保存し、生成し直す投稿の編集欄だけを破棄する
     """
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash")
-
-    post_type = entry.get("type", "single")
-
-    # ── 共通プロンプト ──
-    prompt = f"""あなたはInstagramの投稿文ライターです。
-指定されたトンマナに合わせてInstagram投稿文を作成してください。
-投稿文のみを出力してください。説明や前置きは不要です。
-
-【ブランド名】
-{profile.get('brand_name', '')}
-
-【トンマナ指示】
-{profile.get('tone_instructions', '')}
-
-【注意事項】
-{profile.get('notes', '')}
-
-【ハッシュタグルール】
-- 固定ハッシュタグ: {profile.get('hashtag_fixed', '')}
-- ハッシュタグ上限: {profile.get('hashtag_limit', 5)}個
-- ブランド名のハッシュタグを含めてください
-
-【テンプレート（キャプション末尾に必ずこの定型文を付加してください）】
-{profile.get('template', '')}
-
-"""
-
-    # ── タイプ別指示 ──
-    input_method = entry.get("input_method", "url")
-
-    if post_type == "single":
-        prompt += """【投稿タイプ: 単品紹介】
-1つの商品にフォーカスした投稿文を作成してください。
-商品名のハッシュタグも含めてください。
-
-"""
-        if input_method == "file":
-            file_text = entry.get("file_text", "")
-            pname_manual = entry.get("product_name_manual", "")
-            if pname_manual:
-                prompt += f"【商品名】\n{pname_manual}\n\n"
-            prompt += f"""【リリース資料からの商品情報】
-{file_text}
-"""
-        else:
-            url = entry.get("url", "")
-            text = product_texts.get(url, "")
-            prompt += f"""【商品ページ情報】
-URL: {url}
-
-{text}
-"""
-
-    elif post_type == "collection":
-        desc = entry.get("description", "").strip()
-        prompt += f"""【投稿タイプ: 集合カット（複数商品）】
-写真には複数の商品が写っています。
-ラインナップの魅力やスキンケアルーティンとしての使い方を紹介してください。
-個々の商品を簡潔に紹介しつつ、組み合わせて使うメリットや全体の統一感を訴求してください。
-"""
-        if desc:
-            prompt += f"""【写真の説明・切り口】
-{desc}
-
-"""
-        if input_method == "file":
-            file_text = entry.get("file_text", "")
-            prompt += f"""【リリース資料からの商品情報】
-{file_text}
-"""
-        else:
-            urls_text = entry.get("urls", "")
-            url_list = [u.strip() for u in urls_text.strip().split("\n") if u.strip()]
-            for j, url in enumerate(url_list):
-                text = product_texts.get(url, "")
-                if text:
-                    prompt += f"""【商品{j+1} ページ情報】
-URL: {url}
-
-{text}
-
-"""
-
-    elif post_type == "brand":
-        desc = entry.get("description", "").strip()
-        brand_concept = profile.get("brand_concept", "").strip()
-        prompt += f"""【投稿タイプ: ブランドコンセプト】
-ブランド全体のコンセプト、世界観、こだわりを紹介する投稿文を作成してください。
-特定の商品名ではなく、ブランドとしての価値観・ストーリーを伝えてください。
-"""
-        if brand_concept:
-            prompt += f"""【ブランドコンセプト情報】
-{brand_concept}
-
-"""
-        if desc:
-            prompt += f"""【投稿の切り口・テーマ】
-{desc}
-
-"""
-
-    # ── 投稿番号 ──
-    if post_number is not None and total_posts is not None:
-        prompt += f"""【投稿位置】
-この投稿は全{total_posts}投稿中の第{post_number}投稿目です。
-"""
-
-    # ── バリエーション ──
-    if same_product_variation is not None and same_product_variation > 1:
-        if post_type == "brand":
-            prompt += f"""【バリエーション指示】
-ブランドコンセプト投稿の{same_product_variation}回目です。
-前回とは異なる切り口で作成してください。
-例: 1回目→ブランドストーリー、2回目→開発のこだわり、3回目→ユーザーへのメッセージ、4回目→ブランドの未来像
-"""
-        elif post_type == "collection":
-            prompt += f"""【バリエーション指示】
-この組み合わせの{same_product_variation}回目の投稿です。
-前回とは異なる切り口で作成してください。
-例: 1回目→ラインナップ紹介、2回目→使う順番・ルーティン、3回目→各商品の相乗効果、4回目→朝晩の使い分け
-"""
-        else:
-            prompt += f"""【バリエーション指示】
-この商品は複数回投稿されます。今回は{same_product_variation}回目の投稿です。
-前回とは異なる切り口・訴求ポイントで作成してください。
-例: 1回目→商品の特徴紹介、2回目→使い方・テクスチャー、3回目→成分のこだわり、4回目→口コミ風・体験レビュー風
-"""
-
-    # ── 季節イベント ──
-    if seasonal_event and post_date:
-        date_str = post_date.strftime("%m/%d")
-        prompt += f"""【季節イベント連動】
-投稿予定日: {date_str}
-関連する季節イベント: {seasonal_event}
-投稿文の冒頭や導入部分で、このイベント・季節感を自然に絡めてください。
-ただし、商品/ブランド紹介がメインであることを忘れずに。
-"""
-
-    # ── サンプル ──
-    sample = profile.get("sample_captions", "").strip()
-    if sample:
-        prompt += f"""【サンプル投稿文（このスタイル・トーンに合わせてください）】
-{sample}
+    keep = {f"caption_{i}" for i in save_caption_edits(job_id)} if resume else set()
+    for key in [k for k in st.session_state if str(k).startswith("caption_")]:
+        if key not in keep:
+            del st.session_state[key]
+    get_job_runner().start(job_id, run_generation_job, api_key)
+
+
+def render_job_notes(job):
+    """ページ取得エラーとキャッシュ統計の表示"""
+    plan = job["plan"] or {}
+    for warning in plan.get("warnings", []):
+        st.error(f"❌ {warning}")
+    stats = plan.get("cache_stats")
+    if stats:
+        st.caption(
+            "🗂️ ページキャッシュ: "
+            f"ヒット {stats['hits']} / 再検証(304) {stats['revalidated']} / ミス {stats['misses']}")
+
+
+def render_run_summary(telemetry):
+    """直近の実行の計測結果（段階ごとの所要時間・トークン数・リトライ・キャッシュ利用）"""
+    if not telemetry or not telemetry.get("stages"):
+        return
+    with st.expander(f"📊 実行サマリー（{telemetry['wall_seconds']:.1f}秒）"):
+        rows = []
+        for stage, row in telemetry["stages"].items():
+            rows.append({
+                "段階": STAGE_LABELS.get(stage, stage),
+                "件数": row["count"],
+                "所要時間(秒)": row["wall"],
+                "p50(秒)": row["p50"],
+                "p95(秒)": row["p95"],
+                "最大(秒)": row["max"],
+                "入力トークン": row.get("prompt_tokens"),
+                "出力トークン": row.get("response_tokens"),
+                "リトライ": row.get("retries"),
+                "キャッシュ": ", ".join(f"{k} {v}" for k, v in sorted(row.get("cache", {}).items())),
+                "エラー": row["errors"],
+            })
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+        posts = [e for e in telemetry.get("events", []) if e["stage"] == "generate"]
+        if posts:
+            st.caption("投稿ごとの生成（まとめて生成した投稿は1行）")
+            st.dataframe([{
+                "投稿": ", ".join(f"#{n}" for n in e.get("post_numbers") or [] if n is not None),
+                "秒": e.get("seconds"),
+                "入力トークン": e.get("prompt_tokens"),
+                "出力トークン": e.get("response_tokens"),
+                "リトライ": e.get("retries", 0),
+                "レート待ち(秒)": e.get("limiter_wait", 0),
+                "キャッシュ": e.get("cache", ""),
+                "エラー": e.get("error", ""),
+            } for e in sorted(posts, key=lambda e: e["start"])],
+                hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress(job_id):
+    """実行中ジョブの進捗（一定間隔で再描画し、終了したらページ全体を再実行する）"""
+    if not get_job_runner().is_running(job_id):
+        st.rerun()
+    job = get_job_store().get_job(job_id)
+    total = job["spec"]["total_posts"]
+    done = len(get_job_store().posts(job_id))
+    st.progress(min(done / total, 1.0) if total else 0,
+                text=f"({done}/{total}) {job['message'] or '生成準備中...'}")
+    if job["plan"] is None:
+        return
+    render_job_notes(job)
+
+    if job["spec"].get("stream_mode"):
+        results = job_results(job)
+        posts = get_job_store().posts(job_id)
+        partials = get_job_runner().partials(job_id)
+        sched = [date_type.fromisoformat(d) for d in job["spec"]["schedule_dates"]]
+        st.header("📝 生成結果（編集可能）")
+        for i, item in enumerate(results):
+            with st.expander(result_label(i, item, sched), expanded=(i < 3)):
+                if i in posts and posts[i][1] is None:
+                    render_caption_editor(i, results)
+                elif i in partials:
+                    st.text(partials[i] + " ▌")
+                else:
+                    st.caption("⏳ 生成待ち...")
 
-"""
 
-    # リトライ処理（429 レートリミット対策）
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            if "429" in str(e) and attempt < max_retries - 1:
-                wait = 15 * (attempt + 1)
-                st.warning(f"⏳ レートリミット到達。{wait}秒待機後にリトライします... ({attempt+2}/{max_retries})")
-                time.sleep(wait)
-            else:
-                raise
-
-
-# ── xlsx生成（スプレッドシート転記用フォーマット）─────────
-def create_xlsx_schedule(results, schedule_dates, client_label):
-    wb = Workbook()
-
-    # === シート1: 配信原稿（横並び・スプレッドシート互換）===
-    ws = wb.active
-    ws.title = "配信原稿"
-
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    date_fill = PatternFill(start_color="D6E4F0", end_color="D6E4F0", fill_type="solid")
-    caption_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-    url_fill = PatternFill(start_color="E2EFDA", end_color="E2EFDA", fill_type="solid")
-    center_align = Alignment(horizontal="center", vertical="center")
-    wrap_align = Alignment(vertical="top", wrap_text=True)
-    body_font = Font(name="Yu Gothic", size=10)
-    thin_border = Border(
-        left=Side(style="thin"), right=Side(style="thin"),
-        top=Side(style="thin"), bottom=Side(style="thin"),
-    )
-
-    ws.column_dimensions["A"].width = 20
-    labels = {
-        1: "投稿番号", 2: "投稿日", 3: "投稿タイプ", 4: "商品名",
-        5: "商品URL（ストーリー用）", 6: "Instagram配信原稿", 7: "季節イベント",
-    }
-    for row_num, label in labels.items():
-        cell = ws.cell(row=row_num, column=1, value=label)
-        cell.font = Font(name="Yu Gothic", bold=True, size=10, color="FFFFFF")
-        cell.alignment = center_align
-        cell.border = thin_border
-        cell.fill = header_fill
-
-    for i, item in enumerate(results):
-        col = i + 2
-        ws.column_dimensions[get_column_letter(col)].width = 35
-
-        cell = ws.cell(row=1, column=col, value=i + 1)
-        cell.font = body_font; cell.alignment = center_align; cell.border = thin_border
-
-        if i < len(schedule_dates):
-            d = schedule_dates[i]
-            date_str = f"{d.month}月{d.day}日{WEEKDAY_NAMES[d.weekday()]}曜日"
-        else:
-            date_str = ""
-        cell = ws.cell(row=2, column=col, value=date_str)
-        cell.font = body_font; cell.alignment = center_align
-        cell.border = thin_border; cell.fill = date_fill
-
-        cell = ws.cell(row=3, column=col, value=item.get("post_type_label", ""))
-        cell.font = body_font; cell.alignment = center_align; cell.border = thin_border
-
-        cell = ws.cell(row=4, column=col, value=item.get("product_name", ""))
-        cell.font = body_font; cell.alignment = center_align; cell.border = thin_border
-
-        cell = ws.cell(row=5, column=col, value=item.get("url", ""))
-        cell.font = body_font; cell.border = thin_border; cell.fill = url_fill
-
-        cell = ws.cell(row=6, column=col, value=item.get("caption", ""))
-        cell.font = body_font; cell.alignment = wrap_align
-        cell.border = thin_border; cell.fill = caption_fill
-
-        cell = ws.cell(row=7, column=col, value=item.get("seasonal_event", ""))
-        cell.font = body_font; cell.alignment = center_align; cell.border = thin_border
-
-    ws.row_dimensions[6].height = 300
-
-    # === シート2: 一覧表 ===
-    ws2 = wb.create_sheet("一覧表")
-    list_headers = ["No.", "投稿日", "タイプ", "商品名", "商品URL", "季節イベント", "キャプション"]
-    for col, h in enumerate(list_headers, 1):
-        cell = ws2.cell(row=1, column=col, value=h)
-        cell.font = Font(name="Yu Gothic", bold=True, size=10, color="FFFFFF")
-        cell.fill = header_fill; cell.alignment = center_align; cell.border = thin_border
-
-    for i, item in enumerate(results):
-        row = i + 2
-        ws2.cell(row=row, column=1, value=i + 1).font = body_font
-        ws2.cell(row=row, column=1).border = thin_border
-        if i < len(schedule_dates):
-            d = schedule_dates[i]
-            date_str = f"{d.month}月{d.day}日{WEEKDAY_NAMES[d.weekday()]}曜日"
-        else:
-            date_str = ""
-        ws2.cell(row=row, column=2, value=date_str).font = body_font
-        ws2.cell(row=row, column=2).border = thin_border
-        ws2.cell(row=row, column=3, value=item.get("post_type_label", "")).font = body_font
-        ws2.cell(row=row, column=3).border = thin_border
-        ws2.cell(row=row, column=4, value=item.get("product_name", "")).font = body_font
-        ws2.cell(row=row, column=4).border = thin_border
-        ws2.cell(row=row, column=5, value=item.get("url", "")).font = body_font
-        ws2.cell(row=row, column=5).border = thin_border
-        ws2.cell(row=row, column=6, value=item.get("seasonal_event", "")).font = body_font
-        ws2.cell(row=row, column=6).border = thin_border
-        cell = ws2.cell(row=row, column=7, value=item.get("caption", ""))
-        cell.font = body_font; cell.alignment = wrap_align; cell.border = thin_border
-
-    ws2.column_dimensions["A"].width = 6
-    ws2.column_dimensions["B"].width = 18
-    ws2.column_dimensions["C"].width = 14
-    ws2.column_dimensions["D"].width = 25
-    ws2.column_dimensions["E"].width = 40
-    ws2.column_dimensions["F"].width = 20
-    ws2.column_dimensions["G"].width = 80
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf
+def render_job(job_id, api_key):
+    """
+    一括生成ジョブの状態を表示する
+    実行中は進捗をポーリングし、完了したら結果をセッションに取り込む。
+    サーバー再起動などで止まったジョブは保存済みの投稿の続きから再開できる
+    """
+    store = get_job_store()
+    runner = get_job_runner()
+    job = store.get_job(job_id)
+    if job is None:
+        return
+    if runner.is_running(job_id):
+        render_job_progress(job_id)
+        return
+
+    posts = store.posts(job_id)
+    done = len([p for p in posts.values() if p[1] is None])
+    total = job["spec"]["total_posts"]
+    if job["status"] == JOB_DONE:
+        if job["message"]:
+            st.success(job["message"])
+        render_job_notes(job)
+        render_run_summary(job["telemetry"])
+        # 取り込み済みなら編集中の内容を上書きしない
+        if st.session_state.get("job_loaded") != job_id:
+            st.session_state["results"] = job_results(job)
+            st.session_state["schedule_dates"] = [
+                date_type.fromisoformat(d) for d in job["spec"]["schedule_dates"]]
+            st.session_state["job_loaded"] = job_id
+        if done < total and st.button(
+                f"🔁 エラーになった {total - done} 投稿を再生成", key=f"retry_{job_id}",
+                disabled=not generation_ready(api_key)):
+            st.session_state.pop("job_loaded", None)
+            start_job(job_id, api_key, resume=True)
+            st.rerun()
+        return
+
+    if job["status"] == JOB_FAILED:
+        st.error(f"❌ 生成ジョブが失敗しました: {job['error']}")
+    else:
+        st.warning("⚠️ 生成ジョブが中断されました。")
+    st.caption(f"{done}/{total} 投稿が生成済みです。")
+    render_run_summary(job["telemetry"])
+    if st.button("⏯️ 続きから再開", key=f"resume_{job_id}", disabled=not generation_ready(api_key)):
+        start_job(job_id, api_key, resume=True)
+        st.rerun()
 
 
-# ══════════════════════════════════════════════════
-#  メインUI
-# ══════════════════════════════════════════════════
 def main():
     st.title("📸 Instagram投稿文ジェネレーター")
     st.caption("商品URLを入力 → 一括で投稿文を生成 → xlsxでダウンロード → スプレッドシートに転記")
@@ -716,7 +369,15 @@ def main():
         api_key = st.secrets["GEMINI_API_KEY"]
     except Exception:
         pass
-    if not api_key or api_key == "your-gemini-api-key-here":
+    try:
+        provider = configure_provider(LLM_PROVIDER, LLM_CASSETTE)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+    if not provider.requires_api_key:
+        # オフライン生成・カセットの再生では Gemini API を呼ばない
+        st.info(f"🧪 生成プロバイダー: {provider.name}（Gemini API は呼び出しません）")
+    elif not api_key or api_key == "your-gemini-api-key-here":
         st.warning("⚠️ `.streamlit/secrets.toml` にGemini APIキーを設定してください。")
         api_key = st.text_input(
             "または、ここにGemini APIキーを入力してください（一時利用）",
@@ -757,7 +418,7 @@ def main():
                      disabled=not profile.get("brand_site_url", "").strip()):
             brand_url = profile["brand_site_url"].strip()
             with st.spinner("ブランドサイトを解析中..."):
-                concept, fetch_err = fetch_brand_concept(brand_url, api_key)
+                concept, fetch_err = fetch_brand_concept(brand_url, api_key, profile)
                 if fetch_err:
                     st.error(f"❌ {fetch_err}")
                 elif concept:
@@ -791,6 +452,20 @@ def main():
 
         profile["notes"] = st.text_area("注意事項", value=profile.get("notes", ""), height=100)
 
+        with st.expander("⚙️ 生成モデル設定"):
+            profile["model_name"] = st.text_input(
+                "モデル名", value=profile.get("model_name") or DEFAULT_MODEL)
+            profile["temperature"] = st.slider(
+                "temperature", min_value=0.0, max_value=2.0, step=0.05,
+                value=float(profile.get("temperature", 1.0)),
+                help="高いほど表現のバリエーションが増えます")
+            profile["top_p"] = st.slider(
+                "top_p", min_value=0.0, max_value=1.0, step=0.05,
+                value=float(profile.get("top_p", 0.95)))
+            profile["max_output_tokens"] = st.number_input(
+                "最大出力トークン数（0 = モデル既定）", min_value=0, max_value=65536, step=256,
+                value=int(profile.get("max_output_tokens", 0)))
+
         st.divider()
         col_save, col_del = st.columns(2)
         with col_save:
@@ -1077,149 +752,64 @@ def main():
     st.divider()
     can_generate = (sum_assigned == total_posts) and valid
 
-    if st.button("✨ 一括生成", type="primary", use_container_width=True,
-                 disabled=not can_generate):
-        results = []
-        progress = st.progress(0, text="生成準備中...")
-
-        # 全URLを収集してページ取得（キャッシュ）— ファイルベースはスキップ
-        all_urls = set()
-        for entry in assignments:
-            if entry.get("input_method") == "file":
-                continue  # ファイルベースはURL取得不要
-            pt = entry.get("type", "single")
-            if pt == "single":
-                url = entry.get("url", "").strip()
-                if url:
-                    all_urls.add(url)
-            elif pt == "collection":
-                for u in entry.get("urls", "").strip().split("\n"):
-                    u = u.strip()
-                    if u:
-                        all_urls.add(u)
-
-        all_urls = list(all_urls)
-        page_cache = {}
-        for i, url in enumerate(all_urls):
-            progress.progress(
-                i / (len(all_urls) + total_posts),
-                text=f"商品ページを取得中 ({i+1}/{len(all_urls)}): {url[:50]}...")
-            text, err = fetch_product_page(url)
-            if err:
-                st.error(f"❌ {url}: {err}")
-                page_cache[url] = ""
-            else:
-                page_cache[url] = text
-
-        # キャプション生成
-        # エントリIDでバリエーションカウント
-        variation_counter = {}
-
-        for i, entry in enumerate(assignments):
-            # エントリの識別キー
-            pt = entry.get("type", "single")
-            im = entry.get("input_method", "url")
-            if pt == "single":
-                if im == "file":
-                    entry_key = f"single:file:{entry.get('file_name', '')}"
-                else:
-                    entry_key = f"single:{entry.get('url', '')}"
-            elif pt == "collection":
-                if im == "file":
-                    entry_key = f"collection:file:{entry.get('file_name', '')}"
-                else:
-                    entry_key = f"collection:{entry.get('urls', '')}"
-            else:
-                entry_key = f"brand:{entry.get('description', '')}"
-
-            variation_counter[entry_key] = variation_counter.get(entry_key, 0) + 1
-            variation_num = variation_counter[entry_key]
-
-            post_date = schedule_dates[i] if i < len(schedule_dates) else None
-
-            seasonal_event = None
-            if i < len(post_events) and post_events[i][0]:
-                seasonal_event = post_events[i][1]
-
-            # 商品名の特定
-            if pt == "single":
-                if im == "file":
-                    pname = entry.get("product_name_manual", "") or entry.get("file_name", "") or "新商品"
-                    display_url = ""
-                else:
-                    url = entry.get("url", "").strip()
-                    text = page_cache.get(url, "")
-                    lines = [l.strip() for l in text.split("\n") if l.strip()]
-                    pname = lines[0][:50] if lines else "不明"
-                    display_url = url
-            elif pt == "collection":
-                pname = entry.get("description", "") or "集合カット"
-                if im == "file":
-                    display_url = ""
-                else:
-                    urls_str = entry.get("urls", "")
-                    first_url = urls_str.strip().split("\n")[0].strip() if urls_str.strip() else ""
-                    display_url = first_url
-            else:
-                pname = entry.get("description", "") or "ブランドコンセプト"
-                display_url = ""
-
-            progress.progress(
-                (len(all_urls) + i) / (len(all_urls) + total_posts),
-                text=f"キャプション生成中 ({i+1}/{total_posts}): {pname}")
-
-            try:
-                caption = generate_caption(
-                    entry, page_cache, profile, api_key,
-                    post_number=i + 1, total_posts=total_posts,
-                    seasonal_event=seasonal_event, post_date=post_date,
-                    same_product_variation=variation_num)
-            except Exception as e:
-                st.error(f"❌ AI生成エラー ({pname}): {e}")
-                caption = f"生成エラー: {e}"
-
-            results.append({
-                "url": display_url,
-                "product_name": pname,
-                "caption": caption,
-                "seasonal_event": seasonal_event or "",
-                "post_type_label": POST_TYPES.get(pt, ""),
-            })
+    batch_mode = st.checkbox(
+        "🧩 同じ商品の投稿はまとめて生成する（APIリクエスト数を削減）", value=True,
+        help="同じURL・資料・組み合わせの投稿を1回のリクエストで切り口違いにまとめて作成します")
+    stream_mode = st.checkbox(
+        "📡 生成中の投稿文を逐次表示する", value=True,
+        help="生成途中のテキストを各投稿の欄に表示し、完成した投稿からすぐ編集できるようにします")
+
+    # 実行中・中断中のジョブ（ブラウザを開き直した場合は同じクライアントの直近のジョブに接続する）
+    store = get_job_store()
+    job_id = st.session_state.get("job_id")
+    if job_id is None and not st.session_state.get("results"):
+        latest = store.latest_job(client_id or "")
+        if latest and time.time() - latest["created_at"] < JOB_ATTACH_HOURS * 3600:
+            job_id = latest["id"]
+            st.session_state["job_id"] = job_id
+    job_running = bool(job_id) and get_job_runner().is_running(job_id)
 
-            # レートリミット回避
-            if i < len(assignments) - 1:
-                time.sleep(5)
-
-        progress.progress(1.0, text="✅ 全投稿の生成が完了しました！")
-        st.session_state["results"] = results
-        st.session_state["schedule_dates"] = schedule_dates
+    if st.button("✨ 一括生成", type="primary", use_container_width=True,
+                 disabled=not can_generate or job_running):
+        # 生成はワーカースレッドで行うため、再実行やブラウザ切断の影響を受けない
+        job_id = store.create_job(client_id or "", {
+            "profile": profile,
+            "products": products,
+            "total_posts": total_posts,
+            "schedule_dates": [d.isoformat() for d in schedule_dates],
+            "post_events": post_events,
+            "batch_mode": batch_mode,
+            "stream_mode": stream_mode,
+            "concurrency": GENERATION_CONCURRENCY,
+            "rpm": GEMINI_RPM,
+            "tpm": GEMINI_TPM,
+            "prompt_budget": PROMPT_TOKEN_BUDGET,
+        })
+        st.session_state["job_id"] = job_id
+        st.session_state.pop("results", None)
+        start_job(job_id, api_key)
+        job_running = True
+
+    if job_id:
+        render_job(job_id, api_key)
 
     # ══════════════════════════════════════════════
     #  結果表示 & ダウンロード
     # ══════════════════════════════════════════════
-    if "results" in st.session_state and st.session_state["results"]:
+    # 生成中は進捗表示の側で編集欄を描画する
+    if st.session_state.get("results") and not job_running:
         results = st.session_state["results"]
         sched = st.session_state.get("schedule_dates", [])
 
-        st.header("📝 生成結果（編集可能）")
+        loaded_job = store.get_job(st.session_state.get("job_loaded") or "")
 
+        st.header("📝 生成結果（編集可能）")
         for i, item in enumerate(results):
-            if i < len(sched):
-                d = sched[i]
-                date_label = f"{d.month}/{d.day}({WEEKDAY_NAMES[d.weekday()]})"
-            else:
-                date_label = ""
-
-            event_label = f" 🎉{item.get('seasonal_event', '')}" if item.get("seasonal_event") else ""
-            type_label = f" {item.get('post_type_label', '')}" if item.get("post_type_label") else ""
-
-            with st.expander(
-                f"**#{i+1} {date_label}**{type_label} — {item['product_name']}{event_label}",
-                expanded=(i < 3)):
-                edited = st.text_area(
-                    "キャプション", value=item["caption"], height=400,
-                    key=f"caption_{i}", label_visibility="collapsed")
-                results[i]["caption"] = edited
+            with st.expander(result_label(i, item, sched), expanded=(i < 3)):
+                if loaded_job:
+                    render_regenerate_button(i, results, loaded_job["id"], loaded_job["spec"],
+                                             api_key)
+                render_caption_editor(i, results)
 
         st.divider()
         st.subheader("📥 ダウンロード")
@@ -1231,14 +821,35 @@ def main():
         xlsx_buf = create_xlsx_schedule(
             results, sched, profile.get("name") or client_id or "output")
         client_label = profile.get("name") or client_id or "output"
-        filename = f"instagram_captions_{client_label}_{total_posts}posts.xlsx"
+        stem = f"instagram_captions_{client_label}_{total_posts}posts"
 
         st.download_button(
             label=f"📥 xlsxをダウンロード（{total_posts}投稿分）",
-            data=xlsx_buf, file_name=filename,
+            data=xlsx_buf, file_name=f"{stem}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             type="primary", use_container_width=True)
 
+        # テキスト形式（CSV は Excel で文字化けしないよう BOM 付き）
+        col_csv, col_tsv, col_jsonl = st.columns(3)
+        with col_csv:
+            st.download_button(
+                "📄 CSV", data="".join(iter_csv(results, sched)).encode("utf-8-sig"),
+                file_name=f"{stem}.csv", mime="text/csv", use_container_width=True)
+        with col_tsv:
+            st.download_button(
+                "📄 TSV", data="".join(iter_csv(results, sched, delimiter="\t")).encode("utf-8"),
+                file_name=f"{stem}.tsv", mime="text/tab-separated-values",
+                use_container_width=True)
+        with col_jsonl:
+            st.download_button(
+                "📄 JSON Lines", data="".join(iter_jsonl(results, sched)).encode("utf-8"),
+                file_name=f"{stem}.jsonl", mime="application/x-ndjson", use_container_width=True)
+
+        with st.expander("📋 スプレッドシートに直接貼り付ける（配信原稿の横並び）"):
+            st.caption("右上のボタンでコピーし、貼り付け先の左上のセルを選んで貼り付けてください。"
+                       "キャプションの改行は1つのセル内に保たれます。")
+            st.code(clipboard_tsv(results, sched), language=None)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,97 @@
+"""
+商品ページ本文抽出のベンチマーク
+
+    python benchmarks/html_extract.py                 # 合成した EC ページ（1〜3MB）で比較
+    python benchmarks/html_extract.py --fixtures DIR  # 保存済みの *.html で比較
+
+バックエンドごとに1ページあたりの処理時間と、従来の処理（bs4）の出力との行単位の一致率、
+truncate_text 後の文字数を表示する
+"""
+
+import argparse
+import difflib
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from igcaption.fetch import truncate_text  # noqa: E402
+from igcaption.html_text import EXTRACTORS, _available  # noqa: E402
+
+
+def _words(rng, n):
+    vocab = ["保湿", "美容液", "セラミド", "ヒアルロン酸", "肌", "うるおい", "化粧水", "敏感肌",
+             "無添加", "ビタミンC", "ハリ", "ツヤ", "乾燥", "毛穴", "透明感", "やさしい"]
+    return "".join(rng.choice(vocab) for _ in range(n))
+
+
+def make_fixture(kind, size_mb, seed=0):
+    """EC サイトを模した重いページを作る（巨大なインラインスクリプトとナビゲーション付き）"""
+    rng = random.Random(seed)
+    state = "".join(f'{{"id":{i},"name":"{_words(rng, 3)}","price":{rng.randint(500, 9000)}}},'
+                    for i in range(int(size_mb * 18000)))
+    nav = "".join(f'<li><a href="/c/{i}">{_words(rng, 2)}</a></li>' for i in range(400))
+    recs = "".join(f'<div class="rec"><a href="/p/{i}">{_words(rng, 4)}</a><span>¥{i * 10}</span></div>'
+                   for i in range(300))
+    desc = "".join(f"<p>{_words(rng, 20)}。</p>" for _ in range(40))
+    reviews = "".join(f'<li class="review"><p>{_words(rng, 12)}</p></li>' for _ in range(200))
+    if kind == "shopify":
+        product = (f'<div class="product__info"><h1>うるおいセラム 30mL</h1><span>¥3,980</span>'
+                   f'<div class="product__description rte">{desc}</div></div>')
+    elif kind == "rakuten":
+        product = (f'<table><tr><td><h1>【公式】うるおいセラム 30mL 送料無料</h1>'
+                   f'<span class="item_desc">{desc}</span></td></tr></table>')
+    else:
+        product = f"<h1>うるおいセラム 30mL</h1><section>{desc}</section>"
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>うるおいセラム</title>"
+        f"<style>{'.x{color:red}' * 2000}</style></head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header>"
+        f"<div class='breadcrumb'>ホーム &gt; スキンケア &gt; 美容液</div>"
+        f"<main>{product}<div class='reviews'><ul>{reviews}</ul></div></main>"
+        f"<aside>{recs}</aside><footer>{nav}</footer>"
+        f"<script>window.__STATE__=[{state}]</script><noscript>JavaScript を有効にしてください</noscript>"
+        "</body></html>"
+    )
+
+
+def load_fixtures(directory):
+    if directory:
+        return {p.name: p.read_text(encoding="utf-8", errors="replace")
+                for p in sorted(Path(directory).glob("*.html"))}
+    return {f"{kind}.html": make_fixture(kind, size, seed=n)
+            for n, (kind, size) in enumerate([("shopify", 1.0), ("rakuten", 3.0), ("plain", 2.0)])}
+
+
+def _similarity(a, b):
+    return difflib.SequenceMatcher(None, a.splitlines(), b.splitlines(), autojunk=False).ratio()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixtures", help="保存済み HTML（*.html）のディレクトリ")
+    parser.add_argument("--repeat", type=int, default=3, help="各ページの計測回数")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures)
+    backends = [name for name in EXTRACTORS if _available(name)]
+    print(f"{'page':<16}{'size':>8}  " + "".join(f"{b:>22}" for b in backends))
+    for name, html in fixtures.items():
+        baseline = truncate_text(EXTRACTORS["bs4"](html))
+        cells = []
+        for backend in backends:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                text = truncate_text(EXTRACTORS[backend](html))
+                times.append(time.perf_counter() - start)
+            cells.append(f"{statistics.median(times) * 1000:7.0f}ms "
+                         f"{_similarity(baseline, text):4.0%} {len(text):5d}c")
+        print(f"{name:<16}{len(html) / 1e6:7.1f}M  " + "".join(f"{c:>22}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+一括生成パイプラインのベンチマーク（ネットワーク・Gemini API を使わない）
+
+    python benchmarks/pipeline.py                          # 10 / 50 / 200 投稿のプランで計測
+    python benchmarks/pipeline.py --posts 50 --rpm 10      # 無料枠相当のレート上限で計測
+    python benchmarks/pipeline.py --fixtures DIR           # 保存済みの商品ページ（*.html）を配信
+
+商品ページはローカルの HTTP サーバーから（応答までの待ちを指定可）、生成は Gemini の
+GenerativeServiceClient を差し替えたスタブで行う（応答までの待ち・出力速度・429 の発生率を指定可）。
+--provider offline / replay を指定すると、スタブの代わりにそのプロバイダーで生成する。
+アプリと同じ run_generation_job → job_results → xlsx / CSV / TSV 書き出しを通して、
+プランごとに posts/min、投稿あたりの生成時間（p50 / p95）、最初の投稿までの時間、
+リトライ回数、書き出し時間、メモリ使用量のピーク（tracemalloc）を表示する
+計測の前に小さなプランを1回だけ計測せずに実行し、SDK の読み込みやモデルの作成を済ませておく
+商品ページはすべて同じホストから配信するため、取得の並列度は FETCH_PER_HOST_LIMIT で頭打ちになる
+（1つの EC サイトの商品を並べたプランと同じ条件）
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.ai import generativelanguage as glm  # noqa: E402
+from google.api_core.exceptions import ResourceExhausted  # noqa: E402
+
+from html_extract import make_fixture  # noqa: E402
+from igcaption import gemini  # noqa: E402
+from igcaption.export import clipboard_tsv, iter_csv  # noqa: E402
+from igcaption.jobs import JOB_DONE, get_job_store  # noqa: E402
+from igcaption.llm import configure_provider  # noqa: E402
+from igcaption.pipeline import job_results, run_generation_job  # noqa: E402
+from igcaption.ratelimit import DEFAULT_CONCURRENCY, count_tokens  # noqa: E402
+from igcaption.schedule import generate_schedule_weekday  # noqa: E402
+from igcaption.xlsx import create_xlsx_schedule  # noqa: E402
+
+PROFILE = {
+    "name": "bench",
+    "brand_name": "ベンチマーク化粧品",
+    "tone_instructions": "・【見出し✨️】のような括弧付きヘッドラインで始める\n・やわらかい語り口で、絵文字は控えめに\n" * 5,
+    "sample_captions": "\n---\n".join(f"【サンプル{i}✨️】\n" + "うるおいが続く美容液のご紹介です。" * 20
+                                      for i in range(3)),
+    "template": "-————\n\n@bench_official\n公式サイトはプロフィールのリンクから",
+    "hashtag_fixed": "#スキンケア #美容液",
+    "hashtag_limit": 5,
+    "notes": "・薬機法に抵触しないよう、商品ページに記載されている表現のみ使用すること",
+}
+
+# 商品エントリの並び（種類, 投稿数）。プランの投稿数に達するまで繰り返す
+PLAN_PATTERN = [("single", 3), ("collection", 2), ("single", 2), ("brand", 1), ("single", 1)]
+
+# 計測前の慣らし運転の投稿数（PLAN_PATTERN の1周分。まとめて生成と1件ずつの生成の両方を通す）
+WARMUP_POSTS = sum(count for _, count in PLAN_PATTERN)
+
+
+# ── 商品ページ（ローカル HTTP サーバー）──────
+class PageServer:
+    """保存済み（または合成した）商品ページを、指定した待ち時間をおいて返す HTTP サーバー"""
+
+    def __init__(self, pages, latency=0.0, jitter=0.0, seed=0):
+        self.pages = [p.encode("utf-8") for p in pages]
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    delay = server.latency + server.rng.uniform(0, server.jitter)
+                time.sleep(delay)
+                body = server.pages[sum(map(ord, self.path)) % len(server.pages)]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="bench-pages", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+# ── Gemini のスタブ ──────
+class StubGemini:
+    """
+    GenerativeServiceClient の代わりに使うスタブ
+    latency 秒待ってから tokens_per_second の速さで出力し、error_rate の割合で 429 を返す
+    """
+
+    def __init__(self, latency=1.0, tokens_per_second=200.0, error_rate=0.0, retry_after=1.0,
+                 output_chars=300, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.output_chars = output_chars
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+
+    def _caption(self, k):
+        body = f"【ベンチマーク投稿{k}✨️】\n" + "うるおいを閉じ込める美容液。" * (self.output_chars // 14)
+        return body[:self.output_chars]
+
+    def _reply(self, request):
+        with self.lock:
+            self.calls += 1
+            limited = self.rng.random() < self.error_rate
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            raise ResourceExhausted(f"Resource has been exhausted. Please retry in {self.retry_after}s.")
+        prompt = "".join(part.text for content in request.contents for part in content.parts)
+        if request.generation_config.response_mime_type == "application/json":
+            count = len(re.findall(r"^- slot \d+", prompt, re.M))
+            text = json.dumps([{"slot": k, "caption": self._caption(k)} for k in range(1, count + 1)],
+                              ensure_ascii=False)
+        else:
+            text = self._caption(1)
+        system = "".join(part.text for part in request.system_instruction.parts)
+        return count_tokens(system + prompt), text
+
+    @staticmethod
+    def _response(text, prompt_tokens=0, response_tokens=0, final=True):
+        return glm.GenerateContentResponse(
+            candidates=[glm.Candidate(content=glm.Content(parts=[glm.Part(text=text)], role="model"),
+                                      finish_reason=1 if final else 0)],
+            usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+                prompt_token_count=prompt_tokens, candidates_token_count=response_tokens))
+
+    def generate_content(self, request, **kwargs):
+        prompt_tokens, text = self._reply(request)
+        time.sleep(self.latency + count_tokens(text) / self.tokens_per_second)
+        return self._response(text, prompt_tokens, count_tokens(text))
+
+    def stream_generate_content(self, request, **kwargs):
+        prompt_tokens, text = self._reply(request)
+        time.sleep(self.latency)
+        # 0.1 秒分ずつ返し、最後のチャンクにトークン数を載せる
+        step = max(1, int(self.tokens_per_second * 0.1))
+        for start in range(0, len(text), step):
+            piece = text[start:start + step]
+            time.sleep(count_tokens(piece) / self.tokens_per_second)
+            if start + step >= len(text):
+                yield self._response(piece, prompt_tokens, count_tokens(text))
+            else:
+                yield self._response(piece, final=False)
+
+    def delete_cached_content(self, name, **kwargs):
+        pass
+
+
+def install_stub(stub):
+    """生成 API の呼び出し先をスタブに差し替える（コンテキストキャッシュは作成に成功した扱い）"""
+    gemini._client_for = lambda api_key: stub
+    gemini._cache_client_for = lambda api_key: stub
+    gemini._create_context_cache = (
+        lambda api_key, model_name, system_instruction: f"cachedContents/bench-{len(system_instruction)}")
+
+
+# ── 計測 ──────
+def make_products(total_posts, base_url, tag):
+    """投稿数が total_posts になる商品エントリ（URL はプランごとに別にしてキャッシュを効かせない）"""
+    products = []
+    n = 0
+    while n < total_posts:
+        kind, count = PLAN_PATTERN[len(products) % len(PLAN_PATTERN)]
+        count = min(count, total_posts - n)
+        k = len(products)
+        entry = {"type": kind, "url": "", "urls": "", "description": "", "count": count,
+                 "input_method": "url", "file_text": "", "file_name": ""}
+        if kind == "single":
+            entry["url"] = f"{base_url}/{tag}/item/{k}"
+        elif kind == "collection":
+            entry["urls"] = f"{base_url}/{tag}/item/{k}a\n{base_url}/{tag}/item/{k}b"
+            entry["description"] = f"セット{k}"
+        else:
+            entry["description"] = f"ブランドの想い{k}"
+        products.append(entry)
+        n += count
+    return products
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run_plan(total_posts, server, args):
+    """1プラン分をアプリと同じ経路で実行し、計測値を dict で返す"""
+    products = make_products(total_posts, server.base_url, f"plan{total_posts}-{time.time_ns()}")
+    schedule_dates = generate_schedule_weekday(total_posts, date(2026, 11, 2), [0, 3])
+    spec = {
+        "profile": PROFILE,
+        "products": products,
+        "total_posts": total_posts,
+        "schedule_dates": [d.isoformat() for d in schedule_dates],
+        "post_events": [],
+        "batch_mode": not args.no_batch,
+        "stream_mode": args.stream,
+        "concurrency": args.concurrency,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+        "prompt_budget": None,
+        "use_cache": args.use_cache,
+    }
+    store = get_job_store()
+    job_id = store.create_job(PROFILE["name"], spec)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    run_generation_job(job_id, "bench-key")
+    wall = time.perf_counter() - started
+    job = store.get_job(job_id)
+    results = job_results(job)
+    export_started = time.perf_counter()
+    create_xlsx_schedule(results, schedule_dates, PROFILE["name"])
+    "".join(iter_csv(results, schedule_dates))
+    clipboard_tsv(results, schedule_dates)
+    export = time.perf_counter() - export_started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    if job["status"] != JOB_DONE:
+        raise RuntimeError(f"{total_posts}投稿のジョブが失敗しました: {job['error']}")
+    telemetry = job["telemetry"]
+    events = [e for e in telemetry["events"] if e["stage"] == "generate" and not e.get("error")]
+    # まとめて生成した投稿は、そのリクエストの所要時間を各投稿の生成時間とする
+    latencies = [e["seconds"] for e in events for _ in e["post_numbers"]]
+    stages = telemetry["stages"]
+    return {
+        "posts": total_posts,
+        "requests": len(events),
+        "errors": sum(1 for r in results if r["caption"].startswith("生成エラー")),
+        "wall": wall,
+        "posts_per_min": total_posts / wall * 60 if wall else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": _percentile(latencies, 0.95),
+        "first_post": min((e["start"] + e["seconds"] for e in events), default=0.0),
+        "fetch_p95": stages.get("fetch", {}).get("p95", 0.0),
+        "retries": int(stages.get("generate", {}).get("retries", 0)),
+        "export": export,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", default="10,50,200", help="計測するプランの投稿数（カンマ区切り）")
+    parser.add_argument("--fixtures", help="配信する商品ページ（*.html）のディレクトリ（省略時は合成ページ）")
+    parser.add_argument("--page-mb", type=float, default=0.2, help="合成ページの大きさ（MB）")
+    parser.add_argument("--page-latency", type=float, default=0.3, help="商品ページの応答までの秒数")
+    parser.add_argument("--page-jitter", type=float, default=0.2, help="応答時間に加える揺らぎ（秒）")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="生成の応答開始までの秒数")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="生成の出力速度")
+    parser.add_argument("--output-chars", type=int, default=300, help="1投稿あたりの出力文字数")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="429 を返すリクエストの割合")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 で指示する待ち秒数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=1000, help="1分あたりのリクエスト上限")
+    parser.add_argument("--tpm", type=int, default=10_000_000, help="1分あたりのトークン上限")
+    parser.add_argument("--no-batch", action="store_true", help="同じ商品の投稿をまとめずに生成する")
+    parser.add_argument("--stream", action="store_true", help="ストリーミングで生成する")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="生成済みキャプションのキャッシュを使う（既定は毎回生成する）")
+    parser.add_argument("--json", help="計測結果を JSON で書き出すパス")
+    parser.add_argument("--provider", choices=("offline", "replay"),
+                        help="スタブの代わりに使う生成プロバイダー（offline はモデル以外の処理だけを計測）")
+    parser.add_argument("--cassette", help="--provider replay で再生するカセット")
+    parser.add_argument("--warmup", type=int, default=WARMUP_POSTS,
+                        help="計測前に計測せずに実行するプランの投稿数（0 で省略）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # キャッシュ・ジョブ・計測結果は一時ディレクトリに置き、手元のデータに触れない
+    workdir = tempfile.mkdtemp(prefix="igcaption-bench-")
+    for name in ("PAGE_CACHE_DIR", "CAPTION_CACHE_DIR", "EXTRACT_CACHE_DIR", "JOB_STORE_DIR"):
+        os.environ[name] = workdir
+    os.environ["TELEMETRY_PATH"] = str(Path(workdir) / "telemetry.jsonl")
+
+    if args.fixtures:
+        pages = [p.read_text(encoding="utf-8", errors="replace")
+                 for p in sorted(Path(args.fixtures).glob("*.html"))]
+        if not pages:
+            parser.error(f"{args.fixtures} に *.html がありません")
+    else:
+        pages = [make_fixture(kind, args.page_mb, seed=n)
+                 for n, kind in enumerate(["shopify", "rakuten", "plain"])]
+    server = PageServer(pages, args.page_latency, args.page_jitter, seed=args.seed).start()
+    stub = StubGemini(args.model_latency, args.tokens_per_second, args.error_rate,
+                      args.retry_after, args.output_chars, seed=args.seed)
+    if args.provider:
+        configure_provider(args.provider, args.cassette)
+    else:
+        configure_provider("gemini")
+        install_stub(stub)
+
+    print(f"{'posts':>6}{'reqs':>6}{'wall':>9}{'posts/min':>11}{'p50':>8}{'p95':>8}"
+          f"{'first':>8}{'fetch95':>9}{'429':>5}{'export':>8}{'peak':>9}")
+    rows = []
+    try:
+        if args.warmup > 0:
+            # 初回だけかかる処理（google.generativeai の読み込み・モデルの作成など）を計測から外す
+            run_plan(args.warmup, server, args)
+            server.requests = stub.calls = stub.rate_limited = 0
+        for total_posts in [int(n) for n in args.posts.split(",") if n.strip()]:
+            row = run_plan(total_posts, server, args)
+            rows.append(row)
+            print(f"{row['posts']:>6}{row['requests']:>6}{row['wall']:>8.1f}s{row['posts_per_min']:>11.1f}"
+                  f"{row['p50']:>7.2f}s{row['p95']:>7.2f}s{row['first_post']:>7.2f}s"
+                  f"{row['fetch_p95']:>8.2f}s{row['retries']:>5}{row['export']:>7.2f}s"
+                  f"{row['peak_mb']:>7.1f}MB" + (f"  生成エラー {row['errors']}件" if row["errors"] else ""))
+    finally:
+        server.stop()
+    print(f"ページ {server.requests} 回 / 生成 {stub.calls} 回（429 {stub.rate_limited} 回）/ "
+          f"最大 RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
+    print(f"計測結果: {os.environ['TELEMETRY_PATH']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": rows},
+                                              ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+Instagram投稿文生成アプリのコアロジック
+Streamlit UI（app.py）から独立して利用できる処理をまとめる
+"""
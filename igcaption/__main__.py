@@ -0,0 +1,5 @@
+import sys
+
+from igcaption.cli import main
+
+sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+生成済みキャプションのディスクキャッシュ
+組み立て済みのプロンプト（システム指示＋投稿ごとのプロンプト）とモデル設定のハッシュをキーに、
+生成結果を保存する。入力が変わっていない投稿は再実行時に API を呼ばずに再利用する
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from igcaption.page_cache import DEFAULT_CACHE_DIR, SQLiteLRUCache
+
+DEFAULT_MAX_MB = 20
+
+
+def caption_cache_key(model_name, config, context, prompt):
+    """モデル名・生成パラメータ・システム指示・プロンプトからキャッシュキーを作る"""
+    payload = json.dumps([model_name, config, context, prompt], ensure_ascii=False,
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CaptionCache(SQLiteLRUCache):
+    """SQLite に保存するキャプションキャッシュ（容量超過時は最終利用が古い順に削除）"""
+
+    TABLE = "captions"
+    KEY = "key"
+    COLUMNS = "captions TEXT NOT NULL, created_at REAL NOT NULL"
+    STATS = ("hits", "misses")
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    def get(self, key):
+        """保存済みのキャプションのリストを返す（なければ None）。hits は再利用したキャプションの件数"""
+        with self._lock:
+            row = self._select(key, "captions")
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            captions = json.loads(row[0])
+            self._stats["hits"] += len(captions)
+        return captions
+
+    def put(self, key, captions):
+        now = time.time()
+        data = json.dumps(list(captions), ensure_ascii=False)
+        self._put({"key": key, "captions": data, "created_at": now, "accessed_at": now,
+                   "size": len(data.encode("utf-8"))})
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_caption_cache():
+    """
+    プロセス共有のキャプションキャッシュを返す
+    環境変数 CAPTION_CACHE_DIR / CAPTION_CACHE_MAX_MB で設定を変更できる
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_dir = Path(os.environ.get("CAPTION_CACHE_DIR") or DEFAULT_CACHE_DIR)
+            max_mb = float(os.environ.get("CAPTION_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+            _cache = CaptionCache(cache_dir / "captions.sqlite3",
+                                  max_bytes=int(max_mb * 1024 * 1024))
+        return _cache
@@ -0,0 +1,417 @@
+"""
+キャプション生成（API の呼び出しは igcaption.llm のプロバイダー経由）
+クライアント固有の静的プロンプトと投稿ごとのプロンプトを組み立て、
+1件ずつ、または同じエントリの複数投稿をまとめて生成する
+"""
+
+import functools
+import json
+import re
+
+from igcaption.caption_cache import caption_cache_key, get_caption_cache
+from igcaption.llm import GenerationRequest, get_provider
+from igcaption.models import model_settings
+from igcaption.prompt_budget import PromptSection, assemble_prompt, split_samples
+from igcaption.ratelimit import (call_with_backoff, count_tokens, estimate_tokens,
+                                  OUTPUT_TOKEN_ALLOWANCE)
+from igcaption.telemetry import span
+
+# バリエーション（同じ投稿を複数回出すとき）の切り口例
+VARIATION_ANGLES = {
+    "single": ["商品の特徴紹介", "使い方・テクスチャー", "成分のこだわり", "口コミ風・体験レビュー風"],
+    "collection": ["ラインナップ紹介", "使う順番・ルーティン", "各商品の相乗効果", "朝晩の使い分け"],
+    "brand": ["ブランドストーリー", "開発のこだわり", "ユーザーへのメッセージ", "ブランドの未来像"],
+}
+
+
+def client_context_sections(profile):
+    """
+    クライアント固有の静的プロンプト（全投稿で共通）を区画ごとに組み立てる
+    サンプル投稿文はシステム指示の枠（予算の半分）を超えたとき2件目以降から削られる
+    """
+    sections = [
+        PromptSection("instructions", f"""あなたはInstagramの投稿文ライターです。
+指定されたトンマナに合わせてInstagram投稿文を作成してください。
+投稿文のみを出力してください。説明や前置きは不要です。
+
+【ブランド名】
+{profile.get('brand_name', '')}
+
+""", part="context"),
+        PromptSection("tone", profile.get('tone_instructions', ''), part="context",
+                      header="【トンマナ指示】\n", footer="\n\n"),
+        PromptSection("notes", profile.get('notes', ''), part="context",
+                      header="【注意事項】\n", footer="\n\n"),
+        PromptSection("hashtags", f"""【ハッシュタグルール】
+- 固定ハッシュタグ: {profile.get('hashtag_fixed', '')}
+- ハッシュタグ上限: {profile.get('hashtag_limit', 5)}個
+- ブランド名のハッシュタグを含めてください
+
+""", part="context"),
+        PromptSection("template", profile.get('template', ''), part="context",
+                      header="【テンプレート（キャプション末尾に必ずこの定型文を付加してください）】\n",
+                      footer="\n\n"),
+    ]
+
+    # ── サンプル ──
+    sample = profile.get("sample_captions", "").strip()
+    if sample:
+        sections.append(PromptSection(
+            "samples", sample, part="context", trim="items", items=split_samples(sample),
+            header="【サンプル投稿文（このスタイル・トーンに合わせてください）】\n", footer="\n\n"))
+    return sections
+
+
+def post_prompt_sections(entry, product_texts, profile,
+                         post_number=None, total_posts=None,
+                         seasonal_event=None, post_date=None,
+                         same_product_variation=None):
+    """
+    投稿ごとに変わる部分（タイプ・商品情報・バリエーション・季節イベント）を区画ごとに組み立てる
+    商品情報（ページ・リリース資料）は予算を超えたとき末尾から削られる
+    """
+    post_type = entry.get("type", "single")
+    sections = []
+
+    def _add(name, text, **kwargs):
+        sections.append(PromptSection(name, text, **kwargs))
+
+    # ── タイプ別指示 ──
+    input_method = entry.get("input_method", "url")
+
+    if post_type == "single":
+        _add("post_type", """【投稿タイプ: 単品紹介】
+1つの商品にフォーカスした投稿文を作成してください。
+商品名のハッシュタグも含めてください。
+
+""")
+        if input_method == "file":
+            file_text = entry.get("file_text", "")
+            pname_manual = entry.get("product_name_manual", "")
+            if pname_manual:
+                _add("product_name", f"【商品名】\n{pname_manual}\n\n")
+            _add("release_text", file_text, trim="tail",
+                 header="【リリース資料からの商品情報】\n", footer="\n")
+        else:
+            url = entry.get("url", "")
+            text = product_texts.get(url, "")
+            _add("product", text, trim="tail",
+                 header=f"【商品ページ情報】\nURL: {url}\n\n", footer="\n")
+
+    elif post_type == "collection":
+        desc = entry.get("description", "").strip()
+        _add("post_type", """【投稿タイプ: 集合カット（複数商品）】
+写真には複数の商品が写っています。
+ラインナップの魅力やスキンケアルーティンとしての使い方を紹介してください。
+個々の商品を簡潔に紹介しつつ、組み合わせて使うメリットや全体の統一感を訴求してください。
+""")
+        if desc:
+            _add("theme", f"""【写真の説明・切り口】
+{desc}
+
+""")
+        if input_method == "file":
+            file_text = entry.get("file_text", "")
+            _add("release_text", file_text, trim="tail",
+                 header="【リリース資料からの商品情報】\n", footer="\n")
+        else:
+            urls_text = entry.get("urls", "")
+            url_list = [u.strip() for u in urls_text.strip().split("\n") if u.strip()]
+            for j, url in enumerate(url_list):
+                text = product_texts.get(url, "")
+                if text:
+                    _add(f"product_{j+1}", text, trim="tail",
+                         header=f"【商品{j+1} ページ情報】\nURL: {url}\n\n", footer="\n\n")
+
+    elif post_type == "brand":
+        desc = entry.get("description", "").strip()
+        brand_concept = profile.get("brand_concept", "").strip()
+        _add("post_type", """【投稿タイプ: ブランドコンセプト】
+ブランド全体のコンセプト、世界観、こだわりを紹介する投稿文を作成してください。
+特定の商品名ではなく、ブランドとしての価値観・ストーリーを伝えてください。
+""")
+        if brand_concept:
+            _add("brand_concept", f"""【ブランドコンセプト情報】
+{brand_concept}
+
+""")
+        if desc:
+            _add("theme", f"""【投稿の切り口・テーマ】
+{desc}
+
+""")
+
+    # ── 投稿番号 ──
+    if post_number is not None and total_posts is not None:
+        _add("position", f"""【投稿位置】
+この投稿は全{total_posts}投稿中の第{post_number}投稿目です。
+""")
+
+    # ── バリエーション ──
+    if same_product_variation is not None and same_product_variation > 1:
+        examples = "、".join(
+            f"{n}回目→{angle}"
+            for n, angle in enumerate(VARIATION_ANGLES.get(post_type, VARIATION_ANGLES["single"]), 1))
+        if post_type == "brand":
+            _add("variation", f"""【バリエーション指示】
+ブランドコンセプト投稿の{same_product_variation}回目です。
+前回とは異なる切り口で作成してください。
+例: {examples}
+""")
+        elif post_type == "collection":
+            _add("variation", f"""【バリエーション指示】
+この組み合わせの{same_product_variation}回目の投稿です。
+前回とは異なる切り口で作成してください。
+例: {examples}
+""")
+        else:
+            _add("variation", f"""【バリエーション指示】
+この商品は複数回投稿されます。今回は{same_product_variation}回目の投稿です。
+前回とは異なる切り口・訴求ポイントで作成してください。
+例: {examples}
+""")
+
+    # ── 季節イベント ──
+    if seasonal_event and post_date:
+        date_str = post_date.strftime("%m/%d")
+        _add("seasonal", f"""【季節イベント連動】
+投稿予定日: {date_str}
+関連する季節イベント: {seasonal_event}
+投稿文の冒頭や導入部分で、このイベント・季節感を自然に絡めてください。
+ただし、商品/ブランド紹介がメインであることを忘れずに。
+""")
+
+    return sections
+
+
+def generate_caption(entry, product_texts, profile, api_key,
+                     post_number=None, total_posts=None,
+                     seasonal_event=None, post_date=None,
+                     same_product_variation=None, limiter=None, on_retry=None,
+                     on_chunk=None, budget=None, use_cache=True, provider=None):
+    """
+    entry: 投稿エントリ情報 (type, url, urls, description, count)
+    product_texts: dict of {url: text} 取得済みページテキスト
+    limiter: 共有 RateLimiter（並列生成時にスケジューラから渡される）
+    on_retry: 429 でリトライする前に呼ばれるコールバック
+    on_chunk: ストリーミング生成時に途中経過のテキストを受け取るコールバック
+    budget: プロンプトのトークン予算（省略時は PROMPT_TOKEN_BUDGET か既定値）
+    use_cache: False なら同じプロンプトの生成結果があっても使わずに生成し直す（結果は保存する）
+    provider: 生成に使うプロバイダー（省略時は get_provider()）
+    """
+    context, prompt = assemble_prompt(
+        client_context_sections(profile),
+        post_prompt_sections(
+            entry, product_texts, profile,
+            post_number=post_number, total_posts=total_posts,
+            seasonal_event=seasonal_event, post_date=post_date,
+            same_product_variation=same_product_variation),
+        budget, label=f"#{post_number}" if post_number is not None else "")
+    model_name, config = model_settings(profile)
+    provider = provider or get_provider()
+    request = GenerationRequest(prompt, model_name, config, system_instruction=context,
+                                api_key=api_key)
+
+    with span("generate", client=profile.get("name", ""), model=model_name,
+              provider=provider.name, posts=1, post_numbers=[post_number]) as stats:
+        # 入力が前回と同じなら生成済みのキャプションを使う
+        cache = get_caption_cache() if provider.cache_captions else None
+        key = caption_cache_key(model_name, config, context, prompt)
+        cached = cache.get(key) if cache and use_cache else None
+        if cached:
+            stats["cache"] = "hit"
+            if on_chunk:
+                on_chunk(cached[0])
+            return cached[0]
+        stats["cache"] = "miss" if cache and use_cache else "off"
+
+        # リトライ処理（429 を受けたときだけバックオフ）
+        text = call_with_backoff(lambda: provider.generate(request, on_chunk, usage=stats),
+                                 limiter=limiter if provider.rate_limited else None,
+                                 tokens=estimate_tokens(context + prompt),
+                                 on_retry=on_retry, stats=stats)
+        _estimate_usage(stats, context + prompt, text)
+        if cache:
+            cache.put(key, [text])
+        return text
+
+
+def _estimate_usage(stats, prompt, text):
+    """API がトークン数を返さなかった場合は概算値で埋める"""
+    if "prompt_tokens" not in stats:
+        stats["prompt_tokens"] = count_tokens(prompt)
+        stats["response_tokens"] = count_tokens(text)
+        stats["tokens_estimated"] = True
+
+
+# ── まとめて生成（同じエントリの複数投稿を1リクエストで）──────
+BATCH_RESPONSE_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "slot": {"type": "integer"},
+                "caption": {"type": "string"},
+            },
+            "required": ["slot", "caption"],
+        },
+    },
+}
+
+
+def batch_prompt_sections(entry, product_texts, profile, slots):
+    """
+    slots: list of dict (post_number, total_posts, post_date, seasonal_event)
+    商品情報は1回だけ載せ、slots の件数分の投稿文を異なる切り口でまとめて依頼する
+    """
+    post_type = entry.get("type", "single")
+    sections = post_prompt_sections(entry, product_texts, profile)
+    angles = "、".join(VARIATION_ANGLES.get(post_type, VARIATION_ANGLES["single"]))
+    slots_text = f"""【まとめて作成する投稿】
+上記の内容で、以下の{len(slots)}件の投稿文をまとめて作成してください。
+{len(slots)}件はそれぞれ異なる切り口・訴求ポイントにし、内容が重複しないようにしてください。
+切り口の例: {angles}
+"""
+    for k, slot in enumerate(slots, 1):
+        line = f"- slot {k}"
+        if slot.get("post_number") is not None and slot.get("total_posts") is not None:
+            line += f": 全{slot['total_posts']}投稿中の第{slot['post_number']}投稿目"
+        if slot.get("seasonal_event") and slot.get("post_date"):
+            line += (f"（投稿予定日 {slot['post_date'].strftime('%m/%d')}、"
+                     f"季節イベント「{slot['seasonal_event']}」を冒頭や導入部分で自然に絡める。"
+                     "ただし商品/ブランド紹介がメイン）")
+        slots_text += line + "\n"
+    sections.append(PromptSection("slots", slots_text))
+    sections.append(PromptSection("output_format", f"""
+【出力形式】
+JSON配列で出力してください: [{{"slot": 1, "caption": "投稿文"}}, ...]
+slot は上記の番号（1〜{len(slots)}）、caption はそれぞれ単体で完結した投稿文（テンプレート・ハッシュタグを含む）です。
+"""))
+    return sections
+
+
+def parse_batch_captions(text, count):
+    """バッチ応答（JSON）を slot 順のキャプションリストに変換する。件数が合わなければ ValueError"""
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("バッチ応答が配列ではありません")
+    captions = {}
+    for item in data:
+        if isinstance(item, dict) and isinstance(item.get("caption"), str):
+            slot = item.get("slot")
+            if isinstance(slot, int) and 1 <= slot <= count and slot not in captions:
+                captions[slot] = item["caption"].strip()
+    if len(captions) != count:
+        raise ValueError(f"バッチ応答の件数が一致しません（{len(captions)}/{count}）")
+    return [captions[k] for k in range(1, count + 1)]
+
+
+_CAPTION_FIELD = re.compile(r'"caption"\s*:\s*"((?:[^"\\]|\\.)*)')
+_SLOT_FIELD = re.compile(r'"slot"\s*:\s*(\d+)')
+
+
+def partial_batch_captions(text, count):
+    """
+    受信途中のバッチ応答（JSON）から、書きかけを含む各 slot のキャプションを取り出す
+    返り値: {slot番号: キャプション}
+    """
+    captions = {}
+    matches = list(_CAPTION_FIELD.finditer(text))
+    # "slot" が "caption" の前後どちらに来るかは最初のオブジェクトで判定する
+    slot_first = bool(matches) and _SLOT_FIELD.search(text, 0, matches[0].start()) is not None
+    for n, m in enumerate(matches, 1):
+        if slot_first:
+            start = matches[n - 2].end() if n > 1 else 0
+            slot_m = _SLOT_FIELD.search(text, start, m.start())
+        else:
+            end = matches[n].start() if n < len(matches) else len(text)
+            slot_m = _SLOT_FIELD.search(text, m.end(), end)
+        slot = int(slot_m.group(1)) if slot_m else n
+        try:
+            caption = json.loads(f'"{m.group(1)}"')
+        except ValueError:
+            # \uXXXX の途中で切れている場合など。次のチャンクで取り直す
+            continue
+        if 1 <= slot <= count:
+            captions[slot] = caption
+    return captions
+
+
+def generate_caption_batch(entry, product_texts, profile, api_key, slots,
+                           limiter=None, on_retry=None, on_chunk=None, budget=None,
+                           use_cache=True, provider=None):
+    """
+    同じエントリの複数投稿を1リクエストで生成し、slots 順のキャプションリストを返す
+    on_chunk(k, text) には受信途中の各投稿（k は slots 内の位置）が渡される
+    同じプロンプトの生成結果がキャッシュにあれば、use_cache=False でない限りそれを返す
+    """
+    numbers = [slot.get("post_number") for slot in slots if slot.get("post_number") is not None]
+    context, prompt = assemble_prompt(
+        client_context_sections(profile),
+        batch_prompt_sections(entry, product_texts, profile, slots),
+        budget, label=",".join(f"#{n}" for n in numbers))
+    model_name, config = model_settings(profile)
+    config = {**config, **BATCH_RESPONSE_CONFIG}
+    provider = provider or get_provider()
+    request = GenerationRequest(prompt, model_name, config, system_instruction=context,
+                                api_key=api_key)
+
+    with span("generate", client=profile.get("name", ""), model=model_name,
+              provider=provider.name, posts=len(slots), post_numbers=numbers, batch=True) as stats:
+        cache = get_caption_cache() if provider.cache_captions else None
+        key = caption_cache_key(model_name, config, context, prompt)
+        cached = cache.get(key) if cache and use_cache else None
+        if cached and len(cached) == len(slots):
+            stats["cache"] = "hit"
+            if on_chunk:
+                for k, caption in enumerate(cached):
+                    on_chunk(k, caption)
+            return cached
+        stats["cache"] = "miss" if cache and use_cache else "off"
+
+        tokens = estimate_tokens(context + prompt) + OUTPUT_TOKEN_ALLOWANCE * (len(slots) - 1)
+
+        def _on_stream(text):
+            for slot, caption in partial_batch_captions(text, len(slots)).items():
+                on_chunk(slot - 1, caption)
+
+        stream = _on_stream if on_chunk else None
+
+        text = call_with_backoff(lambda: provider.generate(request, stream, usage=stats),
+                                 limiter=limiter if provider.rate_limited else None,
+                                 tokens=tokens, on_retry=on_retry, stats=stats)
+        _estimate_usage(stats, context + prompt, text)
+        captions = parse_batch_captions(text, len(slots))
+        if cache:
+            cache.put(key, captions)
+        return captions
+
+
+def generate_captions_for_group(entry, product_texts, profile, api_key, slots,
+                                limiter=None, on_retry=None, on_chunk=None, budget=None,
+                                use_cache=True, provider=None):
+    """
+    エントリ1件分の投稿をまとめて生成する
+    2件以上はバッチで依頼し、応答が壊れていた場合は1件ずつの生成にフォールバックする
+    on_chunk(k, text) を渡すとストリーミングで途中経過を受け取れる（k は slots 内の位置）
+    """
+    if len(slots) > 1:
+        try:
+            return generate_caption_batch(entry, product_texts, profile, api_key, slots,
+                                          limiter=limiter, on_retry=on_retry, on_chunk=on_chunk,
+                                          budget=budget, use_cache=use_cache, provider=provider)
+        except ValueError:
+            pass
+    captions = []
+    for k, slot in enumerate(slots):
+        captions.append(generate_caption(
+            entry, product_texts, profile, api_key,
+            post_number=slot.get("post_number"), total_posts=slot.get("total_posts"),
+            seasonal_event=slot.get("seasonal_event"), post_date=slot.get("post_date"),
+            same_product_variation=slot.get("variation"),
+            limiter=limiter, on_retry=on_retry,
+            on_chunk=functools.partial(on_chunk, k) if on_chunk else None,
+            budget=budget, use_cache=use_cache, provider=provider))
+    return captions
@@ -0,0 +1,422 @@
+"""
+コマンドラインからの一括生成（Streamlit を使わない）
+
+    python -m igcaption --client toutvert --plan plan.json --start 2026-11-02 --weekdays 月,木
+    python -m igcaption --manifest jobs.json   # 複数クライアントを並行して生成
+
+プランファイルは build_assignments に渡す商品エントリの JSON / CSV
+  - JSON: エントリのリスト、または {"products": [...], "events": {"投稿番号": "イベント名"}}
+  - CSV: type, url, urls, description, count, input_method, file_path, product_name_manual 列
+         （urls は改行または | 区切り、file_path はリリース資料 PDF/Excel のパス）
+設定は環境変数から読む（GEMINI_API_KEY, GITHUB_TOKEN / GITHUB_REPO / GITHUB_BRANCH,
+GEMINI_RPM / GEMINI_TPM / GENERATION_CONCURRENCY / PROMPT_TOKEN_BUDGET / LLM_PROVIDER / LLM_CASSETTE）
+複数クライアントを指定した場合も、商品ページの取得は共通の URL を1回にまとめ、
+生成は全クライアントで1つのレート制限枠を共有して交互に進める
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+from igcaption.llm import PROVIDERS, configure_provider
+from igcaption.ratelimit import DEFAULT_RPM, DEFAULT_TPM, DEFAULT_CONCURRENCY
+from igcaption.schedule import WEEKDAY_NAMES, POST_TYPES, generate_schedule_weekday
+from igcaption.storage import LocalClientStore, get_github_store
+from igcaption.telemetry import RunTelemetry, collect, summary_lines, telemetry_path
+
+CLIENTS_DIR = Path(__file__).resolve().parent.parent / "clients"
+DEFAULT_GITHUB_REPO = "fukudafukuo/instagram-caption-generator"
+
+OUTPUT_FORMATS = ("xlsx", "json", "csv", "tsv", "jsonl")
+DEFAULT_FORMATS = ("xlsx", "json")
+
+_WEEKDAY_ALIASES = {
+    **{name: i for i, name in enumerate(WEEKDAY_NAMES)},
+    **{name: i for i, name in enumerate(["mon", "tue", "wed", "thu", "fri", "sat", "sun"])},
+}
+
+
+def _log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def parse_weekdays(value):
+    """「月,木」「mon,thu」「0,3」のいずれかの形式を曜日番号（月曜=0）のリストにする"""
+    weekdays = []
+    for part in value.replace("、", ",").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if part.isdigit() and int(part) < 7:
+            day = int(part)
+        elif part[:3] in _WEEKDAY_ALIASES:
+            day = _WEEKDAY_ALIASES[part[:3]]
+        elif part[:1] in _WEEKDAY_ALIASES:
+            day = _WEEKDAY_ALIASES[part[:1]]
+        else:
+            raise argparse.ArgumentTypeError(f"曜日を解釈できません: {part}")
+        if day not in weekdays:
+            weekdays.append(day)
+    if not weekdays:
+        raise argparse.ArgumentTypeError("曜日を1つ以上指定してください")
+    return sorted(weekdays)
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日付は YYYY-MM-DD 形式で指定してください: {value}")
+
+
+def _normalize_entry(raw, base_dir):
+    """プランの1行をアプリの商品エントリと同じ形にそろえる。(entry, error) を返す"""
+    entry = {
+        "type": (raw.get("type") or "single").strip(),
+        "url": (raw.get("url") or "").strip(),
+        "urls": "\n".join(u.strip() for u in str(raw.get("urls") or "").replace("|", "\n").split("\n")
+                          if u.strip()),
+        "description": raw.get("description") or "",
+        "count": int(raw.get("count") or 1),
+        "input_method": (raw.get("input_method") or "").strip(),
+        "file_text": raw.get("file_text") or "",
+        "file_name": raw.get("file_name") or "",
+    }
+    if raw.get("product_name_manual"):
+        entry["product_name_manual"] = raw["product_name_manual"]
+    if entry["type"] not in POST_TYPES:
+        return None, f"未対応の投稿タイプです: {entry['type']}"
+
+    file_path = (raw.get("file_path") or "").strip()
+    if file_path:
+        from igcaption.extract import extract_text_from_file
+
+        path = Path(file_path)
+        if not path.is_absolute():
+            path = base_dir / path
+        try:
+            with open(path, "rb") as fp:
+                text, err = extract_text_from_file(fp)
+        except OSError as e:
+            return None, f"{file_path}: {e}"
+        if err:
+            return None, f"{file_path}: {err}"
+        entry["file_text"] = text
+        entry["file_name"] = entry["file_name"] or path.name
+    if not entry["input_method"]:
+        entry["input_method"] = "file" if entry["file_text"] else "url"
+    return entry, None
+
+
+def load_plan(path):
+    """プランファイルを読み込み、(products, events, error) を返す。events は {投稿番号: イベント名}"""
+    path = Path(path)
+    try:
+        if path.suffix.lower() == ".csv":
+            with open(path, encoding="utf-8-sig", newline="") as fp:
+                rows, events = list(csv.DictReader(fp)), {}
+        else:
+            with open(path, encoding="utf-8") as fp:
+                data = json.load(fp)
+            if isinstance(data, dict):
+                rows, events = data.get("products", []), data.get("events", {})
+            else:
+                rows, events = data, {}
+    except (OSError, ValueError) as e:
+        return None, None, f"プランファイルを読み込めません: {e}"
+
+    products = []
+    for n, raw in enumerate(rows, 1):
+        try:
+            entry, err = _normalize_entry(raw, path.parent)
+        except (TypeError, ValueError) as e:
+            entry, err = None, str(e)
+        if err:
+            return None, None, f"{n}件目のエントリ: {err}"
+        products.append(entry)
+    if not products:
+        return None, None, "プランファイルにエントリがありません"
+    return products, {int(k): v for k, v in events.items() if v}, None
+
+
+def load_profile(client_id):
+    """クライアントプロフィールを読み込む（GITHUB_TOKEN があれば GitHub から）"""
+    token = os.environ.get("GITHUB_TOKEN")
+    if token:
+        store = get_github_store(token, os.environ.get("GITHUB_REPO") or DEFAULT_GITHUB_REPO,
+                                 os.environ.get("GITHUB_BRANCH") or "main")
+    else:
+        store = LocalClientStore(CLIENTS_DIR)
+    return store.load(client_id)
+
+
+def build_spec(client_id, plan_path, start, weekdays, batch_mode=True):
+    """クライアント1件分の生成内容を組み立てる。(job, error) を返す"""
+    profile, err = load_profile(client_id)
+    if err or profile is None:
+        return None, f"クライアント {client_id} を読み込めません{': ' + err if err else ''}"
+
+    products, events, err = load_plan(plan_path)
+    if err:
+        return None, f"{client_id}: {err}"
+
+    total_posts = sum(p["count"] for p in products)
+    schedule_dates = generate_schedule_weekday(total_posts, start, weekdays)
+    spec = {
+        "profile": profile,
+        "products": products,
+        "total_posts": total_posts,
+        "schedule_dates": [d.isoformat() for d in schedule_dates],
+        "post_events": [(bool(events.get(n)), events.get(n, "")) for n in range(1, total_posts + 1)],
+        "batch_mode": batch_mode,
+    }
+    return {"client_id": client_id, "spec": spec, "schedule_dates": schedule_dates}, None
+
+
+def load_manifest(path):
+    """
+    複数クライアント分のジョブ一覧を読み込み、(jobs, error) を返す
+    JSON のリスト（または {"jobs": [...]}）で、各要素は
+    {"client": ID, "plan": プランファイル, "start": "YYYY-MM-DD", "weekdays": "月,木", "no_batch": false}
+    """
+    path = Path(path)
+    try:
+        with open(path, encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError) as e:
+        return None, f"ジョブ一覧を読み込めません: {e}"
+    items = data.get("jobs", []) if isinstance(data, dict) else data
+
+    jobs = []
+    for n, item in enumerate(items, 1):
+        try:
+            weekdays = item["weekdays"]
+            if isinstance(weekdays, list):
+                weekdays = ",".join(str(w) for w in weekdays)
+            plan = Path(item["plan"])
+            job, err = build_spec(
+                item["client"], plan if plan.is_absolute() else path.parent / plan,
+                _parse_date(item["start"]), parse_weekdays(weekdays),
+                batch_mode=not item.get("no_batch", False))
+        except KeyError as e:
+            err = f"{n}件目のジョブに {e} がありません"
+        except (TypeError, argparse.ArgumentTypeError) as e:
+            err = f"{n}件目のジョブ: {e}"
+        if err:
+            return None, err
+        jobs.append(job)
+    if not jobs:
+        return None, "ジョブ一覧が空です"
+    return jobs, None
+
+
+def parse_formats(value):
+    formats = [f.strip().lower() for f in value.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"出力形式は {', '.join(OUTPUT_FORMATS)} から選んでください: {value}")
+    return formats
+
+
+def write_outputs(out_dir, client_id, profile, results, schedule_dates, errors,
+                  formats=DEFAULT_FORMATS):
+    """指定された形式の結果ファイルを書き出し、パスのリストを返す"""
+    client_label = profile.get("name") or client_id
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"instagram_captions_{client_label}_{len(results)}posts"
+    paths = []
+
+    if "xlsx" in formats:
+        from igcaption.xlsx import create_xlsx_schedule
+
+        path = out_dir / f"{stem}.xlsx"
+        path.write_bytes(create_xlsx_schedule(results, schedule_dates, client_label).getvalue())
+        paths.append(path)
+
+    if "csv" in formats or "tsv" in formats or "jsonl" in formats:
+        from igcaption.export import write_csv, iter_jsonl
+
+        # CSV は Excel で文字化けしないよう BOM 付き
+        for fmt, delimiter, encoding in (("csv", ",", "utf-8-sig"), ("tsv", "\t", "utf-8")):
+            if fmt in formats:
+                path = out_dir / f"{stem}.{fmt}"
+                with open(path, "w", encoding=encoding, newline="") as fp:
+                    write_csv(results, schedule_dates, fp, delimiter=delimiter)
+                paths.append(path)
+        if "jsonl" in formats:
+            path = out_dir / f"{stem}.jsonl"
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.writelines(iter_jsonl(results, schedule_dates))
+            paths.append(path)
+
+    if "json" not in formats:
+        return paths
+    json_path = out_dir / f"{stem}.json"
+    paths.append(json_path)
+    with open(json_path, "w", encoding="utf-8") as fp:
+        json.dump({
+            "client_id": client_id,
+            "client_name": client_label,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "posts": [
+                {
+                    "post_number": i + 1,
+                    "date": schedule_dates[i].isoformat(),
+                    "post_type": item["post_type_label"],
+                    "product_name": item["product_name"],
+                    "url": item["url"],
+                    "seasonal_event": item["seasonal_event"],
+                    "caption": item["caption"] if i not in errors else "",
+                    "error": errors.get(i),
+                }
+                for i, item in enumerate(results)
+            ],
+        }, fp, ensure_ascii=False, indent=2)
+    return paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m igcaption",
+        description="Instagram投稿文を一括生成し、クライアントごとに xlsx と JSON に書き出す")
+    parser.add_argument("--client", help="クライアントID（clients/<ID>.json）")
+    parser.add_argument("--plan", help="商品エントリのプランファイル（JSON / CSV）")
+    parser.add_argument("--start", type=_parse_date, help="配信開始日（YYYY-MM-DD）")
+    parser.add_argument("--weekdays", type=parse_weekdays,
+                        help="投稿曜日（例: 月,木 / mon,thu / 0,3）")
+    parser.add_argument("--manifest",
+                        help="複数クライアント分のジョブ一覧（JSON）。指定時は --client 等の代わりに使う")
+    parser.add_argument("--out-dir", default="output", help="出力先ディレクトリ（既定: output）")
+    parser.add_argument("--concurrency", type=int,
+                        default=int(os.environ.get("GENERATION_CONCURRENCY") or DEFAULT_CONCURRENCY),
+                        help="同時に送る生成リクエスト数（全クライアント合計）")
+    parser.add_argument("--rpm", type=int, default=int(os.environ.get("GEMINI_RPM") or DEFAULT_RPM),
+                        help="1分あたりのリクエスト上限（全クライアント合計）")
+    parser.add_argument("--tpm", type=int, default=int(os.environ.get("GEMINI_TPM") or DEFAULT_TPM),
+                        help="1分あたりのトークン上限（全クライアント合計）")
+    parser.add_argument("--prompt-budget", type=int,
+                        default=int(os.environ.get("PROMPT_TOKEN_BUDGET") or 0) or None,
+                        help="1投稿あたりのプロンプトのトークン上限（超えた分はサンプル・商品情報から削る）")
+    parser.add_argument("--formats", type=parse_formats, default=list(DEFAULT_FORMATS),
+                        help=f"出力形式（カンマ区切り: {', '.join(OUTPUT_FORMATS)}。既定: xlsx,json）")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="同じ商品の投稿をまとめずに1件ずつ生成する")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="生成済みキャプションを再利用せず、すべての投稿を生成し直す")
+    parser.add_argument("--provider", choices=PROVIDERS,
+                        help="生成プロバイダー（既定: LLM_PROVIDER か gemini）。record / replay はカセットに"
+                             "応答を記録・再生し、offline は API を使わずに決まった文面を返す")
+    parser.add_argument("--cassette", type=Path,
+                        help="record / replay のカセット（既定: LLM_CASSETTE か .cache/cassette.jsonl）")
+    parser.add_argument("--telemetry", type=Path, default=None,
+                        help="実行の計測結果（段階ごとの所要時間・トークン数など）を追記する JSONL"
+                             "（既定: TELEMETRY_PATH か .cache/telemetry.jsonl）")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="投稿ごとのプロンプトのトークン内訳などを表示する")
+    return parser
+
+
+def main(argv=None):
+    """終了コード: 0 = 成功 / 1 = 生成エラーの投稿あり / 2 = 入力・設定エラー"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    single = (args.client, args.plan, args.start, args.weekdays)
+    if args.manifest and any(v is not None for v in single):
+        parser.error("--manifest と --client / --plan / --start / --weekdays は同時に指定できません")
+    if not args.manifest and any(v is None for v in single):
+        parser.error("--client / --plan / --start / --weekdays（または --manifest）を指定してください")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s")
+
+    try:
+        provider = configure_provider(args.provider, args.cassette)
+    except ValueError as e:
+        _log(str(e))
+        return 2
+    # offline / replay では API キーを使わない（未設定なら空のまま渡す）
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if provider.requires_api_key and not api_key:
+        _log("環境変数 GEMINI_API_KEY を設定してください")
+        return 2
+
+    # リリース資料の抽出から書き出しまでを計測する
+    telemetry = RunTelemetry()
+    with collect(telemetry):
+        code = _run(args, api_key, telemetry)
+    if telemetry.events:
+        for line in summary_lines(telemetry.to_dict()):
+            _log(f"⏱ {line}")
+        try:
+            _log(f"📊 {telemetry.write_jsonl(args.telemetry or telemetry_path())}")
+        except OSError as e:
+            _log(f"計測結果を書き込めませんでした: {e}")
+    return code
+
+
+def _run(args, api_key, telemetry):
+    if args.manifest:
+        jobs, err = load_manifest(args.manifest)
+    else:
+        job, err = build_spec(args.client, args.plan, args.start, args.weekdays,
+                              batch_mode=not args.no_batch)
+        jobs = [job]
+    if err:
+        _log(err)
+        return 2
+
+    # 生成系のモジュール（google.generativeai）は入力の検証が済んでから読み込む
+    from igcaption.caption_cache import get_caption_cache
+    from igcaption.pipeline import caption_cache_message, run_meta, run_specs
+
+    total_posts = sum(job["spec"]["total_posts"] for job in jobs)
+    errors = [{} for _ in jobs]
+    done = [0]
+
+    def _on_post(n, index, caption, error):
+        done[0] += 1
+        if error:
+            errors[n][index] = error
+            _log(f"❌ {jobs[n]['client_id']} #{index + 1}: {error}")
+
+    def _on_plan(n, plan):
+        for warning in plan["warnings"]:
+            _log(f"❌ {jobs[n]['client_id']}: {warning}")
+
+    for job in jobs:
+        job["spec"]["prompt_budget"] = args.prompt_budget
+        job["spec"]["use_cache"] = not args.no_cache
+        dates = job["schedule_dates"]
+        _log(f"{job['spec']['profile'].get('name') or job['client_id']}: "
+             f"{job['spec']['total_posts']}投稿 ({dates[0].isoformat()} 〜 {dates[-1].isoformat()})")
+    telemetry.meta.update(run_meta([job["spec"] for job in jobs], concurrency=args.concurrency,
+                                   rpm=args.rpm, tpm=args.tpm))
+    stats_before = get_caption_cache().stats()
+    outcomes = run_specs(
+        [job["spec"] for job in jobs], api_key,
+        concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm,
+        on_plan=_on_plan, on_post=_on_post,
+        on_message=lambda text: _log(f"[{done[0]}/{total_posts}] {text}"))
+    reused = caption_cache_message(stats_before, get_caption_cache().stats())
+    if reused:
+        _log(reused.strip("（）"))
+
+    failed = False
+    for job, (results, err), post_errors in zip(jobs, outcomes, errors):
+        if err:
+            _log(f"❌ {job['client_id']}: {err}")
+            failed = True
+            continue
+        paths = write_outputs(args.out_dir, job["client_id"], job["spec"]["profile"],
+                              results, job["schedule_dates"], post_errors, args.formats)
+        for path in paths:
+            _log(f"✅ {path}")
+        failed = failed or bool(post_errors)
+    return 1 if failed else 0
@@ -0,0 +1,91 @@
+"""
+テキスト形式での書き出し（xlsx を作らずに済む軽量な出力）
+- CSV / TSV: 一覧表と同じ縦並び（1行ずつ順に書き出す）
+- 貼り付け用 TSV: 配信原稿と同じ横並び（改行を含むキャプションは引用符で囲む）
+- JSON Lines: 1投稿1行の JSON
+"""
+
+import csv
+import io
+import json
+
+from igcaption.xlsx import format_post_date
+
+LIST_HEADERS = ["No.", "投稿日", "タイプ", "商品名", "商品URL", "季節イベント", "キャプション"]
+
+
+class _LineBuffer:
+    """csv.writer の出力を1行ずつ取り出すためのバッファ"""
+
+    def __init__(self):
+        self.value = ""
+
+    def write(self, text):
+        self.value += text
+
+    def pop(self):
+        value, self.value = self.value, ""
+        return value
+
+
+def _list_rows(results, schedule_dates):
+    for i, item in enumerate(results):
+        yield [
+            i + 1,
+            format_post_date(schedule_dates, i),
+            item.get("post_type_label", ""),
+            item.get("product_name", ""),
+            item.get("url", ""),
+            item.get("seasonal_event", ""),
+            item.get("caption", ""),
+        ]
+
+
+def iter_csv(results, schedule_dates, delimiter=","):
+    """一覧表の形式で CSV（delimiter="\\t" なら TSV）を1行ずつ返す"""
+    buf = _LineBuffer()
+    writer = csv.writer(buf, delimiter=delimiter, lineterminator="\r\n")
+    writer.writerow(LIST_HEADERS)
+    yield buf.pop()
+    for row in _list_rows(results, schedule_dates):
+        writer.writerow(row)
+        yield buf.pop()
+
+
+def write_csv(results, schedule_dates, fp, delimiter=","):
+    """テキストモードのファイルに CSV / TSV を書き出す"""
+    for line in iter_csv(results, schedule_dates, delimiter):
+        fp.write(line)
+
+
+def clipboard_tsv(results, schedule_dates):
+    """
+    配信原稿シートと同じ横並びの TSV を返す（Google スプレッドシートにそのまま貼り付けられる）
+    改行を含むセルは引用符で囲むため、キャプションの改行は1つのセル内に保たれる
+    """
+    rows = [
+        ["投稿番号"] + [i + 1 for i in range(len(results))],
+        ["投稿日"] + [format_post_date(schedule_dates, i) for i in range(len(results))],
+        ["投稿タイプ"] + [item.get("post_type_label", "") for item in results],
+        ["商品名"] + [item.get("product_name", "") for item in results],
+        ["商品URL（ストーリー用）"] + [item.get("url", "") for item in results],
+        ["Instagram配信原稿"] + [item.get("caption", "") for item in results],
+        ["季節イベント"] + [item.get("seasonal_event", "") for item in results],
+    ]
+    buf = io.StringIO()
+    csv.writer(buf, delimiter="\t", lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+def iter_jsonl(results, schedule_dates):
+    """1投稿1行の JSON Lines を返す（日付は ISO 形式）"""
+    for i, item in enumerate(results):
+        yield json.dumps({
+            "post_number": i + 1,
+            "date": schedule_dates[i].isoformat() if i < len(schedule_dates) else None,
+            "post_type": item.get("post_type_label", ""),
+            "product_name": item.get("product_name", ""),
+            "url": item.get("url", ""),
+            "seasonal_event": item.get("seasonal_event", ""),
+            "caption": item.get("caption", ""),
+        }, ensure_ascii=False) + "\n"
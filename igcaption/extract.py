@@ -0,0 +1,144 @@
+"""
+リリース資料（PDF / Excel）からのテキスト抽出
+文字数の上限に達した時点で解析を打ち切り、
+抽出結果はファイル内容のハッシュをキーにキャッシュして同じ資料は一度だけ解析する
+"""
+
+import re
+
+import pdfplumber
+from openpyxl import load_workbook
+
+from igcaption.fetch import MAX_TEXT_CHARS, truncate_text
+from igcaption.extract_cache import content_key, get_extraction_cache
+from igcaption.telemetry import span
+
+
+class _TextBudget:
+    """抽出テキストを文字数上限まで積み上げ、上限に達したら以降の解析を打ち切るための入れ物"""
+
+    def __init__(self, limit, sep):
+        self.limit = limit
+        self.sep = sep
+        self.parts = []
+        self._raw_len = 0
+
+    def add(self, part):
+        self.parts.append(part)
+        self._raw_len += len(part) + len(self.sep)
+
+    @property
+    def full(self):
+        """これ以上追加しても出力が変わらない（切り詰め位置を超えた）かどうか"""
+        if self._raw_len <= self.limit:
+            return False
+        return len(re.sub(r"\n{3,}", "\n\n", self.sep.join(self.parts))) > self.limit
+
+    def text(self):
+        return truncate_text(self.sep.join(self.parts), self.limit)
+
+
+def extract_text_from_pdf(uploaded_file, max_chars=MAX_TEXT_CHARS, pages=None):
+    """
+    アップロードされたPDFファイルからテキストを抽出する
+    ページを順に処理し、max_chars に達した時点で残りのページ（表抽出を含む）は読まない
+    pages: 対象ページ番号（1始まり）のリスト。省略時は全ページ
+    """
+    try:
+        budget = _TextBudget(max_chars, "\n\n")
+        with pdfplumber.open(uploaded_file, pages=pages) as pdf:
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    budget.add(page_text)
+                # テーブルがあれば抽出（本文だけで上限に達したページはスキップ）
+                if not budget.full:
+                    for table in page.extract_tables():
+                        for row in table:
+                            cells = [str(c) if c else "" for c in row]
+                            budget.add(" | ".join(cells))
+                page.close()
+                if budget.full:
+                    break
+        return budget.text(), None
+    except Exception as e:
+        return None, f"PDF読み取りエラー: {e}"
+    finally:
+        uploaded_file.seek(0)
+
+
+def extract_text_from_excel(uploaded_file, max_chars=MAX_TEXT_CHARS):
+    """
+    アップロードされたExcelファイルからテキストを抽出する
+    読み取り専用モードで行を順に読み、空行は読み飛ばし、max_chars に達したら打ち切る
+    """
+    wb = None
+    try:
+        wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+        budget = _TextBudget(max_chars, "\n")
+        for ws in wb.worksheets:
+            budget.add(f"【シート: {ws.title}】")
+            try:
+                ws.calculate_dimension()
+            except ValueError:
+                # サイズ情報のないシートは実データから範囲を求める
+                ws.reset_dimensions()
+            for row in ws.iter_rows(values_only=True):
+                if all(c is None or c == "" for c in row):
+                    continue
+                cells = [str(c) if c is not None else "" for c in row]
+                line = " | ".join(cells).strip()
+                if line:
+                    budget.add(line)
+                    if budget.full:
+                        break
+            if budget.full:
+                break
+        return budget.text(), None
+    except Exception as e:
+        return None, f"Excel読み取りエラー: {e}"
+    finally:
+        if wb is not None:
+            wb.close()
+        uploaded_file.seek(0)
+
+
+def extract_text_from_file(uploaded_file, use_cache=True, **options):
+    """
+    ファイル種別に応じてテキスト抽出を振り分ける（同一内容のファイルはキャッシュから返す）
+    options は各抽出関数にそのまま渡す（例: PDF の pages）
+    """
+    name = uploaded_file.name.lower()
+    if name.endswith(".pdf"):
+        extractor = extract_text_from_pdf
+    elif name.endswith((".xlsx", ".xls")):
+        extractor = extract_text_from_excel
+    else:
+        return None, f"未対応のファイル形式です: {name}"
+
+    with span("extract", file=uploaded_file.name) as stats:
+        text, err = _extract_cached(uploaded_file, extractor, use_cache, options, stats)
+        if err:
+            stats["error"] = err
+        return text, err
+
+
+def _extract_cached(uploaded_file, extractor, use_cache, options, stats):
+    if not use_cache:
+        stats["cache"] = "off"
+        return extractor(uploaded_file, **options)
+
+    data = uploaded_file.read()
+    uploaded_file.seek(0)
+    stats["bytes"] = len(data)
+    key = content_key(data, extractor.__name__, sorted(options.items()))
+    cache = get_extraction_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        stats["cache"] = "hit"
+        return cached, None
+    stats["cache"] = "miss"
+    text, err = extractor(uploaded_file, **options)
+    if not err:
+        cache.put(key, text)
+    return text, err
@@ -0,0 +1,99 @@
+"""
+リリース資料（PDF / Excel）抽出結果のキャッシュ
+ファイル内容のハッシュをキーに、メモリとディスクの2段で保持する
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from igcaption.page_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_MEMORY_ENTRIES = 64
+DEFAULT_MAX_MB = 100
+
+
+def content_key(data, *options):
+    """ファイル内容と抽出オプションからキャッシュキーを作る"""
+    h = hashlib.sha256(data)
+    for opt in options:
+        h.update(b"\0" + repr(opt).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """メモリ上の LRU と、容量上限付きのディスク保存を組み合わせたキャッシュ"""
+
+    def __init__(self, directory, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / f"{key}.txt"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            path = self._path(key)
+            try:
+                text = path.read_text(encoding="utf-8")
+            except OSError:
+                return None
+            os.utime(path)
+            self._remember(key, text)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._remember(key, text)
+            try:
+                self._path(key).write_text(text, encoding="utf-8")
+                self._evict()
+            except OSError:
+                pass
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        files = []
+        total = 0
+        for path in self.directory.glob("*.txt"):
+            st = path.stat()
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """
+    プロセス共有の抽出キャッシュを返す
+    環境変数 EXTRACT_CACHE_DIR / EXTRACT_CACHE_MAX_MB で設定を変更できる
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            directory = os.environ.get("EXTRACT_CACHE_DIR") or DEFAULT_CACHE_DIR / "extract"
+            max_mb = float(os.environ.get("EXTRACT_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+            _cache = ExtractionCache(directory, max_bytes=int(max_mb * 1024 * 1024))
+        return _cache
@@ -0,0 +1,189 @@
+"""
+商品ページ取得
+HTTPセッションを共有し、ホストごとの同時接続数を制限しながら並列取得する
+取得結果はディスクキャッシュ（page_cache）に保存して再利用する
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from igcaption.html_text import DESCRIPTION_MIN_CHARS, extract_main_text
+from igcaption.page_cache import get_page_cache
+from igcaption.product_data import BODY_HEADER, extract_product_data, format_product_data
+from igcaption.telemetry import bind, span
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+FETCH_TIMEOUT = 15
+MAX_TEXT_CHARS = 8000
+
+# 並列取得の既定値
+FETCH_MAX_WORKERS = 8
+FETCH_PER_HOST_LIMIT = 2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """プロセス内で共有するHTTPセッションを返す（ホストごとにKeep-Alive接続を再利用）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=FETCH_MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+def _response_encoding(resp):
+    """
+    文字コードを決める（ヘッダー → <meta charset> → 内容からの推定の順）
+    推定（apparent_encoding）は数MBのページでは重いため最後の手段にする
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    if "charset=" in content_type.lower():
+        return resp.encoding
+    m = _META_CHARSET.search(resp.content[:4096])
+    if m:
+        return m.group(1).decode("ascii")
+    return resp.apparent_encoding
+
+
+def truncate_text(text, limit=MAX_TEXT_CHARS):
+    """抽出テキストを文字数上限で切り詰める"""
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    if len(text) > limit:
+        text = text[:limit] + "\n\n（以下省略）"
+    return text
+
+
+def page_text_from_html(html, record_only=True):
+    """
+    商品ページの HTML からプロンプト用のテキストを作る
+    構造化データに商品名と十分な長さの説明があればその商品情報だけを使い、
+    足りなければ見つかった項目の後ろにページ本文を続ける
+    record_only=False なら商品情報が十分でも本文を続ける（ブランドサイトなど本文が主のページ用）
+    """
+    record = extract_product_data(html)
+    if (record_only and record.get("name")
+            and len(record.get("description", "")) >= DESCRIPTION_MIN_CHARS):
+        return truncate_text(format_product_data(record))
+    body = extract_main_text(html)
+    if record:
+        return truncate_text(f"{format_product_data(record)}\n\n{BODY_HEADER}\n{body}")
+    return truncate_text(body)
+
+
+def fetch_product_page(url, session=None, cache=None, use_cache=True, record_only=True):
+    """
+    商品ページを取得して本文テキストを返す。(text, error) を返す
+    キャッシュが TTL 内ならネットワークに出ず、期限切れなら ETag / Last-Modified で再検証する
+    record_only=False は page_text_from_html と同じ（キャッシュは商品ページ用のため使わない）
+    """
+    with span("fetch", url=url) as stats:
+        text, error = _fetch_product_page(url, session, cache, use_cache and record_only,
+                                          stats, record_only)
+        if error:
+            stats["error"] = error
+        return text, error
+
+
+def _fetch_product_page(url, session, cache, use_cache, stats, record_only=True):
+    try:
+        cache = (cache or get_page_cache()) if use_cache else None
+        cached = cache.get(url) if cache else None
+        if cached and cached["fresh"]:
+            cache.record("hits")
+            stats["cache"] = "hit"
+            return cached["text"], None
+
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = session or get_session()
+        resp = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        stats["status"] = resp.status_code
+        if cached and resp.status_code == 304:
+            cache.mark_revalidated(url)
+            cache.record("revalidated")
+            stats["cache"] = "revalidated"
+            return cached["text"], None
+        resp.raise_for_status()
+        stats["bytes"] = len(resp.content)
+        resp.encoding = _response_encoding(resp)
+        text = page_text_from_html(resp.text, record_only)
+        if cache:
+            cache.record("misses")
+            cache.put(url, text, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        stats["cache"] = "miss" if cache else "off"
+        return text, None
+    except Exception as e:
+        return None, str(e)
+
+
+def iter_pages(urls, max_workers=FETCH_MAX_WORKERS, per_host_limit=FETCH_PER_HOST_LIMIT):
+    """
+    複数URLを並列取得し、完了した順に (url, (text, error)) を返すジェネレーター
+    同一ホストへの同時リクエストは per_host_limit 件まで
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return
+
+    host_limits = {}
+    for url in urls:
+        host = urlparse(url).netloc.lower()
+        if host not in host_limits:
+            host_limits[host] = threading.BoundedSemaphore(per_host_limit)
+
+    session = get_session()
+
+    def _fetch(url):
+        with host_limits[urlparse(url).netloc.lower()]:
+            return fetch_product_page(url, session=session)
+
+    workers = max(1, min(max_workers, len(urls)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(bind(_fetch), url): url for url in urls}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (None, str(e))
+            yield futures[future], result
+
+
+def fetch_pages(urls, max_workers=FETCH_MAX_WORKERS, per_host_limit=FETCH_PER_HOST_LIMIT,
+                on_progress=None):
+    """
+    複数URLを並列取得する。{url: (text, error)} を返す
+    - 同一ホストへの同時リクエストは per_host_limit 件まで
+    - on_progress(done, total, url, error) は呼び出し元スレッドで完了順に呼ばれる
+      （Streamlit のウィジェット更新はワーカースレッドから行えないため）
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    results = {}
+    for done, (url, result) in enumerate(iter_pages(urls, max_workers, per_host_limit), 1):
+        results[url] = result
+        if on_progress:
+            on_progress(done, len(urls), url, result[1])
+    return results
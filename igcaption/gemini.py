@@ -0,0 +1,170 @@
+"""
+Gemini モデルの共有レジストリ
+(APIキー, モデル名, 生成パラメータ) ごとにモデルを1つだけ作り、
+ワーカースレッド間で使い回す（gRPC 接続を温めたまま再利用する）
+
+クライアント固有の静的プロンプトは Gemini のコンテキストキャッシュに登録し、
+各投稿のリクエストでは投稿ごとの差分だけを送る
+google.generativeai は読み込みに時間がかかるため、モデルを初めて作るときに読み込む
+
+GenerativeModel の _client / _cached_content（非公開属性）を直接設定している。
+google-generativeai 0.8 系の実装に合わせたもので、requirements.txt で 0.8 系に固定している
+"""
+
+import atexit
+import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from igcaption.models import DEFAULT_MODEL
+
+# コンテキストキャッシュの有効期限と、登録を試みる最小文字数
+# （Gemini は一定トークン数未満のキャッシュを受け付けないため、短いものは system_instruction で送る）
+CONTEXT_CACHE_TTL = 30 * 60
+CONTEXT_CACHE_REFRESH_MARGIN = 2 * 60
+CONTEXT_CACHE_MIN_CHARS = 1024
+
+_clients = {}
+_cache_clients = {}
+_context_models = {}
+# (APIキー, モデル名, システム指示のハッシュ) -> {"name": キャッシュ名 or None, "expires": ...}
+_cache_entries = {}
+# このプロセスで作成したコンテキストキャッシュ {キャッシュ名: APIキー}（終了時に削除する）
+_context_caches = {}
+# コンテキストキャッシュのキーごとのロック（キャッシュ作成中に他のキーの取得を止めない）
+_key_locks = {}
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _config_key(config):
+    # response_schema など入れ子の設定も含めてキーにする
+    return json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _client_for(api_key):
+    # genai.configure() はプロセス全体の設定を書き換えるため、APIキーごとに専用クライアントを持つ
+    client = _clients.get(api_key)
+    if client is None:
+        from google.ai import generativelanguage as glm
+        client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        _clients[api_key] = client
+    return client
+
+
+def _cache_client_for(api_key):
+    # コンテキストキャッシュの作成・削除用（生成用と同じく APIキーごと）
+    with _lock:
+        client = _cache_clients.get(api_key)
+        if client is None:
+            from google.ai import generativelanguage as glm
+            client = glm.CacheServiceClient(client_options={"api_key": api_key})
+            _cache_clients[api_key] = client
+        return client
+
+
+def _create_context_cache(api_key, model_name, system_instruction):
+    """静的プロンプトをコンテキストキャッシュに登録し、キャッシュ名を返す"""
+    from google.ai import generativelanguage as glm
+    cached = _cache_client_for(api_key).create_cached_content(cached_content=glm.CachedContent(
+        model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+        system_instruction=glm.Content(parts=[glm.Part(text=system_instruction)]),
+        ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+    ))
+    return cached.name
+
+
+def delete_context_caches():
+    """このプロセスで作成し、まだ有効なコンテキストキャッシュを削除する（終了時に呼ばれる）"""
+    with _lock:
+        caches = list(_context_caches.items())
+        _context_caches.clear()
+    for name, api_key in caches:
+        try:
+            _cache_client_for(api_key).delete_cached_content(name=name)
+        except Exception as e:
+            logger.info("コンテキストキャッシュ %s を削除できませんでした: %s", name, e)
+
+
+atexit.register(delete_context_caches)
+
+
+def _context_cache_for(api_key, model_name, digest, system_instruction):
+    """
+    (APIキー, モデル名, システム指示) のコンテキストキャッシュ名を返す（作れなければ None）
+    生成パラメータが違うモデル（まとめて生成と1件ずつの生成など）でも同じキャッシュを使う。
+    作成（API 呼び出し）はキーごとのロックで行い、別のクライアントの生成は待たせない
+    """
+    key = (api_key, model_name, digest)
+
+    def _current():
+        entry = _cache_entries.get(key)
+        return entry if entry is not None and time.monotonic() < entry["expires"] else None
+
+    with _lock:
+        entry = _current()
+        if entry is not None:
+            return entry["name"]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        # 同じキーの作成を待っていた場合は、先に作られたキャッシュを使う
+        with _lock:
+            entry = _current()
+            if entry is not None:
+                return entry["name"]
+        try:
+            name = _create_context_cache(api_key, model_name, system_instruction)
+            expires = time.monotonic() + CONTEXT_CACHE_TTL - CONTEXT_CACHE_REFRESH_MARGIN
+        except Exception as e:
+            logger.warning("コンテキストキャッシュを作成できませんでした（%s）。"
+                           "system_instruction で送ります: %s", model_name, e)
+            # 登録に失敗した場合は一定時間後に再挑戦する
+            name = None
+            expires = time.monotonic() + CONTEXT_CACHE_TTL
+        with _lock:
+            previous = _cache_entries.get(key)
+            if previous and previous["name"]:
+                # 作り直す前のキャッシュは TTL で消えるため、終了時の削除対象から外す
+                _context_caches.pop(previous["name"], None)
+            if name:
+                _context_caches[name] = api_key
+            _cache_entries[key] = {"name": name, "expires": expires}
+        return name
+
+
+def get_context_model(api_key, model_name=DEFAULT_MODEL, generation_config=None,
+                      system_instruction="", use_context_cache=True):
+    """
+    system_instruction（クライアント固有の静的プロンプト）を前提にしたモデルを返す
+    十分な長さがあればコンテキストキャッシュを作成して使い回し、期限が近づいたら作り直す。
+    キャッシュを作れない場合は system_instruction 付きのモデルにフォールバックする
+    モデル（生成パラメータごとの薄いラッパー）はキャッシュが変わったときだけ作り直す
+    """
+    import google.generativeai as genai
+    config = dict(generation_config or {})
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    cache_name = None
+    if use_context_cache and len(system_instruction) >= CONTEXT_CACHE_MIN_CHARS:
+        cache_name = _context_cache_for(api_key, model_name, digest, system_instruction)
+
+    key = (api_key, model_name, _config_key(config), digest, use_context_cache)
+    with _lock:
+        entry = _context_models.get(key)
+        if entry is not None and entry["cache"] == cache_name:
+            return entry["model"]
+        if cache_name:
+            model = genai.GenerativeModel(model_name, generation_config=config or None)
+            # from_cached_content() は既定クライアント（genai.configure() の API キー）で
+            # キャッシュを問い合わせるため、キャッシュ名を直接設定する
+            model._cached_content = cache_name
+        else:
+            model = genai.GenerativeModel(model_name, generation_config=config or None,
+                                          system_instruction=system_instruction or None)
+        model._client = _client_for(api_key)
+        _context_models[key] = {"model": model, "cache": cache_name}
+        return model
@@ -0,0 +1,306 @@
+"""
+商品ページ HTML から本文テキストを取り出す
+- 不要な要素（script / style / nav / footer など）はパース中に読み飛ばし、木を作らない
+- 商品説明らしいブロック（itemprop="description" や EC サイトの説明欄）があれば、
+  商品名（h1）と説明ブロックだけを本文とし、なければ <main> または <body> 全体を使う
+
+バックエンドは selectolax（lexbor）→ lxml → 標準ライブラリの順に、インストール済みのものを使う
+（環境変数 HTML_EXTRACTOR で stream / lxml / selectolax / bs4 を明示できる。bs4 は従来の処理）
+"""
+
+import os
+import re
+from html.parser import HTMLParser
+
+# 本文から除外する要素
+SKIP_TAGS = ("script", "style", "noscript", "template", "svg",
+             "nav", "footer", "header", "aside")
+
+# 商品説明ブロックの候補（優先順）。(属性, 値) で、class は空白区切りのいずれかに一致
+DESCRIPTION_BLOCKS = (
+    ("itemprop", "description"),
+    ("id", "productDescription"),
+    ("id", "item-description"),
+    ("id", "product-description"),
+    ("class", "product-description"),
+    ("class", "product__description"),
+    ("class", "product-single__description"),
+    ("class", "item_desc"),
+    ("class", "item-desc"),
+    ("class", "sale_desc"),
+    ("id", "product-detail"),
+    ("class", "product-detail"),
+    ("class", "product-details"),
+)
+
+# これより短い説明ブロックは採用しない（ページ全体の本文を使う）
+DESCRIPTION_MIN_CHARS = 150
+
+_VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input",
+                        "link", "meta", "param", "source", "track", "wbr"))
+
+# 開始すると開いている <p> を閉じる要素
+_P_CLOSERS = frozenset(("address", "article", "aside", "blockquote", "details", "div", "dl",
+                        "fieldset", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5",
+                        "h6", "header", "hr", "main", "nav", "ol", "p", "pre", "section",
+                        "table", "ul"))
+_P_SCOPE = ("p",), ("button", "table", "td", "th")
+
+# 閉じタグを省略できる要素: 開始タグ -> (暗黙に閉じる要素, そこより外は探さない要素)
+_IMPLIED_ENDS = {
+    "li": (("li",), ("ul", "ol")),
+    "dt": (("dt", "dd"), ("dl",)),
+    "dd": (("dt", "dd"), ("dl",)),
+    "tr": (("tr",), ("table", "thead", "tbody", "tfoot")),
+    "td": (("td", "th"), ("tr", "table")),
+    "th": (("td", "th"), ("tr", "table")),
+    "option": (("option",), ("select", "datalist", "optgroup")),
+    "optgroup": (("optgroup", "option"), ("select",)),
+    "body": (("head",), ()),
+}
+
+
+def _implied_ends(tag):
+    if tag in _P_CLOSERS:
+        yield _P_SCOPE
+    if tag in _IMPLIED_ENDS:
+        yield _IMPLIED_ENDS[tag]
+
+
+def _join(parts):
+    return "\n".join(p for p in (s.strip() for s in parts) if p)
+
+
+def _compose(title, description, fallback):
+    """説明ブロックが十分な長さなら商品名＋説明、そうでなければ本文全体"""
+    if description and len(description) >= DESCRIPTION_MIN_CHARS:
+        if title and not description.startswith(title):
+            return f"{title}\n{description}"
+        return description
+    return fallback
+
+
+def _matches(attrs, attr, value):
+    if attr == "class":
+        return value in (attrs.get("class") or "").split()
+    return attrs.get(attr) == value
+
+
+# ── 標準ライブラリ（ストリーミング）──
+class _StreamExtractor(HTMLParser):
+    """
+    木を作らずにテキストを集めるパーサー（除外要素の中身はその場で捨てる）
+    開いている要素はタグ名のスタックだけで追い、閉じタグのない <p> / <li> / <td> / <option> などは
+    ブラウザと同じく次の開始タグや親の閉じタグで閉じたものとして扱う
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []             # 開いている要素 [(tag, 収集先の数, 除外の起点か)]
+        self.depth = {}             # タグ名 -> スタック内の数
+        self.skip = False           # 除外中の要素の中にいるか
+        self.body, self.main, self.title, self.other = [], [], [], []
+        self.seen_body = False
+        self.blocks = {}            # DESCRIPTION_BLOCKS の位置 -> テキスト断片
+        self.open = []              # 収集中の要素のテキスト断片（スタックの順）
+
+    def _pop_to(self, index):
+        """スタックの index 以降の要素を閉じる"""
+        while len(self.stack) > index:
+            tag, captures, skipping = self.stack.pop()
+            self.depth[tag] -= 1
+            if captures:
+                del self.open[-captures:]
+            if skipping:
+                self.skip = False
+
+    def _close_implied(self, tag):
+        """tag の開始で暗黙に閉じる要素（閉じタグが省略された <p> や直前の <li> など）を閉じる"""
+        for closes, boundary in _implied_ends(tag):
+            for i in range(len(self.stack) - 1, -1, -1):
+                open_tag = self.stack[i][0]
+                if open_tag in closes:
+                    self._pop_to(i)
+                    break
+                if open_tag in boundary:
+                    break
+
+    def handle_starttag(self, tag, attrs):
+        self._close_implied(tag)
+        if tag in _VOID_TAGS:
+            return
+        self.depth[tag] = self.depth.get(tag, 0) + 1
+        if self.skip:
+            self.stack.append((tag, 0, False))
+            return
+        if tag in SKIP_TAGS:
+            self.skip = True
+            self.stack.append((tag, 0, True))
+            return
+        captures = []
+        if tag == "body":
+            self.seen_body = True
+        elif tag == "main" and "main" not in self.blocks:
+            self.blocks["main"] = self.main
+            captures.append(self.main)
+        elif tag == "h1" and "h1" not in self.blocks:
+            self.blocks["h1"] = self.title
+            captures.append(self.title)
+        attrs = dict(attrs)
+        for n, (attr, value) in enumerate(DESCRIPTION_BLOCKS):
+            if n not in self.blocks and _matches(attrs, attr, value):
+                self.blocks[n] = []
+                captures.append(self.blocks[n])
+        self.open.extend(captures)
+        self.stack.append((tag, len(captures), False))
+
+    def handle_endtag(self, tag):
+        if not self.depth.get(tag):
+            return
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                self._pop_to(i)
+                return
+
+    def handle_data(self, data):
+        if self.skip or self.depth.get("head") or self.depth.get("title"):
+            return
+        (self.body if self.depth.get("body") else self.other).append(data)
+        for parts in self.open:
+            parts.append(data)
+
+
+def _extract_stream(html):
+    parser = _StreamExtractor()
+    parser.feed(html)
+    parser.close()
+    description = ""
+    for n in range(len(DESCRIPTION_BLOCKS)):
+        if n in parser.blocks:
+            description = _join(parser.blocks[n])
+            if len(description) >= DESCRIPTION_MIN_CHARS:
+                break
+    if "main" in parser.blocks:
+        fallback = _join(parser.main)
+    else:
+        fallback = _join(parser.body if parser.seen_body else parser.other)
+    return _compose(_join(parser.title), description, fallback)
+
+
+# ── selectolax（lexbor）──
+def _selector(attr, value):
+    if attr == "class":
+        return f".{value}"
+    if attr == "id":
+        return f"#{value}"
+    return f'[{attr}="{value}"]'
+
+
+def _extract_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(SKIP_TAGS))
+
+    def _text(node):
+        if node is None:
+            return ""
+        return _join(node.text(separator="\n", strip=True).split("\n"))
+
+    description = ""
+    for attr, value in DESCRIPTION_BLOCKS:
+        description = _text(tree.css_first(_selector(attr, value)))
+        if len(description) >= DESCRIPTION_MIN_CHARS:
+            break
+    main = tree.css_first("main")
+    fallback = _text(main if main is not None else tree.body)
+    return _compose(_text(tree.css_first("h1")), description, fallback)
+
+
+# ── lxml ──
+_XML_DECLARATION = re.compile(r"\s*<\?xml[^>]*\?>", re.IGNORECASE)
+
+
+def _xpath(attr, value):
+    if attr == "class":
+        return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {value} ')]"
+    return f"//*[@{attr}='{value}']"
+
+
+def _extract_lxml(html):
+    from lxml import etree, html as lxml_html
+
+    # lxml は XML 宣言（encoding 付き）のある str や空の文書を受け付けない
+    declaration = _XML_DECLARATION.match(html)
+    if declaration:
+        html = html[declaration.end():]
+    if not html.strip():
+        return ""
+    parser = lxml_html.HTMLParser(remove_comments=True, remove_pis=True)
+    root = lxml_html.document_fromstring(html, parser=parser)
+    etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+
+    def _first(path):
+        found = root.xpath(path)
+        return found[0] if found else None
+
+    def _text(node):
+        return _join(node.itertext()) if node is not None else ""
+
+    description = ""
+    for attr, value in DESCRIPTION_BLOCKS:
+        description = _text(_first(_xpath(attr, value)))
+        if len(description) >= DESCRIPTION_MIN_CHARS:
+            break
+    main = _first("//main")
+    fallback = _text(main if main is not None else root.body)
+    return _compose(_text(_first("//h1")), description, fallback)
+
+
+# ── BeautifulSoup（従来の処理・比較用）──
+def _extract_bs4(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "nav", "footer", "header", "aside"]):
+        tag.decompose()
+    main = soup.find("main") or soup.find("body")
+    return main.get_text(separator="\n", strip=True) if main else ""
+
+
+EXTRACTORS = {
+    "stream": _extract_stream,
+    "lxml": _extract_lxml,
+    "selectolax": _extract_selectolax,
+    "bs4": _extract_bs4,
+}
+
+
+def _available(name):
+    module = {"lxml": "lxml.html", "selectolax": "selectolax.lexbor"}.get(name)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+_default_backend = None
+
+
+def default_backend():
+    """使用するバックエンド名（HTML_EXTRACTOR の指定、なければ速いものから）"""
+    global _default_backend
+    if _default_backend is None:
+        name = (os.environ.get("HTML_EXTRACTOR") or "").strip().lower()
+        if name not in EXTRACTORS or not _available(name):
+            name = next(n for n in ("selectolax", "lxml", "stream") if _available(n))
+        _default_backend = name
+    return _default_backend
+
+
+def extract_main_text(html, backend=None):
+    """HTML 文字列から本文テキスト（1行1要素）を返す"""
+    return EXTRACTORS[backend or default_backend()](html)
@@ -0,0 +1,198 @@
+"""
+一括生成ジョブの実行と保存
+生成はワーカースレッドで行い、完成した投稿ごとに SQLite へチェックポイントする
+（Streamlit の再実行やブラウザ切断で処理が止まらず、中断されたジョブは続きから再開できる）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from igcaption.page_cache import DEFAULT_CACHE_DIR
+
+# ジョブの状態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 古いジョブは新規作成時に削除する
+JOB_RETENTION_DAYS = 30
+
+
+class JobStore:
+    """ジョブ定義・進捗・投稿ごとの生成結果を保存する"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, client_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " spec TEXT NOT NULL, plan TEXT, message TEXT, error TEXT, telemetry TEXT,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS job_posts ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, caption TEXT, error TEXT,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (job_id, idx));"
+            "CREATE INDEX IF NOT EXISTS jobs_by_client ON jobs (client_id, created_at);")
+        # 計測結果の列がない古いデータベースには列を足す
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "telemetry" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN telemetry TEXT")
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cur.fetchall()
+
+    def create_job(self, client_id, spec):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.prune(now - JOB_RETENTION_DAYS * 86400)
+        self._execute(
+            "INSERT INTO jobs (id, client_id, status, spec, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, client_id, JOB_QUEUED, json.dumps(spec, ensure_ascii=False), now, now))
+        return job_id
+
+    def prune(self, before):
+        """before（UNIX 時刻）より前に作成されたジョブを削除する"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_posts WHERE job_id IN"
+                " (SELECT id FROM jobs WHERE created_at < ?)", (before,))
+            self._conn.execute("DELETE FROM jobs WHERE created_at < ?", (before,))
+            self._conn.commit()
+
+    def get_job(self, job_id):
+        rows = self._execute(
+            "SELECT id, client_id, status, spec, plan, message, error, telemetry,"
+            " created_at, updated_at FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        (job_id, client_id, status, spec, plan, message, error, telemetry,
+         created_at, updated_at) = rows[0]
+        return {
+            "id": job_id,
+            "client_id": client_id,
+            "status": status,
+            "spec": json.loads(spec),
+            "plan": json.loads(plan) if plan else None,
+            "message": message or "",
+            "error": error,
+            "telemetry": json.loads(telemetry) if telemetry else None,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def latest_job(self, client_id):
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE client_id = ? ORDER BY created_at DESC LIMIT 1",
+            (client_id,))
+        return self.get_job(rows[0][0]) if rows else None
+
+    def set_status(self, job_id, status, message=None, error=None):
+        self._execute(
+            "UPDATE jobs SET status = ?, message = COALESCE(?, message), error = ?,"
+            " updated_at = ? WHERE id = ?",
+            (status, message, error, time.time(), job_id))
+
+    def set_message(self, job_id, message):
+        self._execute("UPDATE jobs SET message = ?, updated_at = ? WHERE id = ?",
+                      (message, time.time(), job_id))
+
+    def set_plan(self, job_id, plan):
+        """投稿枠の一覧（商品名・URL など生成前に決まる情報）を保存する"""
+        self._execute("UPDATE jobs SET plan = ?, updated_at = ? WHERE id = ?",
+                      (json.dumps(plan, ensure_ascii=False), time.time(), job_id))
+
+    def set_telemetry(self, job_id, telemetry):
+        """直近の実行の計測結果（RunTelemetry.to_dict）を保存する"""
+        self._execute("UPDATE jobs SET telemetry = ? WHERE id = ?",
+                      (json.dumps(telemetry, ensure_ascii=False, default=str), job_id))
+
+    def save_post(self, job_id, index, caption=None, error=None):
+        """投稿1件分の結果をチェックポイントする"""
+        self._execute(
+            "INSERT OR REPLACE INTO job_posts (job_id, idx, caption, error, updated_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (job_id, index, caption, error, time.time()))
+
+    def posts(self, job_id):
+        """{index: (caption, error)} を返す"""
+        rows = self._execute(
+            "SELECT idx, caption, error FROM job_posts WHERE job_id = ?", (job_id,))
+        return {idx: (caption, error) for idx, caption, error in rows}
+
+
+class JobRunner:
+    """
+    プロセス内でジョブ用スレッドを管理する
+    ストリーミング中の途中経過はメモリ上にだけ保持する
+    """
+
+    def __init__(self):
+        self._threads = {}
+        self._partials = {}
+        self._lock = threading.Lock()
+
+    def start(self, job_id, target, *args):
+        """target(job_id, *args) をワーカースレッドで実行する（実行中なら何もしない）"""
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return False
+            thread = threading.Thread(target=self._run, args=(job_id, target, args),
+                                      name=f"job-{job_id[:8]}", daemon=True)
+            self._threads[job_id] = thread
+            self._partials[job_id] = {}
+            thread.start()
+            return True
+
+    def _run(self, job_id, target, args):
+        try:
+            target(job_id, *args)
+        finally:
+            with self._lock:
+                self._partials.pop(job_id, None)
+
+    def is_running(self, job_id):
+        with self._lock:
+            thread = self._threads.get(job_id)
+            return thread is not None and thread.is_alive()
+
+    def set_partial(self, job_id, index, text):
+        with self._lock:
+            if job_id in self._partials:
+                self._partials[job_id][index] = text
+
+    def partials(self, job_id):
+        with self._lock:
+            return dict(self._partials.get(job_id, {}))
+
+
+_store = None
+_runner = JobRunner()
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """プロセス共有のジョブストアを返す（環境変数 JOB_STORE_DIR で保存先を変更できる）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store_dir = Path(os.environ.get("JOB_STORE_DIR") or DEFAULT_CACHE_DIR)
+            _store = JobStore(store_dir / "jobs.sqlite3")
+        return _store
+
+
+def get_job_runner():
+    return _runner
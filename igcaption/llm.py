@@ -0,0 +1,306 @@
+"""
+生成 API のプロバイダー
+キャプション生成やブランドコンセプトの要約は、モデルを直接呼ばずにプロバイダーを通す
+- gemini: Gemini API（既定）
+- record: Gemini の応答を、リクエストのハッシュごとにカセット（JSONL）へ記録する
+- replay: カセットに記録した応答を返す（API を呼ばず、レート制御もしない）
+- offline: プロンプトから決まった文面を作るローカルの生成器（API キー不要）
+環境変数 LLM_PROVIDER で切り替え、カセットの保存先は LLM_CASSETTE（既定 .cache/cassette.jsonl）
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from igcaption.caption_cache import caption_cache_key
+from igcaption.page_cache import DEFAULT_CACHE_DIR
+from igcaption.product_data import MAX_NAME_CHARS, NAME_LABEL
+from igcaption.ratelimit import count_tokens
+
+PROVIDERS = ("gemini", "offline", "record", "replay")
+DEFAULT_PROVIDER = "gemini"
+
+# usage に書き込むトークン数の項目（カセットにはこれだけを記録する）
+USAGE_FIELDS = ("prompt_tokens", "response_tokens", "cached_tokens")
+
+
+class GenerationRequest:
+    """1回分の生成リクエスト（モデル名・生成パラメータ・システム指示・プロンプト）"""
+
+    def __init__(self, prompt, model_name, config=None, system_instruction="", api_key=""):
+        self.prompt = prompt
+        self.model_name = model_name
+        self.config = dict(config or {})
+        self.system_instruction = system_instruction or ""
+        self.api_key = api_key
+
+    @property
+    def key(self):
+        """キャプションキャッシュと同じハッシュ（API キーは含めない）"""
+        return caption_cache_key(self.model_name, self.config, self.system_instruction, self.prompt)
+
+    @property
+    def json_output(self):
+        return self.config.get("response_mime_type") == "application/json"
+
+
+class Provider:
+    """
+    プロバイダーの共通インターフェース
+    サブクラスは complete()（一括）と、必要なら stream()（受信した断片を順に返す）を実装する
+    usage（dict）を渡すと、prompt_tokens / response_tokens を書き込む
+    """
+
+    name = ""
+    requires_api_key = True
+    # 共有 RateLimiter を通すか（API を呼ばないプロバイダーは待たない）
+    rate_limited = True
+    # キャプションキャッシュを使うか（API 以外の応答をキャッシュに混ぜない）
+    cache_captions = True
+
+    def complete(self, request, usage=None):
+        raise NotImplementedError
+
+    def stream(self, request, usage=None):
+        yield self.complete(request, usage)
+
+    def generate(self, request, on_chunk=None, usage=None):
+        """生成テキストを返す。on_chunk があればストリーミングで受信し、それまでのテキスト全体を都度渡す"""
+        if on_chunk is None:
+            return self.complete(request, usage)
+        parts = []
+        on_chunk("")
+        for piece in self.stream(request, usage):
+            parts.append(piece)
+            on_chunk("".join(parts))
+        return "".join(parts)
+
+    async def agenerate(self, request, usage=None):
+        """generate() の非同期版（別スレッドで実行する）"""
+        return await asyncio.to_thread(self.complete, request, usage)
+
+    async def astream(self, request, usage=None):
+        """stream() の非同期版。受信した断片を順に返す"""
+        loop = asyncio.get_running_loop()
+        pieces = asyncio.Queue()
+        done = object()
+
+        def _read():
+            try:
+                for piece in self.stream(request, usage):
+                    loop.call_soon_threadsafe(pieces.put_nowait, piece)
+                loop.call_soon_threadsafe(pieces.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(pieces.put_nowait, e)
+
+        threading.Thread(target=_read, name="llm-stream", daemon=True).start()
+        while True:
+            piece = await pieces.get()
+            if piece is done:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+
+def read_usage(response, usage):
+    """応答の usage_metadata（実際のトークン数）を usage に書き写す。数が入っていなければ何もしない"""
+    meta = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(meta, "prompt_token_count", 0) or 0
+    if usage is None or not prompt_tokens:
+        return
+    usage["prompt_tokens"] = prompt_tokens
+    usage["response_tokens"] = getattr(meta, "candidates_token_count", 0) or 0
+    cached_tokens = getattr(meta, "cached_content_token_count", 0) or 0
+    if cached_tokens:
+        usage["cached_tokens"] = cached_tokens
+
+
+# ── Gemini ──────
+class GeminiProvider(Provider):
+    """Gemini API（静的なシステム指示はコンテキストキャッシュに載せる）"""
+
+    name = "gemini"
+
+    def _model(self, request):
+        # google.generativeai は使うときに読み込む（offline / replay では不要）
+        from igcaption.gemini import get_context_model
+        return get_context_model(request.api_key, request.model_name, request.config,
+                                 system_instruction=request.system_instruction)
+
+    def complete(self, request, usage=None):
+        response = self._model(request).generate_content(request.prompt)
+        read_usage(response, usage)
+        return response.text
+
+    def stream(self, request, usage=None):
+        for chunk in self._model(request).generate_content(request.prompt, stream=True):
+            # トークン数は最後のチャンクに全体分が入る
+            read_usage(chunk, usage)
+            try:
+                piece = chunk.text
+            except ValueError:
+                # テキストを含まないチャンク（終了通知など）
+                continue
+            yield piece
+
+
+# ── カセット（記録・再生）──────
+class CassetteMiss(LookupError):
+    """replay でカセットに記録がないリクエスト"""
+
+
+class CassetteProvider(Provider):
+    """
+    mode="record" は inner の応答をカセットに追記し、mode="replay" は記録済みの応答を待たずに返す
+    同じリクエストを複数回記録した場合は最後の応答を使う
+    """
+
+    cache_captions = False
+
+    def __init__(self, path, mode="replay", inner=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"カセットのモードは record か replay です: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.name = mode
+        self.inner = inner or GeminiProvider()
+        self.requires_api_key = self.rate_limited = mode == "record"
+        self._lock = threading.Lock()
+        self._entries = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as fp:
+                for line in fp:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _replay(self, request, usage):
+        entry = self._entries.get(request.key)
+        if entry is None:
+            raise CassetteMiss(f"カセットに記録がありません（{request.key[:12]}）: {self.path}")
+        if usage is not None:
+            usage.update(entry.get("usage") or {})
+        return entry["text"]
+
+    def _record(self, request, text, usage):
+        entry = {"key": request.key, "model": request.model_name, "text": text,
+                 "usage": {k: usage[k] for k in USAGE_FIELDS if k in usage},
+                 "recorded_at": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fp:
+                fp.write(line)
+
+    def complete(self, request, usage=None):
+        if self.mode == "replay":
+            return self._replay(request, usage)
+        usage = {} if usage is None else usage
+        text = self.inner.complete(request, usage)
+        self._record(request, text, usage)
+        return text
+
+    def stream(self, request, usage=None):
+        if self.mode == "replay":
+            yield self._replay(request, usage)
+            return
+        usage = {} if usage is None else usage
+        parts = []
+        for piece in self.inner.stream(request, usage):
+            parts.append(piece)
+            yield piece
+        self._record(request, "".join(parts), usage)
+
+
+# ── オフライン ──────
+class OfflineProvider(Provider):
+    """
+    プロンプトから決まった文面を作るローカルの生成器（同じリクエストには常に同じ応答を返す）
+    まとめて生成（JSON 出力）のリクエストには slot の件数分の配列を返す
+    """
+
+    name = "offline"
+    requires_api_key = False
+    rate_limited = False
+    cache_captions = False
+    STREAM_CHARS = 20
+
+    def _caption(self, request, slot):
+        # 商品情報に「商品名:」の行があれば見出しに使う
+        m = re.search(rf"^{re.escape(NAME_LABEL)}(.+)$", request.prompt, re.M)
+        name = m.group(1).strip()[:MAX_NAME_CHARS] if m else "オフライン生成"
+        return (f"【{name}✨️】\n"
+                f"{name}のご紹介です。\n"
+                f"（オフライン生成 {request.key[:8]}-{slot}）")
+
+    def complete(self, request, usage=None):
+        if request.json_output:
+            count = len(re.findall(r"^- slot \d+", request.prompt, re.M)) or 1
+            text = json.dumps([{"slot": k, "caption": self._caption(request, k)}
+                               for k in range(1, count + 1)], ensure_ascii=False)
+        else:
+            text = self._caption(request, 1)
+        if usage is not None:
+            usage["prompt_tokens"] = count_tokens(request.system_instruction + request.prompt)
+            usage["response_tokens"] = count_tokens(text)
+        return text
+
+    def stream(self, request, usage=None):
+        text = self.complete(request, usage)
+        for start in range(0, len(text), self.STREAM_CHARS):
+            yield text[start:start + self.STREAM_CHARS]
+
+
+# ── 選択 ──────
+def cassette_path():
+    """カセットの保存先（環境変数 LLM_CASSETTE、既定は .cache/cassette.jsonl）"""
+    return Path(os.environ.get("LLM_CASSETTE") or DEFAULT_CACHE_DIR / "cassette.jsonl")
+
+
+def create_provider(name=None, cassette=None):
+    """
+    name（gemini / offline / record / replay）のプロバイダーを作る
+    未指定なら環境変数 LLM_PROVIDER、なければ gemini。不明な名前は ValueError
+    """
+    name = (name or os.environ.get("LLM_PROVIDER") or DEFAULT_PROVIDER).strip().lower()
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "offline":
+        return OfflineProvider()
+    if name in ("record", "replay"):
+        return CassetteProvider(cassette or cassette_path(), mode=name)
+    raise ValueError(f"不明な生成プロバイダーです: {name}（{' / '.join(PROVIDERS)}）")
+
+
+_provider = None
+_provider_config = None
+_provider_lock = threading.Lock()
+
+
+def configure_provider(name=None, cassette=None):
+    """プロセス共有のプロバイダーを設定して返す（同じ設定なら作り直さない）"""
+    global _provider, _provider_config
+    config = ((name or os.environ.get("LLM_PROVIDER") or DEFAULT_PROVIDER).strip().lower(),
+              str(cassette or cassette_path()))
+    with _provider_lock:
+        if _provider is None or _provider_config != config:
+            _provider = create_provider(*config)
+            _provider_config = config
+        return _provider
+
+
+def get_provider():
+    """プロセス共有のプロバイダーを返す（未設定なら環境変数の設定で作る）"""
+    with _provider_lock:
+        if _provider is not None:
+            return _provider
+    return configure_provider()
@@ -0,0 +1,22 @@
+"""
+生成モデルの設定（モデル名・生成パラメータ）
+google.generativeai を読み込まずに使えるよう、Gemini の呼び出し（igcaption.gemini）とは分けて置く
+"""
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# プロフィールで指定できる生成パラメータ（未指定はモデル既定値、max_output_tokens は 0 も既定値扱い）
+GENERATION_PARAMS = ("temperature", "top_p", "max_output_tokens")
+
+
+def model_settings(profile):
+    """プロフィールから (モデル名, generation_config) を取り出す"""
+    profile = profile or {}
+    model_name = (profile.get("model_name") or "").strip() or DEFAULT_MODEL
+    config = {}
+    for key in GENERATION_PARAMS:
+        value = profile.get(key)
+        if value is None or (key == "max_output_tokens" and not value):
+            continue
+        config[key] = value
+    return model_name, config
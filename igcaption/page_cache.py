@@ -0,0 +1,152 @@
+"""
+商品ページテキストのディスクキャッシュ
+URLごとに抽出済みテキストと ETag / Last-Modified を保存し、
+TTL 切れのページは条件付きリクエスト（304）で再検証する
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_MB = 50
+
+
+class SQLiteLRUCache:
+    """
+    容量上限付きの SQLite キャッシュの共通部分（容量超過時は最終アクセスが古い順に削除）
+    サブクラスは TABLE / KEY とキー以外の列定義 COLUMNS、統計の項目 STATS を決める
+    テーブルの末尾には accessed_at と size（バイト数）の列が付く
+    """
+
+    TABLE = ""
+    KEY = ""
+    COLUMNS = ""
+    STATS = ()
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+            f" {self.KEY} TEXT PRIMARY KEY, {self.COLUMNS},"
+            " accessed_at REAL NOT NULL, size INTEGER NOT NULL)")
+        self._conn.commit()
+        self._stats = dict.fromkeys(self.STATS, 0)
+
+    def _select(self, key, columns):
+        """キーの行（columns の値のタプル）を返し、最終アクセスを更新する。ロックを持って呼ぶ"""
+        row = self._conn.execute(
+            f"SELECT {columns} FROM {self.TABLE} WHERE {self.KEY} = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute(
+                f"UPDATE {self.TABLE} SET accessed_at = ? WHERE {self.KEY} = ?", (time.time(), key))
+            self._conn.commit()
+        return row
+
+    def _put(self, row):
+        """行（列名 → 値。accessed_at と size も含める）を書き込み、容量を超えた分を削除する"""
+        names = list(row)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} ({', '.join(names)})"
+                f" VALUES ({', '.join('?' * len(names))})", [row[n] for n in names])
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            f"SELECT {self.KEY}, size FROM {self.TABLE} ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {self.TABLE} WHERE {self.KEY} = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.commit()
+
+    def record(self, kind):
+        """STATS のいずれかを加算する"""
+        with self._lock:
+            self._stats[kind] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class PageCache(SQLiteLRUCache):
+    """SQLite に保存するページキャッシュ（容量超過時は最終アクセスが古い順に削除）"""
+
+    TABLE = "pages"
+    KEY = "url"
+    COLUMNS = ("text TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+               " fetched_at REAL NOT NULL")
+    STATS = ("hits", "revalidated", "misses")
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_HOURS * 3600,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        super().__init__(path, max_bytes)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, url):
+        """キャッシュ済みエントリを dict で返す。fresh は TTL 内かどうか"""
+        with self._lock:
+            row = self._select(url, "text, etag, last_modified, fetched_at")
+        if row is None:
+            return None
+        text, etag, last_modified, fetched_at = row
+        return {
+            "text": text,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": time.time() - fetched_at < self.ttl_seconds,
+        }
+
+    def put(self, url, text, etag=None, last_modified=None):
+        now = time.time()
+        self._put({"url": url, "text": text, "etag": etag, "last_modified": last_modified,
+                   "fetched_at": now, "accessed_at": now, "size": len(text.encode("utf-8"))})
+
+    def mark_revalidated(self, url):
+        """304 を受けたエントリの取得時刻を更新する"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, url))
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """
+    プロセス共有のページキャッシュを返す
+    環境変数 PAGE_CACHE_DIR / PAGE_CACHE_TTL_HOURS / PAGE_CACHE_MAX_MB で設定を変更できる
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache_dir = Path(os.environ.get("PAGE_CACHE_DIR") or DEFAULT_CACHE_DIR)
+            ttl_hours = float(os.environ.get("PAGE_CACHE_TTL_HOURS") or DEFAULT_TTL_HOURS)
+            max_mb = float(os.environ.get("PAGE_CACHE_MAX_MB") or DEFAULT_MAX_MB)
+            _cache = PageCache(cache_dir / "pages.sqlite3",
+                               ttl_seconds=ttl_hours * 3600,
+                               max_bytes=int(max_mb * 1024 * 1024))
+        return _cache
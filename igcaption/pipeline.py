@@ -0,0 +1,419 @@
+"""
+一括生成パイプライン（Streamlit に依存しない）
+投稿枠の割り当て → 商品ページ取得 → キャプションの並列生成までを行う
+ページ取得と生成は重ねて進め、各投稿は必要なページが揃いしだい生成を始める
+（ブランド投稿やリリース資料の投稿はページ取得を待たない）
+アプリのバックグラウンドジョブとコマンドライン実行の両方から使う
+"""
+
+import copy
+import functools
+import logging
+from datetime import date
+
+from igcaption.caption_cache import get_caption_cache
+from igcaption.captions import generate_captions_for_group
+from igcaption.fetch import fetch_pages, iter_pages
+from igcaption.jobs import get_job_store, get_job_runner, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from igcaption.llm import get_provider
+from igcaption.page_cache import get_page_cache
+from igcaption.product_data import product_name_from_text
+from igcaption.ratelimit import (
+    GenerationScheduler, DEFAULT_RPM, DEFAULT_TPM, DEFAULT_CONCURRENCY,
+)
+from igcaption.schedule import POST_TYPES, build_assignments, get_entry_key
+from igcaption.telemetry import RunTelemetry, collect
+
+logger = logging.getLogger(__name__)
+
+
+def collect_urls(assignments):
+    """URL入力のエントリから取得対象の商品ページURLを重複なく集める"""
+    all_urls = []
+    for entry in assignments:
+        if entry.get("input_method") == "file":
+            continue  # ファイルベースはURL取得不要
+        pt = entry.get("type", "single")
+        if pt == "single":
+            candidates = [entry.get("url", "")]
+        elif pt == "collection":
+            candidates = entry.get("urls", "").strip().split("\n")
+        else:
+            candidates = []
+        for u in candidates:
+            u = u.strip()
+            if u and u not in all_urls:
+                all_urls.append(u)
+    return all_urls
+
+
+# 商品ページの取得前に割り当てた単品投稿の商品名（取得でき次第、ページから取り出した名前に置き換える）
+PENDING_PRODUCT_NAME = "（商品ページ取得中）"
+
+
+def _is_url_single(entry):
+    return entry.get("type", "single") == "single" and entry.get("input_method", "url") != "file"
+
+
+def page_product_name(url, page_texts):
+    """URL 入力の単品投稿の商品名（ページが未取得なら取得中の表示）"""
+    if url and url not in page_texts:
+        return PENDING_PRODUCT_NAME
+    return product_name_from_text(page_texts.get(url, "")) or "不明"
+
+
+def plan_posts(assignments, page_texts, schedule_dates, post_events, total_posts,
+               batch_mode=True):
+    """
+    投稿枠ごとの結果欄（商品名・URL など）と、まとめて生成するグループを組み立てる
+    返り値: (results, groups)  groups は {"entry", "indexes", "slots"} のリスト
+    """
+    results = []
+    # エントリIDでバリエーションカウント（まとめて生成する場合はグループ化にも使う）
+    variation_counter = {}
+    groups = {}
+
+    for i, entry in enumerate(assignments):
+        pt = entry.get("type", "single")
+        im = entry.get("input_method", "url")
+        entry_key = get_entry_key(entry)
+
+        variation_counter[entry_key] = variation_counter.get(entry_key, 0) + 1
+        variation_num = variation_counter[entry_key]
+
+        post_date = schedule_dates[i] if i < len(schedule_dates) else None
+
+        seasonal_event = None
+        if i < len(post_events) and post_events[i][0]:
+            seasonal_event = post_events[i][1]
+
+        # 商品名の特定
+        if pt == "single":
+            if im == "file":
+                pname = entry.get("product_name_manual", "") or entry.get("file_name", "") or "新商品"
+                display_url = ""
+            else:
+                url = entry.get("url", "").strip()
+                pname = page_product_name(url, page_texts)
+                display_url = url
+        elif pt == "collection":
+            pname = entry.get("description", "") or "集合カット"
+            if im == "file":
+                display_url = ""
+            else:
+                urls_str = entry.get("urls", "")
+                first_url = urls_str.strip().split("\n")[0].strip() if urls_str.strip() else ""
+                display_url = first_url
+        else:
+            pname = entry.get("description", "") or "ブランドコンセプト"
+            display_url = ""
+
+        group = groups.setdefault(entry_key if batch_mode else i,
+                                  {"entry": entry, "indexes": [], "slots": []})
+        group["indexes"].append(i)
+        group["slots"].append({
+            "post_number": i + 1, "total_posts": total_posts,
+            "post_date": post_date, "seasonal_event": seasonal_event,
+            "variation": variation_num,
+        })
+
+        results.append({
+            "url": display_url,
+            "product_name": pname,
+            "caption": "",
+            "seasonal_event": seasonal_event or "",
+            "post_type_label": POST_TYPES.get(pt, ""),
+        })
+
+    return results, list(groups.values())
+
+
+def fetch_page_texts(urls, on_message=None):
+    """商品ページをまとめて取得し、(page_texts, warnings, cache_stats) を返す"""
+    def _on_fetch(done, total, url, err):
+        if on_message:
+            on_message(f"商品ページを取得中 ({done}/{total}): {url[:50]}...")
+
+    stats_before = get_page_cache().stats()
+    page_texts = {}
+    warnings = []
+    for url, (text, err) in fetch_pages(urls, on_progress=_on_fetch).items():
+        if err:
+            warnings.append(f"{url}: {err}")
+            page_texts[url] = ""
+        else:
+            page_texts[url] = text
+    stats_after = get_page_cache().stats()
+    cache_stats = {k: stats_after[k] - stats_before[k] for k in stats_after} if urls else None
+    return page_texts, warnings, cache_stats
+
+
+def _interleave(task_lists):
+    """各リストから1件ずつ交互に取り出し、(リスト番号, 位置, タスク) の列にする"""
+    order = []
+    for k in range(max((len(tasks) for tasks in task_lists), default=0)):
+        for n, tasks in enumerate(task_lists):
+            if k < len(tasks):
+                order.append((n, k, tasks[k]))
+    return order
+
+
+def run_specs(specs, api_key, skips=None, concurrency=None, rpm=None, tpm=None,
+              on_message=None, on_plan=None, on_post=None, on_partial=None):
+    """
+    複数の spec（クライアントごとの一括生成）をまとめて実行し、spec ごとの (results, error) を返す
+    - 商品ページは全 spec の URL を重複なく1回だけ取得する
+    - 生成は1つのスケジューラで行い、RPM/TPM の枠を全 spec で共有する。
+      各 spec のタスクは交互に並べて投入するため、投稿数の多いクライアントが他を待たせない
+    - ページ取得と生成は重ねて進め、各グループは必要なページが揃いしだい生成を始める
+    skips[n] に含まれる投稿（生成済み）だけのグループは生成しない
+    on_message(text) / on_plan(n, plan) / on_post(n, index, caption, error) / on_partial(n, index, text)
+    はいずれも呼び出し元スレッドで呼ばれる（n は specs 内の位置）
+    on_plan は割り当て直後と、商品ページをすべて取得した後（商品名・取得エラーが確定した時点）に呼ばれる
+
+    spec のキー:
+      profile, products, total_posts, schedule_dates（ISO 形式の日付）, post_events,
+      batch_mode, stream_mode, concurrency, rpm, tpm, prompt_budget, use_cache
+    concurrency / rpm / tpm を省略した場合は先頭の spec の値を使う
+    prompt_budget（プロンプトのトークン予算）と use_cache（生成済みキャプションの再利用、既定 True）
+    は spec ごとに適用する
+    """
+    def _message(text):
+        if on_message:
+            on_message(text)
+
+    specs = list(specs)
+    skips = skips or [()] * len(specs)
+    outcomes = [(None, None)] * len(specs)
+    if not specs:
+        return outcomes
+
+    # 割り当てを組み立て、全 spec の URL を重複なく集める
+    assignments = {}
+    for n, spec in enumerate(specs):
+        try:
+            assignments[n] = build_assignments(spec["products"])
+        except Exception as e:
+            outcomes[n] = (None, e)
+    all_urls = []
+    for n in assignments:
+        for url in collect_urls(assignments[n]):
+            if url not in all_urls:
+                all_urls.append(url)
+
+    # 投稿枠の割り当てはページ取得を待たずに行う（page_texts は取得でき次第埋まる）
+    page_texts = {}
+    results = {}
+    task_lists = [[] for _ in specs]
+    requires = [[] for _ in specs]
+    groups = [[] for _ in specs]
+    for n, spec in enumerate(specs):
+        if n not in assignments:
+            continue
+        try:
+            schedule_dates = [date.fromisoformat(d) for d in spec["schedule_dates"]]
+            results[n], spec_groups = plan_posts(
+                assignments[n], page_texts, schedule_dates, spec.get("post_events", []),
+                spec["total_posts"], spec.get("batch_mode", True))
+        except Exception as e:
+            outcomes[n] = (None, e)
+            continue
+        skip = set(skips[n])
+        groups[n] = [g for g in spec_groups if not all(i in skip for i in g["indexes"])]
+        task_lists[n] = [
+            functools.partial(generate_captions_for_group,
+                              g["entry"], page_texts, spec["profile"], api_key, g["slots"],
+                              budget=spec.get("prompt_budget"),
+                              use_cache=spec.get("use_cache", True))
+            for g in groups[n]
+        ]
+        requires[n] = [set(collect_urls([g["entry"]])) for g in groups[n]]
+
+    warnings = []
+    fetched = []
+    cache_stats = [None]
+    stats_before = get_page_cache().stats()
+
+    def _publish_plan():
+        if not on_plan:
+            return
+        for n in results:
+            urls = set(collect_urls(assignments[n]))
+            on_plan(n, {
+                "results": [{**item, "caption": ""} for item in results[n]],
+                "warnings": [w for w in warnings if w.split(": ", 1)[0] in urls],
+                "cache_stats": cache_stats[0] if urls else None,
+            })
+
+    def _on_page(url, result):
+        text, err = result
+        page_texts[url] = "" if err else text
+        if err:
+            warnings.append(f"{url}: {err}")
+        fetched.append(url)
+        _message(f"商品ページを取得中 ({len(fetched)}/{len(all_urls)}): {url[:50]}...")
+        for n in results:
+            for i, entry in enumerate(assignments[n]):
+                if _is_url_single(entry) and entry.get("url", "").strip() == url:
+                    results[n][i]["product_name"] = page_product_name(url, page_texts)
+        if len(fetched) == len(all_urls):
+            stats_after = get_page_cache().stats()
+            cache_stats[0] = {k: stats_after[k] - stats_before[k] for k in stats_after}
+            _publish_plan()
+
+    # 割り当て直後（商品名は取得中）と、全ページの取得後（商品名・取得エラーが確定）に通知する
+    _publish_plan()
+    if all_urls:
+        _message("商品ページを取得中...")
+
+    # 並列生成（RPM/TPM に合わせて送信し、429 のときだけバックオフ）
+    order = _interleave(task_lists)
+    labels = [spec["profile"].get("name", "") if len(specs) > 1 else "" for spec in specs]
+
+    def _on_chunk(task_index, k, text):
+        n, g, _ = order[task_index]
+        on_partial(n, groups[n][g]["indexes"][k], text)
+
+    def _on_generated(done, total, task_index, captions, err):
+        n, g, _ = order[task_index]
+        indexes = groups[n][g]["indexes"]
+        for k, index in enumerate(indexes):
+            caption = None if err else captions[k]
+            results[n][index]["caption"] = f"生成エラー: {err}" if err else caption
+            if on_post:
+                on_post(n, index, caption, str(err) if err else None)
+        label = f"{labels[n]}: " if labels[n] else ""
+        _message(f"キャプション生成中: {label}{results[n][indexes[0]]['product_name']}")
+
+    def _on_retry(task_index, attempt, max_retries, wait, exc):
+        n, g, _ = order[task_index]
+        first = groups[n][g]["indexes"][0]
+        label = f"{labels[n]} " if labels[n] else ""
+        _message(f"⏳ レートリミット到達（{label}#{first+1}）。"
+                 f"{wait:.0f}秒待機後にリトライします... ({attempt}/{max_retries})")
+
+    first = specs[0]
+    scheduler = GenerationScheduler(
+        max_workers=concurrency or first.get("concurrency", DEFAULT_CONCURRENCY),
+        rpm=rpm or first.get("rpm", DEFAULT_RPM), tpm=tpm or first.get("tpm", DEFAULT_TPM))
+    stream = on_partial and any(spec.get("stream_mode") for spec in specs)
+    scheduler.run([task for _, _, task in order], on_done=_on_generated, on_retry=_on_retry,
+                  on_chunk=_on_chunk if stream else None,
+                  requires=[requires[n][g] for n, g, _ in order],
+                  inputs=iter_pages(all_urls) if all_urls else None, on_input=_on_page)
+
+    for n in results:
+        outcomes[n] = (results[n], None)
+    return outcomes
+
+
+def run_pipeline(spec, api_key, skip=(), on_message=None, on_plan=None, on_post=None,
+                 on_partial=None):
+    """
+    spec 1件分のページ取得 → 投稿枠の割り当て → キャプション生成を行い、結果欄のリストを返す
+    コールバックは run_specs と同じ（spec の位置の引数を除く）
+    """
+    def _drop_index(callback):
+        return (lambda n, *args: callback(*args)) if callback else None
+
+    (results, err), = run_specs(
+        [spec], api_key, skips=[skip], on_message=on_message, on_plan=_drop_index(on_plan),
+        on_post=_drop_index(on_post), on_partial=_drop_index(on_partial))
+    if err:
+        raise err
+    return results
+
+
+def regenerate_post(spec, index, api_key):
+    """
+    1投稿だけをキャッシュを使わずに生成し直し、(caption, error) を返す
+    商品ページはその投稿のエントリの分だけをページキャッシュから読み、
+    生成結果は次回以降のためにキャプションキャッシュへ保存する
+    """
+    try:
+        assignments = build_assignments(spec["products"])
+        schedule_dates = [date.fromisoformat(d) for d in spec["schedule_dates"]]
+        # 投稿の割り振りはページの内容に依存しないため、取得前に対象の投稿を決める
+        _, groups = plan_posts(assignments, {}, schedule_dates, spec.get("post_events", []),
+                               spec["total_posts"], batch_mode=False)
+        group = next(g for g in groups if index in g["indexes"])
+        page_texts, _, _ = fetch_page_texts(collect_urls([group["entry"]]))
+        captions = generate_captions_for_group(
+            group["entry"], page_texts, spec["profile"], api_key, group["slots"],
+            budget=spec.get("prompt_budget"), use_cache=False)
+        return captions[0], None
+    except Exception as e:
+        return None, str(e)
+
+
+def caption_cache_message(before, after):
+    """生成前後のキャプションキャッシュ統計から、再利用した件数の表示を作る（なければ空文字）"""
+    hits = after["hits"] - before["hits"]
+    return f"（変更のない {hits} 件は前回の生成結果を再利用）" if hits else ""
+
+
+def run_generation_job(job_id, api_key):
+    """
+    一括生成ジョブ本体（ワーカースレッドで実行する）
+    完成した投稿はグループ単位でジョブストアに保存し、再開時は保存済みの投稿を飛ばす
+    実行の計測結果はジョブに保存し、JSONL（telemetry_path()）にも追記する
+    """
+    store = get_job_store()
+    runner = get_job_runner()
+    spec = store.get_job(job_id)["spec"]
+    telemetry = RunTelemetry(job_id, meta=run_meta([spec]))
+    try:
+        store.set_status(job_id, JOB_RUNNING)
+        # 再開時は保存済み（エラー以外）の投稿を飛ばす
+        finished = {i for i, (_, err) in store.posts(job_id).items() if err is None}
+        telemetry.meta["skipped_posts"] = len(finished)
+        stats_before = get_caption_cache().stats()
+        with collect(telemetry):
+            run_pipeline(
+                spec, api_key, skip=finished,
+                on_message=lambda text: store.set_message(job_id, text),
+                on_plan=lambda plan: store.set_plan(job_id, plan),
+                on_post=lambda index, caption, err: store.save_post(
+                    job_id, index, caption=caption, error=err),
+                on_partial=lambda index, text: runner.set_partial(job_id, index, text))
+        reused = caption_cache_message(stats_before, get_caption_cache().stats())
+        _save_telemetry(store, job_id, telemetry)
+        store.set_status(job_id, JOB_DONE, message=f"✅ 全投稿の生成が完了しました！{reused}")
+    except Exception as e:
+        _save_telemetry(store, job_id, telemetry)
+        store.set_status(job_id, JOB_FAILED, error=str(e))
+
+
+def run_meta(specs, **overrides):
+    """計測結果に添える実行条件（クライアント・投稿数・並列度・レート上限など）"""
+    first = specs[0] if specs else {}
+    meta = {
+        "clients": [spec["profile"].get("name", "") for spec in specs],
+        "total_posts": sum(spec["total_posts"] for spec in specs),
+        "batch_mode": first.get("batch_mode", True),
+        "concurrency": first.get("concurrency", DEFAULT_CONCURRENCY),
+        "rpm": first.get("rpm", DEFAULT_RPM),
+        "tpm": first.get("tpm", DEFAULT_TPM),
+        "prompt_budget": first.get("prompt_budget"),
+        "use_cache": first.get("use_cache", True),
+        "provider": get_provider().name,
+    }
+    meta.update(overrides)
+    return meta
+
+
+def _save_telemetry(store, job_id, telemetry):
+    store.set_telemetry(job_id, telemetry.to_dict(events=True))
+    try:
+        telemetry.write_jsonl()
+    except OSError as e:
+        logger.warning("計測結果を書き込めませんでした: %s", e)
+
+
+def job_results(job):
+    """ジョブの結果欄に保存済みのキャプションを埋めて返す"""
+    results = copy.deepcopy((job["plan"] or {}).get("results") or [])
+    for index, (caption, err) in get_job_store().posts(job["id"]).items():
+        if index < len(results):
+            results[index]["caption"] = f"生成エラー: {err}" if err else caption
+    return results
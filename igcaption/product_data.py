@@ -0,0 +1,306 @@
+"""
+商品ページの構造化データ（schema.org Product の JSON-LD / microdata、OpenGraph）の読み取り
+見つかった項目（商品名・ブランド・価格・説明・成分・素材）を短い商品情報にまとめ、
+ページ本文の代わりにプロンプトへ渡す。項目の優先順は JSON-LD → microdata → OpenGraph
+"""
+
+import html as html_lib
+import json
+import re
+from html.parser import HTMLParser
+
+# 商品情報の見出し（商品名の行は plan_posts での商品名の特定にも使う）
+NAME_LABEL = "商品名: "
+# 商品情報の後ろにページ本文を続けるときの見出し
+BODY_HEADER = "【ページ本文】"
+FIELD_LABELS = (
+    ("name", "商品名"),
+    ("brand", "ブランド"),
+    ("price", "価格"),
+    ("ingredients", "成分"),
+    ("materials", "素材"),
+    ("description", "説明"),
+)
+
+# additionalProperty の名前がこれらを含めば成分、素材として扱う
+INGREDIENT_KEYWORDS = ("成分", "ingredient")
+MATERIAL_KEYWORDS = ("素材", "材質", "material")
+
+MAX_NAME_CHARS = 50
+
+_JSON_LD = re.compile(
+    r"""<script[^>]+type\s*=\s*["']?application/ld\+json["']?[^>]*>(.*?)</script>""",
+    re.IGNORECASE | re.DOTALL)
+_META_TAG = re.compile(r"<meta\b[^>]*>", re.IGNORECASE)
+_ATTR = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+_TAG = re.compile(r"<[^>]+>")
+_BR = re.compile(r"<br\s*/?>|</p>|</li>|</div>", re.IGNORECASE)
+_PRODUCT_ITEMTYPE = re.compile(r"itemtype\s*=\s*[\"']?https?://schema\.org/Product", re.IGNORECASE)
+_HEAD_END = re.compile(r"</head\s*>", re.IGNORECASE)
+
+# microdata の読み取りで一度にパーサーへ渡す文字数
+MICRODATA_CHUNK_CHARS = 16 * 1024
+
+
+def _clean(value):
+    """HTML を含みうる値をプレーンテキストにする"""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        return str(value)
+    if not isinstance(value, str):
+        return ""
+    text = html_lib.unescape(_TAG.sub("", _BR.sub("\n", value)))
+    lines = (re.sub(r"[ \t　]+", " ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def _first(value):
+    return value[0] if isinstance(value, list) and value else value
+
+
+def _name_of(value):
+    """brand などの値（文字列 / {"name": ...} / そのリスト）から名前を取り出す"""
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("name")
+    return _clean(value)
+
+
+def _join_values(value):
+    if isinstance(value, list):
+        return "、".join(v for v in (_name_of(x) for x in value) if v)
+    return _name_of(value)
+
+
+def _format_price(amount, currency):
+    amount = _clean(amount)
+    if not amount:
+        return ""
+    try:
+        number = float(amount.replace(",", ""))
+        amount = f"{number:,.0f}" if number == int(number) else f"{number:,.2f}"
+    except ValueError:
+        return amount
+    currency = _clean(currency).upper()
+    if currency in ("", "JPY"):
+        return f"{amount}円"
+    return f"{amount} {currency}"
+
+
+# ── JSON-LD ──
+def _is_product(node):
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    return any(t in ("Product", "ProductGroup", "IndividualProduct") for t in types)
+
+
+def _walk(node):
+    """JSON-LD の木から dict を順に返す（@graph や入れ子の配列もたどる）"""
+    if isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+    elif isinstance(node, dict):
+        yield node
+        for key in ("@graph", "mainEntity", "itemListElement"):
+            if key in node:
+                yield from _walk(node[key])
+
+
+def _from_json_ld(html):
+    for block in _JSON_LD.findall(html):
+        try:
+            data = json.loads(block.strip(), strict=False)
+        except ValueError:
+            continue
+        for node in _walk(data):
+            if not _is_product(node):
+                continue
+            offers = _first(node.get("offers")) or {}
+            if not isinstance(offers, dict):
+                offers = {}
+            if isinstance(node.get("hasVariant"), list) and not offers:
+                offers = _first(_first(node["hasVariant"]).get("offers")) or {}
+            record = {
+                "name": _clean(node.get("name")),
+                "brand": _name_of(node.get("brand")),
+                "description": _clean(node.get("description")),
+                "price": _format_price(offers.get("price") or offers.get("lowPrice"),
+                                       offers.get("priceCurrency")),
+                "materials": _join_values(node.get("material")),
+                "ingredients": _join_values(node.get("ingredients")),
+            }
+            for prop in node.get("additionalProperty") or []:
+                if not isinstance(prop, dict):
+                    continue
+                label = _clean(prop.get("name")).lower()
+                value = _clean(prop.get("value"))
+                if not value:
+                    continue
+                if any(k in label for k in INGREDIENT_KEYWORDS):
+                    record["ingredients"] = record["ingredients"] or value
+                elif any(k in label for k in MATERIAL_KEYWORDS):
+                    record["materials"] = record["materials"] or value
+            return record
+    return {}
+
+
+# ── microdata ──
+class _MicrodataParser(HTMLParser):
+    """itemtype が Product の itemscope 直下（と Offer / Brand）の itemprop を集める"""
+
+    PROPS = {"name", "brand", "description", "price", "lowPrice", "priceCurrency", "material"}
+    OFFER_PROPS = {"price", "lowPrice", "priceCurrency"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []             # 開いている要素 [(tag, scope の型 or None, 収集中の itemprop)]
+        self.values = {}
+        self.collecting = []        # [(itemprop, 文字列のリスト)]
+        self.done = False           # 最初に開いた要素（Product の itemscope）が閉じたか
+
+    def _scope(self):
+        for _, scope, _ in reversed(self.stack):
+            if scope is not None:
+                return scope
+        return None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        owner = self._scope()
+        prop = attrs.get("itemprop")
+        scope = None
+        if "itemscope" in attrs:
+            scope = (attrs.get("itemtype") or "").rstrip("/").rsplit("/", 1)[-1] or "Thing"
+        collecting = None
+        wanted = owner == "Product" or (
+            owner in ("Offer", "AggregateOffer") and prop in self.OFFER_PROPS)
+        if prop in self.PROPS and prop not in self.values and wanted:
+            value = attrs.get("content")
+            if value is not None:
+                self.values[prop] = value
+            elif scope is None or prop == "brand":
+                collecting = prop
+                self.values[prop] = None
+                self.collecting.append((prop, []))
+        if tag in ("meta", "link", "img", "br", "input"):
+            return
+        self.stack.append((tag, scope, collecting))
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, _, collecting = self.stack.pop()
+            if collecting:
+                prop, parts = self.collecting.pop()
+                self.values[prop] = "\n".join(p.strip() for p in parts if p.strip())
+            if open_tag == tag:
+                break
+        if not self.stack:
+            self.done = True
+
+    def handle_data(self, data):
+        for _, parts in self.collecting:
+            parts.append(data)
+
+
+def _from_microdata(html):
+    m = _PRODUCT_ITEMTYPE.search(html)
+    if not m:
+        return {}
+    # Product の itemscope の開始タグから、その要素が閉じるまでだけを読む
+    start = html.rfind("<", 0, m.start())
+    parser = _MicrodataParser()
+    for pos in range(max(start, 0), len(html), MICRODATA_CHUNK_CHARS):
+        parser.feed(html[pos:pos + MICRODATA_CHUNK_CHARS])
+        if parser.done:
+            break
+    parser.close()
+    values = parser.values
+    return {
+        "name": _clean(values.get("name")),
+        "brand": _clean(values.get("brand")),
+        "description": _clean(values.get("description")),
+        "price": _format_price(values.get("price") or values.get("lowPrice"),
+                               values.get("priceCurrency")),
+        "materials": _clean(values.get("material")),
+    }
+
+
+# ── OpenGraph ──
+def _from_open_graph(html):
+    head_end = _HEAD_END.search(html)
+    meta = {}
+    for tag in _META_TAG.findall(html[:head_end.start()] if head_end else html):
+        attrs = {m.group(1).lower(): next(v for v in m.groups()[1:] if v is not None)
+                 for m in _ATTR.finditer(tag)}
+        key = (attrs.get("property") or attrs.get("name") or "").lower()
+        if key and "content" in attrs and key not in meta:
+            meta[key] = attrs["content"]
+    # 商品ページ（og:type が product か product: の項目がある）以外の OpenGraph は使わない
+    is_product = (meta.get("og:type", "").strip().lower().startswith("product")
+                  or any(key.startswith("product:") for key in meta))
+    if not meta.get("og:title") or not is_product:
+        return {}
+    name = _clean(meta["og:title"])
+    site = _clean(meta.get("og:site_name"))
+    if site:
+        # 「商品名 | ショップ名」の形ならショップ名を落とす
+        name = re.sub(rf"\s*[|｜\-–—:：]\s*{re.escape(site)}\s*$", "", name) or name
+    return {
+        "name": name,
+        "brand": _clean(meta.get("product:brand") or meta.get("og:brand")),
+        "description": _clean(meta.get("og:description")),
+        "price": _format_price(meta.get("product:price:amount") or meta.get("og:price:amount"),
+                               meta.get("product:price:currency") or meta.get("og:price:currency")),
+    }
+
+
+def extract_product_data(html):
+    """
+    構造化データから商品情報を取り出す。{name, brand, price, description, ingredients, materials}
+    のうち見つかった項目だけを持つ dict を返す（何もなければ空の dict）
+    """
+    record = {}
+    for source in (_from_json_ld, _from_microdata, _from_open_graph):
+        try:
+            found = source(html)
+        except Exception:
+            continue
+        for key, value in found.items():
+            if value and not record.get(key):
+                record[key] = value
+    return record
+
+
+def format_product_data(record):
+    """商品情報を「項目: 値」の行にまとめる（説明は次の行から）"""
+    lines = []
+    for key, label in FIELD_LABELS:
+        value = record.get(key)
+        if not value:
+            continue
+        if key == "description":
+            lines.append(f"{label}:\n{value}")
+        else:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+def product_name_from_text(text):
+    """
+    ページテキストから商品名を取り出す（商品情報の「商品名:」行、なければ本文の最初の行）
+    商品名のない商品情報（ブランドや価格だけ）の後ろに本文が続く場合は、本文の最初の行を使う
+    """
+    text = text or ""
+    m = re.search(rf"^{re.escape(NAME_LABEL)}(.+)$", text, re.M)
+    if m:
+        return m.group(1).strip()[:MAX_NAME_CHARS]
+    if BODY_HEADER in text:
+        text = text.split(BODY_HEADER, 1)[1]
+    for line in text.split("\n"):
+        line = line.strip()
+        if line:
+            return line[:MAX_NAME_CHARS]
+    return ""
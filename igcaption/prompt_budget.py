@@ -0,0 +1,148 @@
+"""
+プロンプトのトークン予算
+プロンプトを区画（セクション）に分けてトークン数を数え、合計が予算を超える場合は
+優先度の低い区画から削る（サンプル投稿文の2件目以降 → 商品情報の末尾 の順）
+システム指示はクライアントごとに一定になるよう、投稿ごとのプロンプトとは別に枠を決めて削る
+区画ごとの内訳は投稿ごとにログ（igcaption.prompt_budget, INFO）に出す
+"""
+
+import csv
+import io
+import logging
+import os
+import re
+
+from igcaption.ratelimit import count_tokens
+
+# システム指示（クライアント共通部分）と投稿ごとのプロンプトを合わせた入力トークンの上限
+DEFAULT_PROMPT_BUDGET = 16_000
+
+# システム指示（サンプル投稿文）に使える予算の割合。残りを投稿ごとのプロンプトに充てる
+CONTEXT_BUDGET_SHARE = 0.5
+
+# 商品情報はこれより短くは削らない
+MIN_TAIL_TOKENS = 400
+TRIM_MARK = "\n（以下省略）"
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_budget(value=None):
+    """予算（トークン数）を返す。未指定なら環境変数 PROMPT_TOKEN_BUDGET、なければ既定値"""
+    if value:
+        return int(value)
+    return int(os.environ.get("PROMPT_TOKEN_BUDGET") or DEFAULT_PROMPT_BUDGET)
+
+
+def split_samples(text):
+    """
+    サンプル投稿文を1件ずつに分ける
+    スプレッドシートから貼り付けたタブ区切り（引用符で囲まれたセル）か、--- の行で区切られた形式に対応
+    """
+    text = (text or "").strip()
+    if "\t" in text:
+        cells = [c.strip() for row in csv.reader(io.StringIO(text), delimiter="\t") for c in row]
+        samples = [c for c in cells if c]
+    else:
+        samples = [s.strip() for s in re.split(r"\n\s*-{3,}\s*\n", text) if s.strip()]
+    return samples or ([text] if text else [])
+
+
+class PromptSection:
+    """
+    プロンプトの1区画（header + body + footer）
+    trim: None は削らない / "items" は items を末尾から1件ずつ落とす（最低1件残す）/
+          "tail" は body の末尾を削る（MIN_TAIL_TOKENS まで）
+    """
+
+    def __init__(self, name, body, part="prompt", trim=None, header="", footer="", items=None):
+        self.name = name
+        self.part = part            # "context"（システム指示）か "prompt"
+        self.trim = trim
+        self.header = header
+        self.footer = footer
+        self.body = body
+        self.items = list(items) if items else None
+        self.original_tokens = self.tokens
+
+    @property
+    def text(self):
+        return f"{self.header}{self.body}{self.footer}"
+
+    @property
+    def tokens(self):
+        return count_tokens(self.text)
+
+    def drop_item(self):
+        self.items.pop()
+        self.body = "\n\n".join(self.items)
+
+    def cut_tail(self, tokens):
+        """body を tokens トークンに切り詰める"""
+        self.body = self.body[:max(0, tokens - count_tokens(TRIM_MARK))].rstrip() + TRIM_MARK
+
+
+def render(sections, part):
+    return "".join(s.text for s in sections if s.part == part)
+
+
+def _cut_tails(sections, excess):
+    """tail 区画を長いものから均等な長さにそろえるように削り、excess トークン分を減らす"""
+    tails = [s for s in sections if s.trim == "tail" and count_tokens(s.body) > MIN_TAIL_TOKENS]
+    if not tails or excess <= 0:
+        return
+    lengths = [count_tokens(s.body) for s in tails]
+
+    def _saved(level):
+        return sum(max(0, n - max(level, MIN_TAIL_TOKENS)) for n in lengths)
+
+    # 削減量が excess 以上になる最大の長さを二分探索する
+    lo, hi = MIN_TAIL_TOKENS, max(lengths)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _saved(mid) >= excess:
+            lo = mid
+        else:
+            hi = mid - 1
+    for section, n in zip(tails, lengths):
+        if n > lo:
+            section.cut_tail(lo)
+
+
+def fit_to_budget(sections, budget):
+    """合計が budget を超えていれば、サンプル → 商品情報の末尾の順に削る"""
+    def _excess():
+        return sum(s.tokens for s in sections) - budget
+
+    for section in reversed([s for s in sections if s.trim == "items"]):
+        while _excess() > 0 and section.items and len(section.items) > 1:
+            section.drop_item()
+    _cut_tails(sections, _excess())
+    return sum(s.tokens for s in sections)
+
+
+def log_breakdown(sections, budget, label=""):
+    total = sum(s.tokens for s in sections)
+    parts = []
+    for s in sections:
+        cut = s.original_tokens - s.tokens
+        parts.append(f"{s.name}={s.tokens}" + (f"(-{cut})" if cut > 0 else ""))
+    level = logging.WARNING if total > budget else logging.INFO
+    logger.log(level, "prompt %s: %d/%d tokens [%s]", label, total, budget, " ".join(parts))
+
+
+def assemble_prompt(context_sections, prompt_sections, budget=None, label=""):
+    """
+    予算内に収めたシステム指示とプロンプトを (context, prompt) で返す
+    システム指示は予算の CONTEXT_BUDGET_SHARE 分だけで収まるかを見てサンプル投稿文を削り、
+    プロンプトは残りの枠に収める（投稿ごとの長さでシステム指示が変わると、
+    コンテキストキャッシュとキャプションキャッシュのキーが投稿ごとに変わってしまうため）
+    削っても収まらない場合（削れない区画だけで超える場合）はそのまま返し、警告をログに出す
+    """
+    budget = prompt_budget(budget)
+    context_sections, prompt_sections = list(context_sections), list(prompt_sections)
+    context_tokens = fit_to_budget(context_sections, int(budget * CONTEXT_BUDGET_SHARE))
+    fit_to_budget(prompt_sections, budget - context_tokens)
+    sections = context_sections + prompt_sections
+    log_breakdown(sections, budget, label)
+    return render(sections, "context"), render(sections, "prompt")
@@ -0,0 +1,246 @@
+"""
+Gemini API のレート制御
+- RPM / TPM のトークンバケットで送信ペースを調整
+- 429 を受けたときだけ指数バックオフ（ジッター付き・retry-after 優先）
+- 複数リクエストを並列実行するスケジューラ
+"""
+
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from igcaption.telemetry import bind
+
+# 既定値（Gemini 2.5 Flash 無料枠相当）
+DEFAULT_RPM = 10
+DEFAULT_TPM = 250_000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+
+# 出力分の見込みトークン数（キャプション1件あたり）
+OUTPUT_TOKEN_ALLOWANCE = 1024
+
+
+def count_tokens(text):
+    """テキストのトークン数を概算する（日本語主体のため1文字≒1トークンで多めに見積もる）"""
+    return len(text or "")
+
+
+def estimate_tokens(text):
+    """1リクエストで消費するトークン数を概算する（プロンプト＋出力の見込み）"""
+    return count_tokens(text) + OUTPUT_TOKEN_ALLOWANCE
+
+
+class TokenBucket:
+    """1分あたり rate_per_minute 単位を補充するトークンバケット"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """amount 単位を予約し、使用可能になるまでの待ち秒数を返す"""
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """RPM と TPM の両方を満たすまで待機するリミッター（スレッド間で共有）"""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._blocked_until - time.monotonic())
+        if wait > 0:
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        """429 受信時、全ワーカーの送信を seconds 秒止める"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+def is_rate_limit_error(exc):
+    text = str(exc)
+    return ("429" in text or "RESOURCE_EXHAUSTED" in text
+            or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests"))
+
+
+def retry_after_seconds(exc):
+    """例外から retry-after のヒントを取り出す。見つからなければ None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None and hasattr(headers, "get"):
+        value = headers.get("Retry-After")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    text = str(exc)
+    m = (re.search(r"retry in ([\d.]+)\s*s", text, re.IGNORECASE)
+         or re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", text))
+    if m:
+        return float(m.group(1))
+    return None
+
+
+def backoff_delay(attempt, retry_after=None, base=2.0, cap=60.0):
+    """attempt 回目の待ち秒数。retry-after があればそれを優先し、なければ指数＋ジッター"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def call_with_backoff(fn, limiter=None, tokens=0, max_retries=DEFAULT_MAX_RETRIES,
+                      on_retry=None, stats=None):
+    """
+    fn() を実行し、429 のときだけバックオフしてリトライする
+    on_retry(attempt, max_retries, wait, exc) はリトライ前に呼ばれる
+    stats（dict）を渡すと、レート制御の待ち秒数（limiter_wait）とリトライ回数・待ち秒数を加算する
+    """
+    stats = {} if stats is None else stats
+    for attempt in range(max_retries):
+        if limiter is not None:
+            started = time.perf_counter()
+            limiter.acquire(tokens)
+            stats["limiter_wait"] = round(
+                stats.get("limiter_wait", 0) + time.perf_counter() - started, 4)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt >= max_retries - 1:
+                raise
+            wait = backoff_delay(attempt, retry_after_seconds(e))
+            stats["retries"] = stats.get("retries", 0) + 1
+            stats["retry_wait"] = round(stats.get("retry_wait", 0) + wait, 3)
+            if limiter is not None:
+                limiter.penalize(wait)
+            if on_retry:
+                on_retry(attempt + 2, max_retries, wait, e)
+            if limiter is None:
+                time.sleep(wait)
+
+
+class GenerationScheduler:
+    """
+    生成リクエストを並列実行するスケジューラ
+    タスクは task(limiter=..., on_retry=...) の形で呼ばれ、共有リミッターを通して API を叩く
+    （on_chunk を渡した場合は task(..., on_chunk=...) でストリーミングの途中経過も受け取る）
+    """
+
+    def __init__(self, max_workers=DEFAULT_CONCURRENCY, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.max_workers = max(1, int(max_workers))
+        self.limiter = RateLimiter(rpm, tpm)
+
+    def run(self, tasks, on_done=None, on_retry=None, on_chunk=None,
+            requires=None, inputs=None, on_input=None):
+        """
+        tasks を並列実行し、入力順の [(result, error), ...] を返す
+        on_done(done, total, index, result, error) / on_retry(index, attempt, max_retries, wait, exc)
+        / on_chunk(index, *args) はいずれも呼び出し元スレッドで呼ばれる
+
+        依存する入力がある場合（商品ページの取得など）:
+        - requires[i] はタスク i が待つ入力キーの集合（空なら最初から実行できる）
+        - inputs は (key, value) を届いた順に返すイテラブルで、別スレッドで読み進める
+        - キーが届くたびに on_input(key, value) を呼び出し元スレッドで呼び、
+          待っている入力がすべて揃ったタスクから実行する
+        inputs が例外で止まった場合、入力を待っているタスクはその例外で失敗扱いにする
+        inputs を渡した場合は、タスクが先に終わっても inputs を最後まで読んでから返る
+        """
+        tasks = list(tasks)
+        outcomes = [(None, None)] * len(tasks)
+        if not tasks and inputs is None:
+            return outcomes
+
+        waiting = {i: set(keys) for i, keys in enumerate(requires or []) if keys}
+        if waiting and inputs is None:
+            raise ValueError("requires を指定した場合は inputs も指定してください")
+        events = queue.Queue()
+
+        def _worker(index, task):
+            def _retry(attempt, max_retries, wait, exc):
+                events.put(("retry", index, (attempt, max_retries, wait, exc)))
+
+            def _chunk(*args):
+                events.put(("chunk", index, args))
+
+            kwargs = {"limiter": self.limiter, "on_retry": _retry}
+            if on_chunk:
+                kwargs["on_chunk"] = _chunk
+            try:
+                result = task(**kwargs)
+                events.put(("done", index, (result, None)))
+            except Exception as e:
+                events.put(("done", index, (None, e)))
+
+        def _feed():
+            try:
+                for key, value in inputs:
+                    events.put(("input", key, value))
+                events.put(("inputs_done", None, None))
+            except Exception as e:
+                events.put(("inputs_done", None, e))
+
+        workers = max(1, min(self.max_workers, len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generate") as pool:
+            for index, task in enumerate(tasks):
+                if index not in waiting:
+                    pool.submit(bind(_worker), index, task)
+            if inputs is not None:
+                threading.Thread(target=bind(_feed), name="generate-inputs", daemon=True).start()
+            done = 0
+            feeding = inputs is not None
+            while done < len(tasks) or feeding:
+                kind, index, payload = events.get()
+                if kind == "retry":
+                    if on_retry:
+                        on_retry(index, *payload)
+                    continue
+                if kind == "chunk":
+                    on_chunk(index, *payload)
+                    continue
+                if kind == "input":
+                    if on_input:
+                        on_input(index, payload)
+                    for i in sorted(waiting):
+                        waiting[i].discard(index)
+                        if not waiting[i]:
+                            del waiting[i]
+                            pool.submit(bind(_worker), i, tasks[i])
+                    continue
+                if kind == "inputs_done":
+                    feeding = False
+                    # 届かなかった入力は空のまま実行する（入力側の例外ならそのタスクは失敗）
+                    for i in sorted(waiting):
+                        if payload is None:
+                            pool.submit(bind(_worker), i, tasks[i])
+                        else:
+                            events.put(("done", i, (None, payload)))
+                    waiting.clear()
+                    continue
+                done += 1
+                outcomes[index] = payload
+                if on_done:
+                    on_done(done, len(tasks), index, *payload)
+        return outcomes
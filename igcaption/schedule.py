@@ -0,0 +1,119 @@
+"""
+投稿スケジュールと投稿枠の割り当て
+曜日ベースの配信日、商品エントリのラウンドロビン割り当て、季節イベントの候補
+"""
+
+import hashlib
+from datetime import timedelta
+
+WEEKDAY_NAMES = ["月", "火", "水", "木", "金", "土", "日"]
+
+# 投稿タイプ定義
+POST_TYPES = {
+    "single": "📷 単品紹介",
+    "collection": "📸 集合カット（複数商品）",
+    "brand": "💎 ブランドコンセプト",
+}
+
+# ── 季節イベント定義 ──────────────────────────────────
+SEASONAL_EVENTS_BY_MONTH = {
+    1: ["元旦・新年", "成人の日"],
+    2: ["バレンタインデー", "節分"],
+    3: ["ホワイトデー", "ひな祭り", "春分の日", "卒業・新生活準備"],
+    4: ["イースター", "新生活シーズン", "花粉・ゆらぎ肌対策"],
+    5: ["母の日", "ゴールデンウィーク", "紫外線対策"],
+    6: ["父の日", "梅雨・湿気対策"],
+    7: ["七夕", "夏本番・UV対策"],
+    8: ["お盆", "夏バテ対策", "残暑ケア"],
+    9: ["敬老の日", "秋分の日", "秋のスキンケア"],
+    10: ["ハロウィン", "乾燥対策シーズン"],
+    11: ["ブラックフライデー", "いい肌の日(11/8)"],
+    12: ["クリスマス", "年末・冬の保湿ケア"],
+}
+
+ALL_EVENTS = []
+for month, events in sorted(SEASONAL_EVENTS_BY_MONTH.items()):
+    for ev in events:
+        if ev not in ALL_EVENTS:
+            ALL_EVENTS.append(ev)
+
+
+def get_suggested_events(post_date):
+    month = post_date.month
+    events = list(SEASONAL_EVENTS_BY_MONTH.get(month, []))
+    prev_month = 12 if month == 1 else month - 1
+    next_month = 1 if month == 12 else month + 1
+    for ev in SEASONAL_EVENTS_BY_MONTH.get(prev_month, []):
+        if ev not in events:
+            events.append(ev)
+    for ev in SEASONAL_EVENTS_BY_MONTH.get(next_month, []):
+        if ev not in events:
+            events.append(ev)
+    return events
+
+
+# ── 投稿スケジュール生成（曜日ベース）────────────────
+def generate_schedule_weekday(total_posts, start_date, post_weekdays):
+    dates = []
+    current = start_date
+    while current.weekday() not in post_weekdays:
+        current += timedelta(days=1)
+    while len(dates) < total_posts:
+        if current.weekday() in post_weekdays:
+            dates.append(current)
+        current += timedelta(days=1)
+    return dates
+
+
+# ── 投稿割り当て生成 ──────────────────────────────
+def build_assignments(product_entries):
+    """
+    product_entries: list of dict
+      - type: "single" | "collection" | "brand"
+      - url: str (single用)
+      - urls: str (collection用、改行区切り)
+      - description: str (collection/brand用の補足)
+      - count: int
+    各エントリをcount回分、ラウンドロビンで投稿枠に割り当てる。
+    返り値: list of dict (各投稿枠の情報)
+    """
+    remaining = []
+    for entry in product_entries:
+        remaining.append({"entry": entry, "left": entry["count"]})
+
+    assignments = []
+    total = sum(e["count"] for e in product_entries)
+    while len(assignments) < total:
+        for item in remaining:
+            if item["left"] > 0:
+                assignments.append(item["entry"])
+                item["left"] -= 1
+                if len(assignments) >= total:
+                    break
+    return assignments
+
+
+def _digest(*values):
+    return hashlib.sha256("\0".join(values).encode("utf-8")).hexdigest()[:16]
+
+
+def get_entry_key(entry):
+    """
+    エントリの識別キー（同じ商品・組み合わせの投稿をまとめるために使う）
+    プロンプトに入る内容（資料のテキスト・手入力の商品名・写真の説明）もキーに含め、
+    同じファイル名の別資料などを1つにまとめないようにする
+    """
+    pt = entry.get("type", "single")
+    im = entry.get("input_method", "url")
+    if pt == "single":
+        if im == "file":
+            content = _digest(entry.get("file_text", ""), entry.get("product_name_manual", ""))
+            return f"single:file:{entry.get('file_name', '')}:{content}"
+        return f"single:{entry.get('url', '')}"
+    elif pt == "collection":
+        content = _digest(entry.get("file_text", "") if im == "file" else "",
+                          entry.get("description", ""))
+        if im == "file":
+            return f"collection:file:{entry.get('file_name', '')}:{content}"
+        return f"collection:{entry.get('urls', '')}:{content}"
+    return f"brand:{entry.get('description', '')}"
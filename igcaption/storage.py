@@ -0,0 +1,274 @@
+"""
+クライアントプロフィールの保存先
+- LocalClientStore: clients/ ディレクトリの JSON ファイル
+- GitHubClientStore: GitHub リポジトリ上の JSON ファイル（Streamlit Cloud での永続化用）
+
+GitHub 版の一覧取得は Git Trees API でディレクトリをまとめて取得し、
+ブランチ先頭のコミット SHA が変わらない限り再取得しない
+（ファイル内容は blob SHA をキーに保持し、変更のあったファイルだけ取り直す）
+保存・削除はキャッシュ済みの SHA をそのまま使い、競合（409/422）時だけ取り直す
+"""
+
+import base64
+import copy
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+GITHUB_API = "https://api.github.com"
+GITHUB_TIMEOUT = 10
+BLOB_FETCH_WORKERS = 8
+
+
+def _decode_profile(content_b64):
+    raw = base64.b64decode(content_b64).decode("utf-8")
+    return json.loads(raw)
+
+
+class LocalClientStore:
+    """ローカルディレクトリにプロフィールを保存する"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+
+    def list_clients(self):
+        """{client_id: 表示名} と error を返す"""
+        clients = {}
+        for f in self.directory.glob("*.json"):
+            with open(f, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+                clients[f.stem] = data.get("name", f.stem)
+        return clients, None
+
+    def load(self, client_id):
+        path = self.directory / f"{client_id}.json"
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as fp:
+                return json.load(fp), None
+        return None, None
+
+    def save(self, client_id, profile):
+        path = self.directory / f"{client_id}.json"
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(profile, fp, ensure_ascii=False, indent=2)
+        return None
+
+    def delete(self, client_id):
+        path = self.directory / f"{client_id}.json"
+        if path.exists():
+            path.unlink()
+        return None
+
+
+class GitHubClientStore:
+    """GitHub リポジトリ上にプロフィールを保存する（一覧はコミット SHA 単位でキャッシュ）"""
+
+    def __init__(self, token, repo, branch, directory="clients"):
+        self.repo = repo
+        self.branch = branch
+        self.directory = directory.strip("/")
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+        })
+        self._lock = threading.Lock()
+        self._head_etag = None
+        self._head_sha = None
+        self._listed_sha = None
+        self._files = {}        # client_id -> blob sha
+        self._blobs = {}        # blob sha -> profile dict
+
+    # ── GitHub API ──
+    def _url(self, path):
+        return f"{GITHUB_API}/repos/{self.repo}/{path}"
+
+    def _filepath(self, client_id):
+        return f"{self.directory}/{client_id}.json"
+
+    def _head_commit(self):
+        """ブランチ先頭のコミット SHA を返す（ETag 付きの条件付きリクエスト）"""
+        headers = {"If-None-Match": self._head_etag} if self._head_etag else {}
+        resp = self._session.get(self._url(f"git/ref/heads/{self.branch}"),
+                                 headers=headers, timeout=GITHUB_TIMEOUT)
+        if resp.status_code == 304 and self._head_sha:
+            return self._head_sha, None
+        if resp.status_code == 404:
+            return None, None
+        if resp.status_code != 200:
+            return None, f"GitHub API error {resp.status_code}"
+        self._head_etag = resp.headers.get("ETag")
+        self._head_sha = resp.json()["object"]["sha"]
+        return self._head_sha, None
+
+    def _list_tree(self, commit_sha):
+        """コミット内の clients/*.json を {client_id: blob sha} で返す"""
+        resp = self._session.get(self._url(f"git/trees/{commit_sha}"),
+                                 params={"recursive": "1"}, timeout=GITHUB_TIMEOUT)
+        if resp.status_code != 200:
+            return None, f"GitHub API error {resp.status_code}"
+        prefix = self.directory + "/"
+        files = {}
+        for item in resp.json().get("tree", []):
+            path = item.get("path", "")
+            if item.get("type") != "blob" or not path.startswith(prefix):
+                continue
+            name = path[len(prefix):]
+            if "/" in name or not name.endswith(".json"):
+                continue
+            files[name[:-len(".json")]] = item["sha"]
+        return files, None
+
+    def _get_blob(self, sha):
+        resp = self._session.get(self._url(f"git/blobs/{sha}"), timeout=GITHUB_TIMEOUT)
+        if resp.status_code != 200:
+            return None
+        try:
+            return _decode_profile(resp.json()["content"])
+        except Exception:
+            return None
+
+    def _get_file(self, filepath):
+        """Contents API でファイルを取得。(content_dict, error) を返す"""
+        resp = self._session.get(self._url(f"contents/{filepath}"),
+                                 params={"ref": self.branch}, timeout=GITHUB_TIMEOUT)
+        if resp.status_code == 200:
+            return resp.json(), None
+        elif resp.status_code == 404:
+            return None, None
+        else:
+            return None, f"GitHub API error {resp.status_code}"
+
+    def _put_file(self, filepath, content_bytes, message, sha=None):
+        body = {
+            "message": message,
+            "content": base64.b64encode(content_bytes).decode("ascii"),
+            "branch": self.branch,
+        }
+        if sha:
+            body["sha"] = sha
+        return self._session.put(self._url(f"contents/{filepath}"), json=body,
+                                 timeout=GITHUB_TIMEOUT)
+
+    def _delete_file(self, filepath, sha, message):
+        body = {"message": message, "sha": sha, "branch": self.branch}
+        return self._session.delete(self._url(f"contents/{filepath}"), json=body,
+                                    timeout=GITHUB_TIMEOUT)
+
+    def _remote_sha(self, filepath):
+        """SHA 不一致（409/422）時に現在の blob SHA を取り直す"""
+        existing, _ = self._get_file(filepath)
+        return existing["sha"] if existing else None
+
+    def _record_commit(self, resp):
+        """書き込みで進んだコミットを一覧キャッシュに反映し、ツリーの再取得を省く"""
+        commit_sha = (resp.json().get("commit") or {}).get("sha")
+        if commit_sha and self._listed_sha == self._head_sha:
+            self._head_sha = commit_sha
+            self._listed_sha = commit_sha
+
+    # ── ストア操作 ──
+    def list_clients(self):
+        """{client_id: 表示名} と error を返す"""
+        with self._lock:
+            head, err = self._head_commit()
+            if err:
+                return {}, err
+            if head is None:
+                return {}, None
+            if head != self._listed_sha:
+                files, err = self._list_tree(head)
+                if err:
+                    return {}, err
+                missing = [sha for sha in set(files.values()) if sha not in self._blobs]
+                if missing:
+                    workers = min(BLOB_FETCH_WORKERS, len(missing))
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        for sha, profile in zip(missing, pool.map(self._get_blob, missing)):
+                            if profile is not None:
+                                self._blobs[sha] = profile
+                self._files = files
+                self._listed_sha = head
+                # 使われなくなった blob を破棄
+                live = set(files.values())
+                self._blobs = {sha: p for sha, p in self._blobs.items() if sha in live}
+
+            clients = {}
+            for cid, sha in self._files.items():
+                profile = self._blobs.get(sha)
+                clients[cid] = profile.get("name", cid) if isinstance(profile, dict) else cid
+            return clients, None
+
+    def load(self, client_id):
+        """キャッシュ済みならネットワークに出ずに返す（一覧の更新でキャッシュは無効化される）"""
+        with self._lock:
+            profile = self._blobs.get(self._files.get(client_id))
+            if profile is not None:
+                return copy.deepcopy(profile), None
+        file_data, err = self._get_file(self._filepath(client_id))
+        if err:
+            return None, err
+        if file_data and "content" in file_data:
+            try:
+                profile = _decode_profile(file_data["content"])
+            except Exception:
+                return None, None
+            with self._lock:
+                self._files[client_id] = file_data["sha"]
+                self._blobs[file_data["sha"]] = profile
+            return copy.deepcopy(profile), None
+        return None, None
+
+    def save(self, client_id, profile):
+        filepath = self._filepath(client_id)
+        content = json.dumps(profile, ensure_ascii=False, indent=2).encode("utf-8")
+        message = f"Save client: {client_id}"
+        with self._lock:
+            sha = self._files.get(client_id)
+            resp = self._put_file(filepath, content, message, sha)
+            if resp.status_code in (409, 422):
+                # キャッシュの SHA が古い（他で更新された）場合のみ取り直す
+                resp = self._put_file(filepath, content, message, self._remote_sha(filepath))
+            if resp.status_code not in (200, 201):
+                return "クライアント保存に失敗しました。GitHub Token の権限を確認してください。"
+            new_sha = resp.json()["content"]["sha"]
+            self._files[client_id] = new_sha
+            self._blobs[new_sha] = copy.deepcopy(profile)
+            self._record_commit(resp)
+        return None
+
+    def delete(self, client_id):
+        filepath = self._filepath(client_id)
+        message = f"Delete client: {client_id}"
+        with self._lock:
+            sha = self._files.get(client_id) or self._remote_sha(filepath)
+            if not sha:
+                return None
+            resp = self._delete_file(filepath, sha, message)
+            if resp.status_code in (409, 422):
+                sha = self._remote_sha(filepath)
+                if not sha:
+                    return None
+                resp = self._delete_file(filepath, sha, message)
+            if resp.status_code != 200:
+                return f"GitHub API error {resp.status_code}"
+            self._files.pop(client_id, None)
+            self._record_commit(resp)
+        return None
+
+
+_github_stores = {}
+_github_stores_lock = threading.Lock()
+
+
+def get_github_store(token, repo, branch, directory="clients"):
+    """設定ごとに GitHubClientStore を1つだけ作り、Streamlit の再実行をまたいで再利用する"""
+    key = (token, repo, branch, directory)
+    with _github_stores_lock:
+        if key not in _github_stores:
+            _github_stores[key] = GitHubClientStore(token, repo, branch, directory)
+        return _github_stores[key]
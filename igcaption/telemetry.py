@@ -0,0 +1,189 @@
+"""
+一括生成の計測（ページ取得・資料抽出・キャプション生成・xlsx 書き出し）
+計測したい処理を span() で囲むと、実行中の RunTelemetry に所要時間やバイト数、トークン数、
+リトライ回数、キャッシュの利用状況が記録される（collect() の外では何もしない）
+実行ごとの集計と明細は JSONL に追記し、実行どうしを比較できるようにする
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from igcaption.page_cache import DEFAULT_CACHE_DIR
+
+# 集計する数値項目（イベントにあれば段階ごとに合計する）
+SUM_FIELDS = ("bytes", "posts", "prompt_tokens", "response_tokens", "cached_tokens",
+              "retries", "retry_wait", "limiter_wait")
+
+# 段階の表示名
+STAGE_LABELS = {
+    "fetch": "ページ取得",
+    "extract": "資料抽出",
+    "generate": "キャプション生成",
+    "xlsx": "xlsx 書き出し",
+}
+
+_current = contextvars.ContextVar("igcaption_telemetry", default=None)
+
+
+class RunTelemetry:
+    """1回の実行の計測イベントを集める（ワーカースレッドから並行して記録できる）"""
+
+    def __init__(self, run_id=None, meta=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.meta = dict(meta or {})
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.events = []
+
+    def record(self, stage, **fields):
+        event = {"stage": stage, **fields}
+        event.setdefault("start", round(time.perf_counter() - self._started, 4))
+        with self._lock:
+            self.events.append(event)
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def summary(self):
+        """段階ごとの件数・所要時間（合計・p50・p95・最大・区間）・合計値・キャッシュ利用数"""
+        with self._lock:
+            events = list(self.events)
+        stages = {stage: [] for stage in STAGE_LABELS}
+        for event in events:
+            stages.setdefault(event["stage"], []).append(event)
+        result = {}
+        for stage, items in stages.items():
+            if not items:
+                continue
+            seconds = sorted(e.get("seconds", 0) for e in items)
+            row = {
+                "count": len(items),
+                "seconds": round(sum(seconds), 3),
+                "p50": round(statistics.median(seconds), 3),
+                "p95": round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))], 3),
+                "max": round(seconds[-1], 3),
+                # 最初の開始から最後の終了まで（並列に動いた区間の実時間）
+                "wall": round(max(e["start"] + e.get("seconds", 0) for e in items)
+                              - min(e["start"] for e in items), 3),
+                "errors": sum(1 for e in items if e.get("error")),
+            }
+            for field in SUM_FIELDS:
+                values = [e[field] for e in items if isinstance(e.get(field), (int, float))]
+                if values:
+                    row[field] = round(sum(values), 3)
+            caches = {}
+            for e in items:
+                if e.get("cache"):
+                    caches[e["cache"]] = caches.get(e["cache"], 0) + 1
+            if caches:
+                row["cache"] = caches
+            result[stage] = row
+        return result
+
+    def to_dict(self, events=False):
+        """実行の集計（events=True なら各イベントも含める）"""
+        data = {
+            "type": "run",
+            "run_id": self.run_id,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+            "wall_seconds": round(self.elapsed(), 3),
+            "meta": self.meta,
+            "stages": self.summary(),
+        }
+        if events:
+            with self._lock:
+                data["events"] = [dict(e) for e in self.events]
+        return data
+
+    def iter_jsonl(self):
+        """実行の集計を1行目、各イベントを2行目以降とする JSON Lines"""
+        yield json.dumps(self.to_dict(), ensure_ascii=False) + "\n"
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            yield json.dumps({"type": "event", "run_id": self.run_id, **event},
+                             ensure_ascii=False, default=str) + "\n"
+
+    def write_jsonl(self, path=None):
+        """JSONL ファイルに追記する（既定は telemetry_path()）。書き込み先のパスを返す"""
+        path = Path(path or telemetry_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as fp:
+            fp.writelines(self.iter_jsonl())
+        return path
+
+
+def summary_lines(data):
+    """to_dict() の結果を段階ごとの1行テキストにする（コマンドラインのログ用）"""
+    lines = []
+    for stage, row in data["stages"].items():
+        text = (f"{STAGE_LABELS.get(stage, stage)}: {row['count']}件 {row['wall']:.2f}秒"
+                f"（p50 {row['p50']:.2f}秒 / p95 {row['p95']:.2f}秒）")
+        if row.get("prompt_tokens"):
+            text += f" 入力 {int(row['prompt_tokens'])} / 出力 {int(row.get('response_tokens', 0))} トークン"
+        if row.get("bytes"):
+            text += f" {row['bytes'] / 1024:.0f}KB"
+        if row.get("retries"):
+            text += f" リトライ {int(row['retries'])}回（待ち {row.get('retry_wait', 0):.1f}秒）"
+        if row.get("cache"):
+            text += " キャッシュ " + ", ".join(f"{k} {v}" for k, v in sorted(row["cache"].items()))
+        if row["errors"]:
+            text += f" エラー {row['errors']}件"
+        lines.append(text)
+    lines.append(f"合計: {data['wall_seconds']:.1f}秒")
+    return lines
+
+
+def telemetry_path():
+    """計測結果の追記先（環境変数 TELEMETRY_PATH、既定は .cache/telemetry.jsonl）"""
+    return Path(os.environ.get("TELEMETRY_PATH") or DEFAULT_CACHE_DIR / "telemetry.jsonl")
+
+
+@contextlib.contextmanager
+def collect(telemetry):
+    """with ブロック内（そこから bind() したスレッドを含む）の計測を telemetry に集める"""
+    token = _current.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current.reset(token)
+
+
+def bind(fn):
+    """
+    現在の計測先を引き継いで fn を呼ぶ関数を返す（スレッドプールに渡す前に使う）
+    返した関数は1回だけ呼ぶこと（同じコンテキストを複数スレッドで同時に使えないため）
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+@contextlib.contextmanager
+def span(stage, **fields):
+    """
+    with ブロックの所要時間を stage として記録する
+    ブロック内では yield された dict に値（bytes, cache など）を書き足せる
+    """
+    telemetry = _current.get()
+    if telemetry is None:
+        yield fields
+        return
+    fields["start"] = round(telemetry.elapsed(), 4)
+    started = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields.setdefault("error", str(e))
+        raise
+    finally:
+        fields["seconds"] = round(time.perf_counter() - started, 4)
+        telemetry.record(stage, **fields)
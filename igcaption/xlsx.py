@@ -0,0 +1,149 @@
+"""
+xlsx生成（スプレッドシート転記用フォーマット）
+書き込み専用モードで行を順に書き出し、セルの書式は名前付きスタイルを共有する。
+同じ内容（結果・配信日・クライアント名）のファイルは再生成せずに使い回す
+"""
+
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.utils import get_column_letter
+
+from igcaption.schedule import WEEKDAY_NAMES
+from igcaption.telemetry import span
+
+# 生成済みファイルを保持する件数（Streamlit の再実行ごとの再生成を避ける）
+XLSX_CACHE_ENTRIES = 8
+
+EXPORT_FIELDS = ("url", "product_name", "caption", "seasonal_event", "post_type_label")
+
+_xlsx_cache = OrderedDict()
+_xlsx_cache_lock = threading.Lock()
+
+
+def _named_styles():
+    """ブック内で共有する名前付きスタイル"""
+    body_font = Font(name="Yu Gothic", size=10)
+    thin_border = Border(
+        left=Side(style="thin"), right=Side(style="thin"),
+        top=Side(style="thin"), bottom=Side(style="thin"),
+    )
+    center_align = Alignment(horizontal="center", vertical="center")
+    wrap_align = Alignment(vertical="top", wrap_text=True)
+
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+    return [
+        NamedStyle("ig_header", font=Font(name="Yu Gothic", bold=True, size=10, color="FFFFFF"),
+                   fill=fill("4472C4"), alignment=center_align, border=thin_border),
+        NamedStyle("ig_body", font=body_font, border=thin_border),
+        NamedStyle("ig_center", font=body_font, alignment=center_align, border=thin_border),
+        NamedStyle("ig_date", font=body_font, alignment=center_align, border=thin_border,
+                   fill=fill("D6E4F0")),
+        NamedStyle("ig_url", font=body_font, border=thin_border, fill=fill("E2EFDA")),
+        NamedStyle("ig_caption", font=body_font, alignment=wrap_align, border=thin_border,
+                   fill=fill("FFF2CC")),
+        NamedStyle("ig_wrap", font=body_font, alignment=wrap_align, border=thin_border),
+    ]
+
+
+def format_post_date(schedule_dates, i):
+    """i 番目の配信日を「11月2日月曜日」の形式にする（日付がなければ空文字）"""
+    if i >= len(schedule_dates):
+        return ""
+    d = schedule_dates[i]
+    return f"{d.month}月{d.day}日{WEEKDAY_NAMES[d.weekday()]}曜日"
+
+
+def _export_key(results, schedule_dates, client_label):
+    payload = json.dumps([
+        [[item.get(k, "") for k in EXPORT_FIELDS] for item in results],
+        [d.isoformat() for d in schedule_dates],
+        client_label,
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _build_xlsx(results, schedule_dates):
+    wb = Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+
+    def row(ws, values):
+        cells = []
+        for value, style in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = style
+            cells.append(cell)
+        ws.append(cells)
+
+    # === シート1: 配信原稿（横並び・スプレッドシート互換）===
+    ws = wb.create_sheet("配信原稿")
+    ws.column_dimensions["A"] = ColumnDimension(ws, index="A", width=20)
+    if results:
+        ws.column_dimensions["B"] = ColumnDimension(
+            ws, index="B", min=2, max=len(results) + 1, width=35)
+    ws.row_dimensions[6].height = 300
+
+    fields = [
+        ("投稿番号", "ig_center", lambda i, item: i + 1),
+        ("投稿日", "ig_date", lambda i, item: format_post_date(schedule_dates, i)),
+        ("投稿タイプ", "ig_center", lambda i, item: item.get("post_type_label", "")),
+        ("商品名", "ig_center", lambda i, item: item.get("product_name", "")),
+        ("商品URL（ストーリー用）", "ig_url", lambda i, item: item.get("url", "")),
+        ("Instagram配信原稿", "ig_caption", lambda i, item: item.get("caption", "")),
+        ("季節イベント", "ig_center", lambda i, item: item.get("seasonal_event", "")),
+    ]
+    for label, style, value in fields:
+        row(ws, [(label, "ig_header")]
+            + [(value(i, item), style) for i, item in enumerate(results)])
+
+    # === シート2: 一覧表 ===
+    ws2 = wb.create_sheet("一覧表")
+    for n, width in enumerate([6, 18, 14, 25, 40, 20, 80], 1):
+        letter = get_column_letter(n)
+        ws2.column_dimensions[letter] = ColumnDimension(ws2, index=letter, width=width)
+
+    list_headers = ["No.", "投稿日", "タイプ", "商品名", "商品URL", "季節イベント", "キャプション"]
+    row(ws2, [(h, "ig_header") for h in list_headers])
+    for i, item in enumerate(results):
+        row(ws2, [
+            (i + 1, "ig_body"),
+            (format_post_date(schedule_dates, i), "ig_body"),
+            (item.get("post_type_label", ""), "ig_body"),
+            (item.get("product_name", ""), "ig_body"),
+            (item.get("url", ""), "ig_body"),
+            (item.get("seasonal_event", ""), "ig_body"),
+            (item.get("caption", ""), "ig_wrap"),
+        ])
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def create_xlsx_schedule(results, schedule_dates, client_label):
+    """配信原稿・一覧表の2シートの xlsx を BytesIO で返す（同じ内容なら前回の生成結果を返す）"""
+    with span("xlsx", posts=len(results), cache="hit") as stats:
+        key = _export_key(results, schedule_dates, client_label)
+        with _xlsx_cache_lock:
+            data = _xlsx_cache.get(key)
+            if data is not None:
+                _xlsx_cache.move_to_end(key)
+        if data is None:
+            stats["cache"] = "miss"
+            data = _build_xlsx(results, schedule_dates)
+            with _xlsx_cache_lock:
+                _xlsx_cache[key] = data
+                while len(_xlsx_cache) > XLSX_CACHE_ENTRIES:
+                    _xlsx_cache.popitem(last=False)
+        stats["bytes"] = len(data)
+    return io.BytesIO(data)
@@ -0,0 +1,15 @@
+"""キャプションキャッシュの保存と容量超過時の削除"""
+
+from igcaption.caption_cache import CaptionCache
+
+
+def test_caption_cache_round_trip_and_eviction(tmp_path):
+    cache = CaptionCache(tmp_path / "captions.sqlite3", max_bytes=30)
+    cache.put("k1", ["一つ目"])
+    cache.put("k2", ["二つ目"])
+    assert cache.get("k1") == ["一つ目"]
+    cache.put("k3", ["三つ目"])
+    assert cache.get("k2") is None
+    assert cache.get("k1") == ["一つ目"]
+    assert cache.get("k3") == ["三つ目"]
+    assert cache.stats() == {"hits": 3, "misses": 1}
@@ -0,0 +1,109 @@
+"""コンテキストキャッシュ付きモデルの共有（API は呼ばずにキャッシュの作成・削除を差し替える）"""
+
+import logging
+import threading
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from igcaption import gemini  # noqa: E402
+
+LONG_CONTEXT = "トンマナ" * gemini.CONTEXT_CACHE_MIN_CHARS
+
+
+class FakeCacheClient:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_cached_content(self, name):
+        self.deleted.append(name)
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    for name in ("_clients", "_cache_clients", "_context_models",
+                 "_cache_entries", "_context_caches", "_key_locks"):
+        monkeypatch.setattr(gemini, name, {})
+    monkeypatch.setattr(gemini, "_client_for", lambda api_key: object())
+    cache_client = FakeCacheClient()
+    monkeypatch.setattr(gemini, "_cache_client_for", lambda api_key: cache_client)
+    return cache_client
+
+
+def test_cached_model_is_shared(monkeypatch):
+    created = []
+    monkeypatch.setattr(gemini, "_create_context_cache",
+                        lambda *args: created.append(args) or "cachedContents/a")
+    first = gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    second = gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    assert first is second
+    assert first.cached_content == "cachedContents/a"
+    assert len(created) == 1
+
+
+def test_generation_configs_share_one_cache(monkeypatch):
+    created = []
+    monkeypatch.setattr(gemini, "_create_context_cache",
+                        lambda *args: created.append(args) or "cachedContents/a")
+    single = gemini.get_context_model("key", generation_config={"temperature": 0.8},
+                                      system_instruction=LONG_CONTEXT)
+    batch = gemini.get_context_model(
+        "key", generation_config={"temperature": 0.8, "response_mime_type": "application/json"},
+        system_instruction=LONG_CONTEXT)
+    assert single is not batch
+    assert single.cached_content == batch.cached_content == "cachedContents/a"
+    assert len(created) == 1
+
+
+def test_expired_cache_is_recreated(monkeypatch):
+    names = iter(["cachedContents/a", "cachedContents/b"])
+    monkeypatch.setattr(gemini, "_create_context_cache", lambda *args: next(names))
+    first = gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    for entry in gemini._cache_entries.values():
+        entry["expires"] = 0
+    second = gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    assert (first.cached_content, second.cached_content) == ("cachedContents/a", "cachedContents/b")
+    assert gemini._context_caches == {"cachedContents/b": "key"}
+
+
+def test_cache_creation_does_not_block_other_clients(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_create(api_key, model_name, system_instruction):
+        started.set()
+        release.wait(5)
+        return "cachedContents/slow"
+
+    monkeypatch.setattr(gemini, "_create_context_cache", slow_create)
+    worker = threading.Thread(
+        target=gemini.get_context_model, args=("key",), kwargs={"system_instruction": LONG_CONTEXT})
+    worker.start()
+    assert started.wait(5)
+    try:
+        # 作成中でも、別のシステム指示のモデルはすぐに取得できる
+        model = gemini.get_context_model("key", system_instruction="短い指示")
+        assert model.cached_content is None
+    finally:
+        release.set()
+        worker.join(5)
+
+
+def test_failed_cache_is_logged_and_falls_back(monkeypatch, caplog):
+    def fail(*args):
+        raise RuntimeError("too few tokens")
+
+    monkeypatch.setattr(gemini, "_create_context_cache", fail)
+    with caplog.at_level(logging.WARNING, logger="igcaption.gemini"):
+        model = gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    assert model.cached_content is None
+    assert "too few tokens" in caplog.text
+
+
+def test_created_caches_are_deleted(monkeypatch, registry):
+    monkeypatch.setattr(gemini, "_create_context_cache", lambda *args: "cachedContents/a")
+    gemini.get_context_model("key", system_instruction=LONG_CONTEXT)
+    gemini.delete_context_caches()
+    assert registry.deleted == ["cachedContents/a"]
+    gemini.delete_context_caches()
+    assert registry.deleted == ["cachedContents/a"]
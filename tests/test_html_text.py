@@ -0,0 +1,49 @@
+"""本文抽出（閉じタグの省略・XML 宣言・空の文書）"""
+
+import pytest
+
+from igcaption.html_text import DESCRIPTION_MIN_CHARS, EXTRACTORS, _available, extract_main_text
+
+LONG = "やわらかなリネンを使ったシャツです。" * 10
+assert len(LONG) >= DESCRIPTION_MIN_CHARS
+
+BACKENDS = [name for name in ("stream", "lxml", "selectolax") if _available(name)]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_unclosed_paragraph_description(backend):
+    html = (f"<html><body><h1>リネンシャツ</h1>"
+            f"<p itemprop=\"description\">{LONG}<p>送料について"
+            f"<div>関連商品</div></body></html>")
+    assert extract_main_text(html, backend) == f"リネンシャツ\n{LONG}"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_unclosed_list_items_and_cells(backend):
+    html = ("<html><body><main><ul class=\"product-detail\"><li>素材: リネン<li>サイズ: M</ul>"
+            "<table><tr><td>色<td>生成り<tr><td>産地<td>日本</table>"
+            "<select><option>S<option>M</select></main>"
+            "<footer>会社概要</footer><p>main の外</p></body></html>")
+    assert extract_main_text(html, backend).split("\n") == [
+        "素材: リネン", "サイズ: M", "色", "生成り", "産地", "日本", "S", "M"]
+
+
+def test_stream_closes_description_at_parent_end():
+    html = (f"<html><body><div><li class=\"item_desc\">{LONG}</div>"
+            f"<p>ページ末尾</p></body></html>")
+    assert extract_main_text(html, "stream") == LONG
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_xml_declaration(backend):
+    html = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            "<html><body><main><p>本文</p></main></body></html>")
+    assert extract_main_text(html, backend) == "本文"
+
+
+@pytest.mark.parametrize("backend", list(EXTRACTORS))
+@pytest.mark.parametrize("html", ["", "  \n\t", '<?xml version="1.0" encoding="UTF-8"?>'])
+def test_empty_document(backend, html):
+    if not _available(backend):
+        pytest.skip(f"{backend} is not installed")
+    assert extract_main_text(html, backend) == ""
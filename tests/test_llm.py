@@ -0,0 +1,116 @@
+"""プロバイダーの記録・再生（ネットワークを使わず offline プロバイダーを記録する）"""
+
+import asyncio
+import json
+
+import pytest
+
+from igcaption.llm import (CassetteMiss, CassetteProvider, GenerationRequest, OfflineProvider,
+                           create_provider)
+
+CONFIG = {"temperature": 0.8}
+
+
+def _request(prompt="商品名: リネンシャツ\n投稿文を書いてください", **config):
+    return GenerationRequest(prompt, "gemini-2.5-flash", dict(CONFIG, **config),
+                             system_instruction="ブランドのトンマナ", api_key="")
+
+
+def test_offline_is_deterministic():
+    provider = OfflineProvider()
+    usage = {}
+    text = provider.complete(_request(), usage)
+    assert text.startswith("【リネンシャツ✨️】")
+    assert text == provider.complete(_request())
+    assert usage["prompt_tokens"] > 0 and usage["response_tokens"] > 0
+
+
+def test_offline_batch_returns_one_caption_per_slot():
+    request = _request("- slot 1: A\n- slot 2: B", response_mime_type="application/json")
+    captions = json.loads(OfflineProvider().complete(request))
+    assert [c["slot"] for c in captions] == [1, 2]
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder = CassetteProvider(path, mode="record", inner=OfflineProvider())
+    usage = {"elapsed": 1.5}
+    recorded = recorder.complete(_request(), usage)
+    streamed = "".join(recorder.stream(_request("商品名: ハンドクリーム")))
+    assert recorder.requires_api_key and recorder.rate_limited
+
+    replayer = CassetteProvider(path, mode="replay")
+    assert len(replayer) == 2
+    assert not replayer.requires_api_key and not replayer.rate_limited
+    replayed_usage = {}
+    assert replayer.complete(_request(), replayed_usage) == recorded
+    assert replayed_usage == {k: usage[k] for k in ("prompt_tokens", "response_tokens")}
+    chunks = []
+    assert replayer.generate(_request("商品名: ハンドクリーム"), on_chunk=chunks.append) == streamed
+    assert chunks[-1] == streamed
+
+    entries = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert "elapsed" not in entries[0]["usage"]
+
+
+def test_replay_miss(tmp_path):
+    replayer = CassetteProvider(tmp_path / "missing.jsonl", mode="replay")
+    with pytest.raises(CassetteMiss):
+        replayer.complete(_request())
+    # キーはシステム指示や生成パラメータの違いも区別する
+    path = tmp_path / "cassette.jsonl"
+    CassetteProvider(path, mode="record", inner=OfflineProvider()).complete(_request())
+    with pytest.raises(CassetteMiss):
+        CassetteProvider(path, mode="replay").complete(_request(temperature=0.2))
+
+
+async def _collect(stream):
+    return [piece async for piece in stream]
+
+
+class BrokenStream(OfflineProvider):
+    """最初の断片を返したあとで失敗するプロバイダー"""
+
+    def stream(self, request, usage=None):
+        yield "【途中まで"
+        raise RuntimeError("接続が切れました")
+
+
+def test_async_matches_sync(tmp_path):
+    provider = OfflineProvider()
+    usage = {}
+    assert asyncio.run(provider.agenerate(_request(), usage)) == provider.complete(_request())
+    assert usage["response_tokens"] > 0
+    chunks = asyncio.run(_collect(provider.astream(_request())))
+    assert len(chunks) > 1 and "".join(chunks) == provider.complete(_request())
+
+    path = tmp_path / "cassette.jsonl"
+    recorded = CassetteProvider(path, mode="record", inner=OfflineProvider()).complete(_request())
+    replayer = CassetteProvider(path, mode="replay")
+    assert asyncio.run(replayer.agenerate(_request())) == recorded
+    assert "".join(asyncio.run(_collect(replayer.astream(_request())))) == recorded
+
+
+def test_async_errors_propagate(tmp_path):
+    replayer = CassetteProvider(tmp_path / "missing.jsonl", mode="replay")
+    with pytest.raises(CassetteMiss):
+        asyncio.run(replayer.agenerate(_request()))
+    with pytest.raises(CassetteMiss):
+        asyncio.run(_collect(replayer.astream(_request())))
+
+    # ストリームの途中で起きた例外も、受け取った断片のあとで呼び出し側に届く
+    received = []
+
+    async def consume():
+        async for piece in BrokenStream().astream(_request()):
+            received.append(piece)
+
+    with pytest.raises(RuntimeError, match="接続が切れました"):
+        asyncio.run(consume())
+    assert received == ["【途中まで"]
+
+
+def test_create_provider():
+    assert create_provider("offline").name == "offline"
+    with pytest.raises(ValueError):
+        create_provider("unknown")
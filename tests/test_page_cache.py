@@ -0,0 +1,92 @@
+"""ページキャッシュの再検証と容量超過時の削除"""
+
+from igcaption.fetch import fetch_product_page
+from igcaption.page_cache import PageCache
+
+URL = "https://shop.example.com/items/1"
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+        self.apparent_encoding = "utf-8"
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """応答を順に返し、受け取ったリクエストヘッダーを記録する"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        return self.responses.pop(0)
+
+
+PAGE = ("<html><head><title>t</title></head><body><main>"
+        "<h1>リネンシャツ</h1><p>やわらかなリネンのシャツです。</p></main></body></html>")
+
+
+def test_fresh_entry_skips_network(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite3")
+    cache.put(URL, "キャッシュ済み", etag='"v1"')
+    session = FakeSession()
+    text, error = fetch_product_page(URL, session=session, cache=cache)
+    assert (text, error) == ("キャッシュ済み", None)
+    assert session.requests == []
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_entry_revalidates_with_304(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite3", ttl_seconds=0)
+    cache.put(URL, "キャッシュ済み", etag='"v1"', last_modified="Mon, 02 Nov 2026 00:00:00 GMT")
+    assert cache.get(URL)["fresh"] is False
+    session = FakeSession(FakeResponse(304))
+    text, error = fetch_product_page(URL, session=session, cache=cache)
+    assert (text, error) == ("キャッシュ済み", None)
+    _, headers = session.requests[0]
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Mon, 02 Nov 2026 00:00:00 GMT"
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_stale_entry_is_replaced_when_changed(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite3", ttl_seconds=0)
+    cache.put(URL, "古い本文", etag='"v1"')
+    session = FakeSession(FakeResponse(200, PAGE, {"ETag": '"v2"'}))
+    text, error = fetch_product_page(URL, session=session, cache=cache)
+    assert error is None
+    assert "リネンシャツ" in text
+    entry = cache.get(URL)
+    assert entry["text"] == text
+    assert entry["etag"] == '"v2"'
+    assert cache.stats()["misses"] == 1
+
+
+def test_mark_revalidated_refreshes_entry(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite3", ttl_seconds=60)
+    cache.put(URL, "本文")
+    cache._conn.execute("UPDATE pages SET fetched_at = fetched_at - 120")
+    assert cache.get(URL)["fresh"] is False
+    cache.mark_revalidated(URL)
+    assert cache.get(URL)["fresh"] is True
+
+
+def test_page_cache_evicts_least_recently_used(tmp_path):
+    cache = PageCache(tmp_path / "pages.sqlite3", max_bytes=25)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.get("a")                      # a を最近使ったことにする
+    cache.put("c", "x" * 10)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
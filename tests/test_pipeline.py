@@ -0,0 +1,51 @@
+"""投稿1件の再生成（offline プロバイダーで生成する）"""
+
+from igcaption import llm, pipeline
+
+SPEC = {
+    "profile": {"name": "テスト", "brand_name": "toutvert"},
+    "products": [
+        {"type": "single", "url": "https://shop.example.com/a", "count": 1},
+        {"type": "collection", "urls": "https://shop.example.com/b\nhttps://shop.example.com/c",
+         "description": "セット", "count": 1},
+    ],
+    "total_posts": 2,
+    "schedule_dates": ["2026-11-02", "2026-11-05"],
+    "post_events": [],
+}
+
+
+def test_regenerate_post_fetches_only_its_own_pages(monkeypatch):
+    fetched = []
+
+    def fake_fetch(urls, on_message=None):
+        fetched.append(list(urls))
+        return {url: f"商品名: {url[-1]}の商品" for url in urls}, [], {}
+
+    monkeypatch.setattr(pipeline, "fetch_page_texts", fake_fetch)
+    monkeypatch.setattr(llm, "_provider", llm.OfflineProvider())
+    caption, error = pipeline.regenerate_post(SPEC, 0, api_key="")
+    assert error is None
+    assert caption.startswith("【aの商品✨️】")
+    assert fetched == [["https://shop.example.com/a"]]
+
+
+def test_same_named_files_are_generated_separately(monkeypatch):
+    entries = [
+        {"type": "single", "input_method": "file", "file_name": "release.pdf",
+         "file_text": "商品名: 化粧水", "product_name_manual": "化粧水", "count": 2},
+        {"type": "single", "input_method": "file", "file_name": "release.pdf",
+         "file_text": "商品名: 乳液", "product_name_manual": "乳液", "count": 2},
+    ]
+    assignments = pipeline.build_assignments(entries)
+    results, groups = pipeline.plan_posts(assignments, {}, [], [], 4)
+    assert [r["product_name"] for r in results] == ["化粧水", "乳液", "化粧水", "乳液"]
+    assert [g["indexes"] for g in groups] == [[0, 2], [1, 3]]
+    assert [g["entry"]["product_name_manual"] for g in groups] == ["化粧水", "乳液"]
+
+    monkeypatch.setattr(llm, "_provider", llm.OfflineProvider())
+    for group in groups:
+        captions = pipeline.generate_captions_for_group(
+            group["entry"], {}, SPEC["profile"], "", group["slots"], use_cache=False)
+        name = group["entry"]["product_name_manual"]
+        assert all(c.startswith(f"【{name}✨️】") for c in captions)
@@ -0,0 +1,114 @@
+"""構造化データ（JSON-LD / microdata / OpenGraph）からの商品情報と商品名"""
+
+from igcaption import product_data
+from igcaption.fetch import page_text_from_html
+from igcaption.product_data import (extract_product_data, format_product_data,
+                                    product_name_from_text)
+
+JSON_LD = """<html><head>
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@graph": [
+  {"@type": "WebSite", "name": "ショップ"},
+  {"@type": "Product", "name": "リネンシャツ", "brand": {"@type": "Brand", "name": "toutvert"},
+   "description": "<p>やわらかなリネン。</p>",
+   "offers": {"@type": "Offer", "price": "12800", "priceCurrency": "JPY"},
+   "additionalProperty": [{"name": "素材", "value": "リネン100%"}]}
+]}
+</script></head><body></body></html>"""
+
+MICRODATA = """<html><body>
+<div itemscope itemtype="https://schema.org/Product">
+  <h1 itemprop="name">セメダイン スーパーX</h1>
+  <div itemprop="brand" itemscope itemtype="https://schema.org/Brand">
+    <span itemprop="name">セメダイン</span></div>
+  <div itemprop="offers" itemscope itemtype="https://schema.org/Offer">
+    <meta itemprop="price" content="980"><meta itemprop="priceCurrency" content="JPY"></div>
+  <p itemprop="description">多用途の接着剤です。</p>
+</div></body></html>"""
+
+OPEN_GRAPH = """<html><HEAD>
+<META property="og:title" content="ハンドクリーム | toutvert">
+<meta property="og:site_name" content="toutvert">
+<meta property="og:description" content="しっとりなめらか。">
+<meta property="product:price:amount" content="2200">
+</HEAD><body></body></html>"""
+
+
+def test_json_ld():
+    record = extract_product_data(JSON_LD)
+    assert record == {
+        "name": "リネンシャツ",
+        "brand": "toutvert",
+        "description": "やわらかなリネン。",
+        "price": "12,800円",
+        "materials": "リネン100%",
+    }
+
+
+def test_microdata():
+    record = extract_product_data(MICRODATA)
+    assert record["name"] == "セメダイン スーパーX"
+    assert record["brand"] == "セメダイン"
+    assert record["price"] == "980円"
+    assert record["description"] == "多用途の接着剤です。"
+
+
+def test_microdata_reads_only_the_product_element(monkeypatch):
+    fed = []
+    feed = product_data._MicrodataParser.feed
+    monkeypatch.setattr(product_data._MicrodataParser, "feed",
+                        lambda self, data: fed.append(len(data)) or feed(self, data))
+    page = ("<html><body>" + "<p>ヘッダー</p>" * 5000 + MICRODATA.split("<body>", 1)[1]
+            .replace("</body>", "<ul>" + "<li>関連商品" * 20000 + "</ul></body>"))
+    record = extract_product_data(page)
+    assert record["name"] == "セメダイン スーパーX"
+    assert record["price"] == "980円"
+    assert sum(fed) < len(page) / 10
+
+
+def test_open_graph_drops_site_name():
+    record = extract_product_data(OPEN_GRAPH)
+    assert record["name"] == "ハンドクリーム"
+    assert record["description"] == "しっとりなめらか。"
+    assert record["price"] == "2,200円"
+
+
+def test_open_graph_requires_product_type():
+    description = "ブランドの想いを伝える長い紹介文です。" * 10
+    about = ("<html><head><meta property=\"og:type\" content=\"website\">"
+             "<meta property=\"og:title\" content=\"私たちについて\">"
+             f"<meta property=\"og:description\" content=\"{description}\">"
+             "</head><body><main><p>コンセプト本文</p></main></body></html>")
+    assert extract_product_data(about) == {}
+    assert page_text_from_html(about) == "コンセプト本文"
+    product = about.replace("website", "product")
+    assert extract_product_data(product)["name"] == "私たちについて"
+    assert "コンセプト本文" not in page_text_from_html(product)
+    assert page_text_from_html(product, record_only=False).endswith("コンセプト本文")
+
+
+def test_name_from_formatted_record():
+    text = format_product_data(extract_product_data(JSON_LD))
+    assert text.startswith("商品名: リネンシャツ\n")
+    assert product_name_from_text(text) == "リネンシャツ"
+
+
+def test_name_without_name_field_uses_page_body():
+    page = ("<html><head><meta property=\"og:brand\" content=\"x\"></head><body>"
+            "<script type=\"application/ld+json\">"
+            '{"@type": "Product", "brand": "toutvert", "offers": {"price": 3300}}</script>'
+            "<main><h1>ボディミルク</h1><p>軽いつけ心地。</p></main></body></html>")
+    text = page_text_from_html(page)
+    assert text.startswith("ブランド: toutvert")
+    assert product_name_from_text(text) == "ボディミルク"
+
+
+def test_name_falls_back_to_first_line():
+    assert product_name_from_text("\n  リネンシャツ\n本文") == "リネンシャツ"
+    assert product_name_from_text("") == ""
+
+
+def test_page_text_uses_body_when_description_is_short():
+    text = page_text_from_html(JSON_LD.replace("</body>", "<main><p>本文の説明</p></main></body>"))
+    assert text.startswith("商品名: リネンシャツ")
+    assert "【ページ本文】" in text
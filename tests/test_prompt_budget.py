@@ -0,0 +1,73 @@
+"""プロンプトのトークン予算による削り込み"""
+
+from igcaption.prompt_budget import (MIN_TAIL_TOKENS, TRIM_MARK, PromptSection, assemble_prompt,
+                                     fit_to_budget, split_samples)
+
+
+def _samples(count, size=100):
+    items = [str(k) * size for k in range(count)]
+    return PromptSection("samples", "\n\n".join(items), part="context", trim="items", items=items)
+
+
+def _product(size):
+    return PromptSection("product", "あ" * size, trim="tail", header="【商品情報】\n")
+
+
+def test_split_samples():
+    assert split_samples("一つ目\n---\n二つ目") == ["一つ目", "二つ目"]
+    assert split_samples('"一つ目\n改行"\t"二つ目"') == ["一つ目\n改行", "二つ目"]
+    assert split_samples("") == []
+
+
+def test_within_budget_is_untouched():
+    sections = [_samples(3), _product(500)]
+    before = [s.text for s in sections]
+    fit_to_budget(sections, 10_000)
+    assert [s.text for s in sections] == before
+
+
+def test_samples_are_dropped_before_product_info():
+    samples, product = _samples(3), _product(1000)
+    total = fit_to_budget([samples, product], samples.tokens + product.tokens - 150)
+    assert samples.items == ["0" * 100]
+    assert product.body == "あ" * 1000
+    assert total == samples.tokens + product.tokens
+
+
+def test_product_info_is_cut_from_the_longest():
+    samples = _samples(1)
+    long_info, short_info = _product(3000), _product(800)
+    fixed = PromptSection("instructions", "い" * 200)
+    total = fit_to_budget([samples, fixed, long_info, short_info], 3000)
+    assert total <= 3000
+    assert long_info.body.endswith(TRIM_MARK)
+    assert short_info.body == "あ" * 800      # 長い方だけを削れば収まる
+    total = fit_to_budget([samples, fixed, long_info, short_info], 1500)
+    assert total <= 1500
+    assert short_info.body.endswith(TRIM_MARK)
+    assert abs(long_info.tokens - short_info.tokens) <= 1
+
+
+def test_product_info_keeps_minimum_length():
+    fixed = PromptSection("instructions", "い" * 5000)
+    info = _product(1000)
+    total = fit_to_budget([fixed, info], 1000)
+    assert total > 1000
+    assert len(info.body) == MIN_TAIL_TOKENS
+
+
+def test_assemble_prompt_splits_context_and_prompt():
+    context = [PromptSection("brand", "ブランド", part="context")]
+    prompt = [PromptSection("task", "投稿文を書いてください")]
+    assert assemble_prompt(context, prompt, budget=100) == ("ブランド", "投稿文を書いてください")
+
+
+def test_context_does_not_depend_on_the_post():
+    # 商品情報の長さが違う投稿でも、システム指示（サンプルの削り方）は同じになる
+    contexts = set()
+    for size in (100, 2000, 6000):
+        context, prompt = assemble_prompt([_samples(5, size=300)], [_product(size)], budget=2000)
+        contexts.add(context)
+        assert len(prompt) <= 2000
+    assert len(contexts) == 1
+    assert contexts.pop().count("\n\n") == 2        # 1000 トークンの枠に収まる3件まで残す
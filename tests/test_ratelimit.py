@@ -0,0 +1,103 @@
+"""トークンバケットと 429 のバックオフ"""
+
+import pytest
+
+from igcaption import ratelimit
+from igcaption.ratelimit import (RateLimiter, TokenBucket, backoff_delay, call_with_backoff,
+                                 retry_after_seconds)
+
+
+class ResourceExhausted(Exception):
+    """google.api_core の 429 と同じ名前の例外"""
+
+
+def test_token_bucket_waits_after_capacity():
+    bucket = TokenBucket(60)            # 1 単位/秒
+    assert bucket.reserve(60) == 0.0
+    wait = bucket.reserve(2)
+    assert 1.9 < wait <= 2.0
+
+
+def test_token_bucket_clamps_large_reservations():
+    bucket = TokenBucket(60, capacity=10)
+    assert bucket.reserve(100) == 0.0   # 容量を超える分は容量として扱う
+    assert bucket.reserve(1) > 0
+
+
+def test_rate_limiter_sleeps_for_the_slower_bucket(monkeypatch):
+    slept = []
+    monkeypatch.setattr(ratelimit.time, "sleep", slept.append)
+    limiter = RateLimiter(rpm=60, tpm=600)
+    limiter.acquire(600)
+    limiter.acquire(300)
+    assert len(slept) == 1
+    assert 29 < slept[0] <= 30          # TPM 側（10 単位/秒）で 300 単位待つ
+
+
+def test_retry_after_hint():
+    assert retry_after_seconds(Exception("429 Please retry in 7.5s")) == 7.5
+    assert retry_after_seconds(Exception("retry_delay { seconds: 12 }")) == 12.0
+    assert retry_after_seconds(Exception("500 internal")) is None
+    assert 7.0 <= backoff_delay(0, retry_after=7.0) <= 8.0
+
+
+def test_backoff_retries_only_on_429(monkeypatch):
+    slept = []
+    monkeypatch.setattr(ratelimit.time, "sleep", slept.append)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ResourceExhausted("429 quota exceeded, retry in 2s")
+        return "ok"
+
+    retries = []
+    stats = {}
+    result = call_with_backoff(flaky, max_retries=5, stats=stats,
+                               on_retry=lambda *args: retries.append(args[:2]))
+    assert result == "ok"
+    assert len(calls) == 3
+    assert retries == [(2, 5), (3, 5)]
+    assert stats["retries"] == 2
+    assert len(slept) == 2 and all(2.0 <= s <= 3.0 for s in slept)
+    assert stats["retry_wait"] == pytest.approx(sum(slept), abs=0.01)
+
+
+def test_backoff_penalizes_shared_limiter(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda s: None)
+    limiter = RateLimiter(rpm=600, tpm=1_000_000)
+    penalties = []
+    monkeypatch.setattr(limiter, "penalize", penalties.append)
+    attempts = iter([ResourceExhausted("429"), None])
+
+    def fn():
+        exc = next(attempts)
+        if exc:
+            raise exc
+        return "ok"
+
+    assert call_with_backoff(fn, limiter=limiter, tokens=10) == "ok"
+    assert len(penalties) == 1
+
+
+def test_backoff_raises_other_errors_and_gives_up(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda s: None)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_with_backoff(broken, max_retries=5)
+    assert len(calls) == 1
+
+    def exhausted():
+        calls.append(1)
+        raise ResourceExhausted("429")
+
+    calls.clear()
+    with pytest.raises(ResourceExhausted):
+        call_with_backoff(exhausted, max_retries=3)
+    assert len(calls) == 3